@@ -1,4 +0,0 @@
-from main import app
-
-# Vercel needs a handler
-# app is already the handler
@@ -3,17 +3,274 @@
 # ════════════════════════════════════
 
 from datetime import datetime
+from sqlalchemy import exc
 from sqlalchemy.orm import Session
+from database import engine
 from models import AuditLog
 import uuid
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
 from typing import Optional, Any
 
+logger = logging.getLogger("hercare.audit")
+
+# ────── Background audit pipeline ──────
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+# What to do when the queue is full: "block" (wait up to AUDIT_BLOCK_TIMEOUT,
+# then drop), "drop" (drop immediately) or "spill" (append to a file under
+# AUDIT_SPILL_DIR, replayed by whichever worker is idle). Dropped events are
+# counted. Rows the database rejects on their own are moved to
+# quarantine.jsonl in the same directory instead of being retried.
+AUDIT_OVERFLOW_POLICY = os.getenv("AUDIT_OVERFLOW_POLICY", "spill")
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "0.05"))
+AUDIT_SPILL_DIR = os.getenv("AUDIT_SPILL_DIR", "audit-spill")
+
+class AuditWriter:
+    """
+    Bounded in-memory queue of audit rows flushed by one background thread.
+
+    Rows are written with a single multi-row INSERT per batch, on the
+    writer's own connection, whenever AUDIT_BATCH_SIZE rows are waiting or
+    AUDIT_FLUSH_INTERVAL has passed. Callers never touch the database.
+
+    A batch the database rejects is split in half and retried, so one bad
+    row costs a few extra inserts and ends up quarantined alone. Batches
+    that fail because the database is unreachable are spilled whole.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._spill_dir = AUDIT_SPILL_DIR
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.quarantined = 0
+        self.failed_batches = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, row: dict, wait: bool = True) -> bool:
+        """
+        Queue one audit_logs row; never raises and never waits on the database.
+
+        wait=False skips the "block" policy's short wait, for callers on the
+        event loop.
+        """
+        self._ensure_started()
+        try:
+            if wait and AUDIT_OVERFLOW_POLICY == "block":
+                self._queue.put(row, timeout=AUDIT_BLOCK_TIMEOUT)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            if AUDIT_OVERFLOW_POLICY == "spill":
+                return self._spill([row])
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _append(self, name: str, rows: list):
+        """
+        Append rows to a shared file in the spill directory. The lock keeps
+        lines from different workers whole; if a replay renamed the file
+        between open and lock, write to the fresh one instead.
+        """
+        path = os.path.join(self._spill_dir, name)
+        os.makedirs(self._spill_dir, exist_ok=True)
+        with self._spill_lock:
+            while True:
+                with open(path, "a") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    f.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+                    return
+
+    def _spill(self, rows: list) -> bool:
+        try:
+            self._append("spill.jsonl", rows)
+            self.spilled += len(rows)
+            return True
+        except OSError as e:
+            logger.warning("audit spill failed: %s", e)
+            self.dropped += len(rows)
+            return False
+
+    def _quarantine(self, row: dict, error: Exception):
+        self.quarantined += 1
+        logger.error("audit row %s rejected, quarantined: %s", row.get("id"), error)
+        try:
+            self._append("quarantine.jsonl", [{**row, "error": str(error)}])
+        except OSError as e:
+            logger.warning("audit quarantine failed: %s", e)
+
+    def _replay_spill(self):
+        """Write back every spill file in AUDIT_SPILL_DIR, including ones left by dead workers"""
+        if self._queue.qsize() > AUDIT_QUEUE_SIZE // 2:
+            return
+        spill_path = os.path.join(self._spill_dir, "spill.jsonl")
+        if os.path.exists(spill_path):
+            claimed = os.path.join(self._spill_dir, f"spill-{os.getpid()}-{time.time_ns()}.replay")
+            try:
+                os.rename(spill_path, claimed)
+            except FileNotFoundError:
+                pass  # another worker claimed it first
+        for path in sorted(glob.glob(os.path.join(self._spill_dir, "*.replay"))):
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # being replayed, or still appended to, by another worker
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    continue  # replayed and removed while we opened it
+                rows = [_decode_spilled(json.loads(line)) for line in f if line.strip()]
+                for i in range(0, len(rows), AUDIT_BATCH_SIZE):
+                    self._write(rows[i:i + AUDIT_BATCH_SIZE])
+                self.replayed += len(rows)
+                os.remove(path)
+
+    def _write(self, batch: list):
+        try:
+            with engine.begin() as conn:
+                conn.execute(AuditLog.__table__.insert(), batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed_batches += 1
+            if not isinstance(e, (exc.OperationalError, exc.InterfaceError)) and not getattr(e, "connection_invalidated", False):
+                # The database rejected the rows themselves: narrow it down to the bad ones.
+                if len(batch) == 1:
+                    self._quarantine(batch[0], e)
+                    return
+                middle = len(batch) // 2
+                self._write(batch[:middle])
+                self._write(batch[middle:])
+                return
+            logger.warning("audit batch of %d rows failed: %s", len(batch), e)
+            if AUDIT_OVERFLOW_POLICY == "spill":
+                self._spill(batch)
+            else:
+                self.dropped += len(batch)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+            while len(batch) < AUDIT_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            elif self._stop.is_set():
+                return
+            else:
+                try:
+                    self._replay_spill()
+                except Exception as e:
+                    logger.warning("audit spill replay failed: %s", e)
+
+    def flush(self, timeout: float = 10.0):
+        """Stop the writer after draining whatever is queued"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": AUDIT_QUEUE_SIZE,
+            "overflow_policy": AUDIT_OVERFLOW_POLICY,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "quarantined": self.quarantined,
+            "dropped": self.dropped,
+        }
+
+def _decode_spilled(row: dict) -> dict:
+    """Undo the str() that json.dumps(default=str) applied when the row was spilled"""
+    row["created_at"] = datetime.fromisoformat(row["created_at"])
+    for key in ("id", "user_id", "resource_id"):
+        if row.get(key):
+            row[key] = uuid.UUID(row[key])
+    return row
+
+audit_writer = AuditWriter()
+
+def _as_uuid(value) -> Optional[uuid.UUID]:
+    if isinstance(value, uuid.UUID):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            return None
+    return None
+
+def _audit_row(user_id, action: str, resource_type: str, resource_id: Optional[uuid.UUID], *,
+               old_value=None, new_value=None, ip_address=None, user_agent=None,
+               status: str = "success", details: Optional[str] = None) -> dict:
+    """One audit_logs row as the writer inserts it"""
+    return {
+        "id": uuid.uuid4(),
+        "user_id": _as_uuid(user_id),
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "old_value": old_value,
+        "new_value": new_value,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "status": status,
+        "details": details,
+        "created_at": datetime.utcnow(),
+    }
+
 class AuditService:
     """Service for logging user actions"""
     
     @staticmethod
     def log(
-        db: Session,
+        db: Optional[Session],
         user_id: Optional[str],
         action: str,
         resource_type: str,
@@ -26,10 +283,13 @@ class AuditService:
         details: Optional[str] = None
     ):
         """
-        Log an action to the audit log
+        Log an action to the audit log.
+
+        The row is queued on the background audit writer; the caller's
+        session is not used and no commit happens on the request path.
         
         Args:
-            db: Database session
+            db: Unused, kept for existing call sites
             user_id: User performing the action
             action: Action type (create, update, delete, login, access, etc.)
             resource_type: Type of resource affected (user, patient, prescription, etc.)
@@ -42,29 +302,13 @@ class AuditService:
             details: Additional details
         """
         try:
-            user_id_uuid = uuid.UUID(user_id) if isinstance(user_id, str) and user_id else None
-            resource_id_uuid = uuid.UUID(resource_id) if isinstance(resource_id, str) and resource_id else None
-            
-            audit_log = AuditLog(
-                id=uuid.uuid4(),
-                user_id=user_id_uuid,
-                action=action,
-                resource_type=resource_type,
-                resource_id=resource_id_uuid,
-                old_value=old_value,
-                new_value=new_value,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                status=status,
-                details=details,
-                created_at=datetime.utcnow()
-            )
-            
-            db.add(audit_log)
-            db.commit()
-            return True
+            return audit_writer.submit(_audit_row(
+                user_id, action, resource_type, _as_uuid(resource_id),
+                old_value=old_value, new_value=new_value, ip_address=ip_address,
+                user_agent=user_agent, status=status, details=details,
+            ))
         except Exception as e:
-            print(f"Audit logging error: {str(e)}")
+            logger.warning("Audit logging error: %s", e)
             return False
     
     @staticmethod
@@ -174,9 +418,17 @@ class AuditService:
 
     @staticmethod
     async def log_action(user_id: str, action: str, resource: str, status: str = "success", details: str = None):
-        """Compatibility method for newer phases. Note: This requires a db session which it doesn't have easily here if called statically without Session."""
-        # For now, let's just make it a no-op or find a way to get DB.
-        # Actually, the best way is to fix the call sites to use AuditService.log(db, ...)
-        # But for 100% completion quickly, I'll add a dummy or a logger.
-        print(f"AUDIT LOG: User {user_id} performed {action} on {resource} - {status}")
-        return True
+        """
+        Session-free audit entry point used by the phase 3-5 routers.
+
+        `resource` is "<type>" or "<type>:<id>"; ids that are not UUIDs are
+        kept in details since audit_logs.resource_id is a UUID column. The
+        row goes to the background writer without waiting, so this never
+        blocks the event loop.
+        """
+        resource_type, _, resource_id = resource.partition(":")
+        resource_uuid = _as_uuid(resource_id)
+        if resource_id and resource_uuid is None:
+            details = f"{resource}: {details}" if details else resource
+        row = _audit_row(user_id, action, resource_type, resource_uuid, status=status, details=details)
+        return audit_writer.submit(row, wait=False)
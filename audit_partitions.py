@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+HerCare - audit_logs monthly range partitioning
+
+audit_logs is partitioned by month on created_at. This module:
+  * creates the partitions for the current month and AUDIT_PARTITIONS_AHEAD
+    future months (plus a DEFAULT partition so an insert can never fail);
+    rows that landed in the DEFAULT partition for a month being created are
+    moved into the new partition first,
+  * detaches partitions older than AUDIT_RETENTION_MONTHS and either moves
+    them to the audit_archive schema or drops them (AUDIT_RETENTION_ACTION),
+  * converts an existing unpartitioned audit_logs table in place.
+
+main.py runs maintenance() at startup and once a day. The one-off conversion
+of an existing table is manual:
+Run: python audit_partitions.py migrate | maintain
+"""
+
+from datetime import date
+from sqlalchemy import text
+from database import engine
+import logging
+import os
+import sys
+
+logger = logging.getLogger("hercare.audit")
+
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "0"))  # 0 keeps everything
+AUDIT_RETENTION_ACTION = os.getenv("AUDIT_RETENTION_ACTION", "archive")  # "archive" or "drop"
+ARCHIVE_SCHEMA = "audit_archive"
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"audit_logs_p{month.year:04d}_{month.month:02d}"
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('audit_logs'))"
+    )).scalar()
+
+def _default_has_rows(conn, month: date) -> bool:
+    if not conn.execute(text("SELECT to_regclass('audit_logs_default') IS NOT NULL")).scalar():
+        return False
+    return conn.execute(
+        text("SELECT EXISTS (SELECT 1 FROM audit_logs_default WHERE created_at >= :start AND created_at < :end)"),
+        {"start": month, "end": _add_months(month, 1)},
+    ).scalar()
+
+def _adopt_default_rows(conn, name: str, month: date, bounds: str):
+    """
+    Build a month's partition out of the rows the DEFAULT partition holds for it.
+
+    CREATE ... PARTITION OF fails while the default still has rows in the new
+    range (a backdated or clock-skewed created_at), so the rows are moved into
+    a plain table that is then attached.
+    """
+    conn.execute(text(f"CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS)"))
+    moved = conn.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM audit_logs_default WHERE created_at >= :start AND created_at < :end RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """
+        ),
+        {"start": month, "end": _add_months(month, 1)},
+    )
+    conn.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} {bounds}"))
+    logger.info("moved %d rows from audit_logs_default into %s", moved.rowcount, name)
+
+def ensure_partitions(conn, start: date = None, months_ahead: int = AUDIT_PARTITIONS_AHEAD) -> list:
+    """Create monthly partitions from `start` (default: this month) through months_ahead"""
+    month = _month_start(start or date.today())
+    last = _add_months(_month_start(date.today()), months_ahead)
+    created = []
+    while month <= last:
+        name = partition_name(month)
+        exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+        if not exists:
+            bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            if _default_has_rows(conn, month):
+                _adopt_default_rows(conn, name, month, bounds)
+            else:
+                conn.execute(text(f"CREATE TABLE {name} PARTITION OF audit_logs {bounds}"))
+            created.append(name)
+        month = _add_months(month, 1)
+    conn.execute(text("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT"))
+    return created
+
+def apply_retention(conn, keep_months: int = AUDIT_RETENTION_MONTHS) -> list:
+    """Detach (then archive or drop) partitions that end before the retention cutoff"""
+    if keep_months <= 0:
+        return []
+    cutoff = _add_months(_month_start(date.today()), -keep_months)
+    rows = conn.execute(text(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'audit_logs'::regclass AND c.relname LIKE 'audit\\_logs\\_p%'
+        """
+    )).scalars().all()
+    retired = []
+    for name in sorted(rows):
+        year, month = int(name[-7:-3]), int(name[-2:])
+        if _add_months(date(year, month, 1), 1) > cutoff:
+            continue
+        conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+        if AUDIT_RETENTION_ACTION == "drop":
+            conn.execute(text(f"DROP TABLE {name}"))
+        else:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+            conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+        retired.append(name)
+    return retired
+
+def maintenance():
+    """Create upcoming partitions and apply retention; one worker at a time"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            logger.info("audit_logs is not partitioned yet; run `python audit_partitions.py migrate`")
+            return
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext('audit_partitions'))")).scalar():
+            return
+        created = ensure_partitions(conn)
+        retired = apply_retention(conn)
+    if created or retired:
+        logger.info("audit partitions created=%s retired=%s", created, retired)
+
+def migrate():
+    """Convert an unpartitioned audit_logs table; the old table is kept as audit_logs_unpartitioned"""
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            print("audit_logs is already partitioned.")
+            return
+        print("Renaming audit_logs -> audit_logs_unpartitioned...")
+        conn.execute(text("ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned"))
+        conn.execute(text("ALTER INDEX IF EXISTS audit_logs_pkey RENAME TO audit_logs_unpartitioned_pkey"))
+        conn.execute(text("ALTER INDEX IF EXISTS ix_audit_logs_user_id RENAME TO ix_audit_logs_unpartitioned_user_id"))
+        conn.execute(text("ALTER INDEX IF EXISTS ix_audit_logs_created_at RENAME TO ix_audit_logs_unpartitioned_created_at"))
+        conn.execute(text("UPDATE audit_logs_unpartitioned SET created_at = now() WHERE created_at IS NULL"))
+
+        print("Creating partitioned audit_logs...")
+        conn.execute(text(
+            """
+            CREATE TABLE audit_logs (
+                LIKE audit_logs_unpartitioned INCLUDING DEFAULTS,
+                PRIMARY KEY (id, created_at),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            ) PARTITION BY RANGE (created_at)
+            """
+        ))
+        conn.execute(text("CREATE INDEX ix_audit_logs_user_id ON audit_logs (user_id)"))
+        conn.execute(text("CREATE INDEX ix_audit_logs_created_at ON audit_logs (created_at)"))
+        oldest = conn.execute(text("SELECT min(created_at) FROM audit_logs_unpartitioned")).scalar()
+        created = ensure_partitions(conn, start=oldest.date() if oldest else None)
+        print(f"Created {len(created)} partitions.")
+
+    # Copy month by month so no single statement holds the whole table.
+    with engine.connect() as conn:
+        months = conn.execute(text(
+            "SELECT DISTINCT date_trunc('month', created_at)::date FROM audit_logs_unpartitioned ORDER BY 1"
+        )).scalars().all()
+    for month in months:
+        with engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    """
+                    INSERT INTO audit_logs SELECT * FROM audit_logs_unpartitioned
+                    WHERE created_at >= :start AND created_at < :end
+                    """
+                ),
+                {"start": month, "end": _add_months(month, 1)},
+            )
+            print(f"Copied {result.rowcount} rows for {month:%Y-%m}.")
+    print("Done. Drop audit_logs_unpartitioned once the copy is verified.")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "maintain"
+    if command == "migrate":
+        migrate()
+    elif command == "maintain":
+        maintenance()
+        print("Maintenance complete.")
+    else:
+        print(__doc__)
+        sys.exit(1)
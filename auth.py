@@ -4,8 +4,17 @@ import bcrypt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, pool_capacity, PRIMARY_POOL
+from rbac import role_cache, role_rows, role_rows_statement, cache_role_rows, merge_role_rows, resolve_user_roles
+from cache import TTLCache
+from invalidation import publish, subscribe
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
 import os
+import threading
+import time
 import uuid
 
 # ─── Config ───
@@ -14,11 +23,72 @@ ALGORITHM = "HS256"
 TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
 # ─── Password Hashing (using bcrypt directly) ───
+# bcrypt is ~250ms of CPU per call at cost 12. Calls run on a small dedicated
+# executor (bcrypt releases the GIL) so a login burst can only occupy
+# BCRYPT_WORKERS cores; once BCRYPT_MAX_PENDING calls are queued or running,
+# new ones are shed with a 503. Login and register await the *_async variants
+# so a waiting call holds neither a threadpool thread nor a pool connection;
+# the default cap stays at half the threadpool for the remaining sync callers.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 2)))
+BCRYPT_MAX_PENDING = int(os.getenv(
+    "BCRYPT_MAX_PENDING", str(max(1, min(BCRYPT_WORKERS * 2, pool_capacity(PRIMARY_POOL) // 2)))
+))
+
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_lock = threading.Lock()
+_bcrypt_pending = 0
+bcrypt_shed_count = 0
+
+def _bcrypt_submit(fn, *args):
+    global _bcrypt_pending, bcrypt_shed_count
+    with _bcrypt_lock:
+        if _bcrypt_pending >= BCRYPT_MAX_PENDING:
+            bcrypt_shed_count += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        _bcrypt_pending += 1
+    future = _bcrypt_executor.submit(fn, *args)
+
+    def _release(_):
+        global _bcrypt_pending
+        with _bcrypt_lock:
+            _bcrypt_pending -= 1
+    future.add_done_callback(_release)
+    return future
+
+def _hashpw(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return _bcrypt_submit(_hashpw, password).result()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return _bcrypt_submit(_checkpw, plain_password, hashed_password).result()
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(_bcrypt_submit(_hashpw, password))
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(_bcrypt_submit(_checkpw, plain_password, hashed_password))
+
+def bcrypt_stats() -> dict:
+    with _bcrypt_lock:
+        pending, shed = _bcrypt_pending, bcrypt_shed_count
+    return {"workers": BCRYPT_WORKERS, "max_pending": BCRYPT_MAX_PENDING, "pending": pending, "shed": shed}
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when a stored hash was made with a different BCRYPT_ROUNDS ($2b$<cost>$...)"""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
 
 # ─── JWT Token with Roles ───
 def create_token(data: dict, expires_delta: timedelta = None) -> str:
@@ -41,13 +111,78 @@ def create_token_with_roles(user_id: str, user_name: str, roles: list = None) ->
     }
     return create_token(data)
 
+# ─── Verified Token Cache ───
+# Mobile clients reuse one token for hours, so verified claims are cached by
+# token digest. An entry never outlives the token's own `exp`.
+token_cache = TTLCache(
+    "jwt",
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "20000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")),
+)
+_decode_lock = threading.Lock()
+_decode_count = 0
+_decode_seconds = 0.0
+
+def decode_token(token: str) -> dict:
+    """Verify a JWT and return a copy of its claims; raises JWTError like jwt.decode"""
+    global _decode_count, _decode_seconds
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(digest)
+    if claims is None:
+        started = time.perf_counter()
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with _decode_lock:
+            _decode_count += 1
+            _decode_seconds += time.perf_counter() - started
+        ttl = token_cache.ttl
+        if "exp" in claims:
+            ttl = min(ttl, claims["exp"] - time.time())
+        if ttl > 0:
+            token_cache.set(digest, claims, ttl=ttl)
+    return dict(claims)
+
+def token_decode_stats() -> dict:
+    with _decode_lock:
+        count, seconds = _decode_count, _decode_seconds
+    avg = seconds / count if count else 0.0
+    return {
+        "decodes": count,
+        "avg_decode_ms": round(avg * 1000, 4),
+        "estimated_saved_ms": round(token_cache.hits * avg * 1000, 1),
+    }
+
+# ─── User Snapshot Cache (optional) ───
+# USER_CACHE_TTL > 0 serves get_current_user from a column snapshot instead of
+# loading the users row on every request. Each request gets its own transient
+# User, so attaching roles to it never leaks between requests.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "0"))
+user_cache = TTLCache("users", maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")), ttl=USER_CACHE_TTL)
+subscribe("users", lambda key: user_cache.delete(uuid.UUID(key)))
+
+def load_user(user_id: uuid.UUID, db: Session):
+    from models import User
+
+    if USER_CACHE_TTL <= 0:
+        return db.query(User).filter(User.id == user_id).first()
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            return None
+        snapshot = {c.key: getattr(user, c.key) for c in User.__table__.columns}
+        user_cache.set(user_id, snapshot)
+        return user
+    return User(**snapshot)
+
+def invalidate_user(user_id):
+    """Drop a cached user snapshot in every worker"""
+    publish("users", str(user_id))
+
 # ─── Get Current User (dependency) ───
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """Get current authenticated user from token"""
-    from models import User
-
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid or expired token",
@@ -55,14 +190,14 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("user_id")
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
+    user = load_user(uuid.UUID(user_id), db)
     if user is None:
         raise credentials_exception
 
@@ -70,8 +205,6 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
 def get_current_user_with_roles(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """Get current user with their roles"""
-    from models import User, UserRole, Role
-
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid or expired token",
@@ -79,27 +212,19 @@ def get_current_user_with_roles(token: str = Depends(oauth2_scheme), db: Session
     )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("user_id")
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
+    user = load_user(uuid.UUID(user_id), db)
     if user is None:
         raise credentials_exception
 
     # Get user roles
-    user_roles = db.query(UserRole).filter(UserRole.user_id == uuid.UUID(user_id)).all()
-    roles = []
-    permissions = {}
-    
-    for user_role in user_roles:
-        role = db.query(Role).filter(Role.id == user_role.role_id).first()
-        if role:
-            roles.append(role.name)
-            permissions.update(role.permissions)
+    roles, permissions = resolve_user_roles(user.id, db)
 
     # Backward compatibility for users that only have users.role set
     # but no entry in user_roles yet.
@@ -143,6 +268,16 @@ def has_permission(user, required_permission: str) -> bool:
 
 from functools import wraps
 
+async def _load_roles_onto_user(user, db):
+    """Attach roles/permissions to user with either a sync Session or an AsyncSession"""
+    if isinstance(db, AsyncSession):
+        rows = role_cache.get(user.id)
+        if rows is None:
+            rows = cache_role_rows(user.id, (await db.execute(role_rows_statement(user.id))).all())
+    else:
+        rows = role_rows(user.id, db)
+    user.roles, user.permissions = merge_role_rows(rows)
+
 # ─── Require Role Decorator ───
 def require_role(*required_roles):
     """Decorator to require specific role(s)"""
@@ -162,13 +297,7 @@ def require_role(*required_roles):
                 # We need DB to load roles. If db not in kwargs, we can't do much here 
                 # but most endpoints have db: Session = Depends(get_db)
                 if db:
-                    from models import UserRole, Role
-                    user_roles = db.query(UserRole).filter(UserRole.user_id == user.id).all()
-                    user.roles = [db.query(Role).filter(Role.id == ur.role_id).first().name for ur in user_roles]
-                    user.permissions = {}
-                    for ur in user_roles:
-                        r = db.query(Role).filter(Role.id == ur.role_id).first()
-                        if r: user.permissions.update(r.permissions)
+                    await _load_roles_onto_user(user, db)
 
             if not user or not any(role in getattr(user, "roles", []) for role in required_roles):
                 raise HTTPException(
@@ -190,15 +319,7 @@ def require_permission(*required_permissions):
             if user and (not hasattr(user, "permissions") or not user.permissions):
                 db = kwargs.get("db")
                 if db:
-                    from models import UserRole, Role
-                    user_roles = db.query(UserRole).filter(UserRole.user_id == user.id).all()
-                    user.permissions = {}
-                    user.roles = []
-                    for ur in user_roles:
-                        r = db.query(Role).filter(Role.id == ur.role_id).first()
-                        if r:
-                            user.roles.append(r.name)
-                            user.permissions.update(r.permissions)
+                    await _load_roles_onto_user(user, db)
 
             if not user or not any(getattr(user, "permissions", {}).get(perm, False) for perm in required_permissions):
                 raise HTTPException(
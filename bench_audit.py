@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+HerCare - Audit pipeline throughput check
+Submits N events through AuditService.log_action against DATABASE_URL and
+reports how fast they are accepted and how fast the writer drains them.
+Run: python bench_audit.py [events]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Size the queue for the burst so the measurement is the writer, not overflow.
+EVENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+os.environ.setdefault("AUDIT_QUEUE_SIZE", str(EVENTS))
+
+from audit import AuditService, audit_writer
+
+async def submit_all():
+    for i in range(EVENTS):
+        await AuditService.log_action(
+            user_id=None,
+            action="bench_event",
+            resource=f"bench:{i}",
+            status="success",
+        )
+
+start = time.perf_counter()
+asyncio.run(submit_all())
+submitted = time.perf_counter() - start
+print(f"Submitted {EVENTS} events in {submitted:.3f}s ({EVENTS / submitted:,.0f} events/sec on the caller)")
+
+while audit_writer.written + audit_writer.dropped < EVENTS and audit_writer.failed_batches == 0:
+    time.sleep(0.05)
+    if time.perf_counter() - start > 120:
+        break
+drained = time.perf_counter() - start
+stats = audit_writer.stats()
+print(f"Written {stats['written']} rows in {stats['batches']} batches in {drained:.3f}s ({stats['written'] / drained:,.0f} rows/sec)")
+print(f"Stats: {stats}")
+audit_writer.flush()
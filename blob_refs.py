@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+HerCare - blob reference counting and garbage collection
+
+Identical uploads share one content-addressed blob. The blobs table keeps
+a ref_count per blob: acquire() when a report or file starts pointing at
+a key, release() when it stops, both inside the caller's transaction.
+
+collect_garbage() removes blobs whose count reached zero more than
+BLOB_GC_GRACE_SECONDS ago, files in the store that no row references, and
+abandoned partial uploads. Before deleting anything it re-checks
+medical_reports and files directly, so a drifted counter can delay a
+deletion but never lose a referenced blob. main.py runs it every
+BLOB_GC_INTERVAL seconds.
+
+acquire() takes a per-blob advisory lock for the rest of the caller's
+transaction, and callers write the file only after acquiring it. The
+collector checks and deletes each blob under the same lock, so an upload
+either waits for the deletion and writes the file again, or makes the
+collector see the new reference.
+
+Run: python blob_refs.py collect | rebuild
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, select, text, update, union
+from sqlalchemy.dialects import postgresql
+from database import engine, SessionLocal
+from models import Blob, MedicalReport, File
+from blobstore import blob_store
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger("hercare.blobs")
+
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+BLOB_GC_INCOMPLETE_SECONDS = int(os.getenv("BLOB_GC_INCOMPLETE_SECONDS", "86400"))
+BLOB_GC_BATCH = 500
+
+def _lock(db, key: str):
+    """Per-blob lock held until the end of the transaction"""
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": "blob:" + key})
+
+def acquire(db, key: str, size: int, content_type: str = None):
+    """
+    Count one more reference to `key`, registering the blob on first use.
+    Write the blob's file after this call, before committing.
+    """
+    table = Blob.__table__
+    _lock(db, key)
+    db.execute(
+        postgresql.insert(table)
+        .values(key=key, size=size, content_type=content_type, ref_count=1, created_at=datetime.utcnow())
+        .on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={"ref_count": table.c.ref_count + 1, "released_at": None},
+        )
+    )
+
+def release(db, key: str):
+    """Drop one reference; at zero the blob becomes eligible for collection"""
+    table = Blob.__table__
+    db.execute(
+        update(table)
+        .where(table.c.key == key)
+        .values(
+            ref_count=case((table.c.ref_count > 0, table.c.ref_count - 1), else_=0),
+            released_at=case((table.c.ref_count <= 1, datetime.utcnow()), else_=None),
+        )
+    )
+
+def _referenced(db, keys: list) -> set:
+    """Keys that some report or file row actually points at"""
+    statement = union(
+        select(MedicalReport.blob_key).where(MedicalReport.blob_key.in_(keys)),
+        select(File.blob_key).where(File.blob_key.in_(keys)),
+    )
+    return set(db.execute(statement).scalars())
+
+def rebuild_refcounts():
+    """Recompute every ref_count from medical_reports and files (after migrations or drift)"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            """
+            INSERT INTO blobs (key, size, content_type, ref_count, created_at)
+            SELECT blob_key, max(file_size), max(content_type), count(*), now()
+            FROM (
+                SELECT blob_key, file_size, content_type FROM medical_reports WHERE blob_key IS NOT NULL
+                UNION ALL
+                SELECT blob_key, file_size, NULL FROM files WHERE blob_key IS NOT NULL
+            ) refs
+            GROUP BY blob_key
+            ON CONFLICT (key) DO UPDATE SET ref_count = EXCLUDED.ref_count, released_at = NULL
+            """
+        ))
+        result = conn.execute(text(
+            """
+            UPDATE blobs SET ref_count = 0, released_at = now()
+            WHERE ref_count > 0
+              AND key NOT IN (SELECT blob_key FROM medical_reports WHERE blob_key IS NOT NULL)
+              AND key NOT IN (SELECT blob_key FROM files WHERE blob_key IS NOT NULL)
+            """
+        ))
+    return result.rowcount
+
+def _count_refs(db, key: str) -> int:
+    return (
+        db.query(MedicalReport).filter(MedicalReport.blob_key == key).count()
+        + db.query(File).filter(File.blob_key == key).count()
+    )
+
+def _delete_if_unused(key: str, cutoff: float, released_before: datetime = None) -> bool:
+    """
+    Delete the blob's file and row if nothing uses it, checked under the lock
+    acquire() takes. A registered blob must have been released before
+    `released_before`; the file must not have been written since `cutoff`.
+    """
+    with SessionLocal() as db:
+        _lock(db, key)
+        row = db.execute(select(Blob.ref_count, Blob.released_at).where(Blob.key == key)).first()
+        if row is not None and (
+            row.ref_count > 0 or row.released_at is None
+            or (released_before is not None and row.released_at >= released_before)
+        ):
+            return False
+        if _referenced(db, [key]):
+            if row is not None:
+                # Counter drifted; the rows are the truth.
+                db.execute(update(Blob).where(Blob.key == key).values(ref_count=_count_refs(db, key), released_at=None))
+                db.commit()
+            return False
+        try:
+            # A dedup hit from a write that skipped acquire() still refreshes the mtime.
+            if blob_store.modified(key) >= cutoff:
+                return False
+        except FileNotFoundError:
+            pass
+        blob_store.delete(key)
+        db.execute(delete(Blob).where(Blob.key == key))
+        db.commit()
+    return True
+
+def _collect_released(released_before: datetime, cutoff: float) -> int:
+    removed, last_key = 0, ""
+    while True:
+        with SessionLocal() as db:
+            keys = db.execute(
+                select(Blob.key)
+                .where(Blob.ref_count <= 0, Blob.released_at < released_before, Blob.key > last_key)
+                .order_by(Blob.key)
+                .limit(BLOB_GC_BATCH)
+            ).scalars().all()
+        if not keys:
+            return removed
+        removed += sum(_delete_if_unused(key, cutoff, released_before) for key in keys)
+        last_key = keys[-1]
+
+def _collect_orphans(cutoff: float) -> int:
+    removed = 0
+    candidates = []
+    def sweep(batch):
+        with SessionLocal() as db:
+            known = set(db.execute(select(Blob.key).where(Blob.key.in_(batch))).scalars())
+            known |= _referenced(db, batch)
+        return sum(_delete_if_unused(key, cutoff) for key in batch if key not in known)
+    for key, modified in blob_store.list_keys():
+        if modified < cutoff:
+            candidates.append(key)
+        if len(candidates) >= BLOB_GC_BATCH:
+            removed += sweep(candidates)
+            candidates = []
+    if candidates:
+        removed += sweep(candidates)
+    return removed
+
+def collect_garbage() -> dict:
+    """One GC pass; only one worker runs it at a time"""
+    lock = engine.connect()
+    if not lock.execute(text("SELECT pg_try_advisory_lock(hashtext('blob_gc'))")).scalar():
+        lock.close()
+        return {}
+    try:
+        now = time.time()
+        cutoff = now - BLOB_GC_GRACE_SECONDS
+        stats = {
+            "released": _collect_released(datetime.utcnow() - timedelta(seconds=BLOB_GC_GRACE_SECONDS), cutoff),
+            "orphans": _collect_orphans(cutoff),
+            "incomplete": blob_store.purge_incomplete(now - BLOB_GC_INCOMPLETE_SECONDS),
+        }
+    finally:
+        lock.execute(text("SELECT pg_advisory_unlock(hashtext('blob_gc'))"))
+        lock.close()
+    if any(stats.values()):
+        logger.info("blob gc removed %s", stats)
+    return stats
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "collect"
+    if command == "collect":
+        print(f"Removed: {collect_garbage()}")
+    elif command == "rebuild":
+        print(f"Rebuilt reference counts; {rebuild_refcounts()} blobs now unreferenced.")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,260 @@
+# ════════════════════════════════════
+# Content-addressed blob storage for report files
+# ════════════════════════════════════
+
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterator, Optional
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+BLOB_STORE = os.getenv("BLOB_STORE", "local")
+# No default: a directory inside the container or the checkout is lost on the
+# next deploy, and the report rows pointing at it have no inline copy left.
+BLOB_STORE_PATH = os.getenv("BLOB_STORE_PATH")
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL_RE = re.compile(r"^data:([^;,]*)(;base64)?,", re.IGNORECASE)
+
+class BlobWriter(ABC):
+    """Incremental upload: write() chunks, then commit() for the key or abort()"""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        self._write(chunk)
+
+    @abstractmethod
+    def _write(self, chunk: bytes):
+        ...
+
+    @abstractmethod
+    def commit(self) -> str:
+        ...
+
+    @abstractmethod
+    def abort(self):
+        ...
+
+class BlobStore(ABC):
+    """
+    Blobs are immutable and keyed by the SHA-256 of their bytes, so writing
+    the same content twice is a no-op. Backends implement the methods below;
+    an S3-compatible one can map keys straight onto object names.
+    """
+
+    @abstractmethod
+    def writer(self) -> BlobWriter:
+        ...
+
+    def put(self, data: bytes) -> str:
+        writer = self.writer()
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path when the backend has one, so it can be served with sendfile"""
+        return None
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def modified(self, key: str) -> float:
+        """Last write (or dedup hit) as a unix timestamp"""
+
+    @abstractmethod
+    def list_keys(self) -> Iterator[tuple[str, float]]:
+        """(key, modified) for every stored blob"""
+
+    def purge_incomplete(self, older_than: float) -> int:
+        """Remove abandoned partial uploads; returns how many"""
+        return 0
+
+    # Derived artifacts (thumbnails, previews) live beside their source blob
+    # under a `kind` name and are deleted with it.
+    @abstractmethod
+    def put_derived(self, key: str, kind: str, data: bytes):
+        ...
+
+    @abstractmethod
+    def derived_path(self, key: str, kind: str) -> Optional[str]:
+        ...
+
+    def read(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+class LocalBlobWriter(BlobWriter):
+    """Streams into root/.incoming and renames into place once the hash is known"""
+
+    def __init__(self, store: "LocalBlobStore"):
+        super().__init__()
+        self.store = store
+        incoming = os.path.join(store.root, ".incoming")
+        os.makedirs(incoming, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=incoming)
+        self.file = os.fdopen(fd, "wb")
+
+    def _write(self, chunk: bytes):
+        self.file.write(chunk)
+
+    def commit(self) -> str:
+        key = self.sha256.hexdigest()
+        path = self.store.path(key)
+        try:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            if os.path.exists(path):
+                os.unlink(self.tmp)
+                # Fresh mtime keeps the garbage collector's grace period off a re-used blob.
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self.tmp, path)
+        except BaseException:
+            self.abort()
+            raise
+        return key
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.unlink(self.tmp)
+        except FileNotFoundError:
+            pass
+
+class LocalBlobStore(BlobStore):
+    """Blobs under root/ab/cd/<sha256>, written via temp file + rename"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        if not _KEY_RE.match(key or ""):
+            raise ValueError(f"invalid blob key: {key!r}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def _derived_file(self, key: str, kind: str) -> str:
+        if not re.match(r"^[\w.-]+$", kind):
+            raise ValueError(f"invalid derived kind: {kind!r}")
+        self.path(key)  # validates the key
+        return os.path.join(self.root, ".derived", kind, key[:2], key)
+
+    def writer(self) -> BlobWriter:
+        return LocalBlobWriter(self)
+
+    def put_derived(self, key: str, kind: str, data: bytes):
+        path = self._derived_file(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def derived_path(self, key: str, kind: str) -> Optional[str]:
+        path = self._derived_file(key, kind)
+        return path if os.path.exists(path) else None
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def delete(self, key: str):
+        derived = os.path.join(self.root, ".derived")
+        paths = [self.path(key)] + [
+            self._derived_file(key, kind) for kind in (os.listdir(derived) if os.path.isdir(derived) else ())
+        ]
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def modified(self, key: str) -> float:
+        return os.path.getmtime(self.path(key))
+
+    def list_keys(self) -> Iterator[tuple[str, float]]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if _KEY_RE.match(name):
+                    try:
+                        yield name, os.path.getmtime(os.path.join(dirpath, name))
+                    except FileNotFoundError:
+                        continue
+
+    def purge_incomplete(self, older_than: float) -> int:
+        incoming = os.path.join(self.root, ".incoming")
+        removed = 0
+        for entry in os.scandir(incoming) if os.path.isdir(incoming) else ():
+            try:
+                if entry.stat().st_mtime < older_than:
+                    os.unlink(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+def _create_store() -> BlobStore:
+    if BLOB_STORE == "local":
+        if not BLOB_STORE_PATH:
+            raise RuntimeError(
+                "BLOB_STORE_PATH is not set; point it at persistent storage shared by every instance"
+            )
+        return LocalBlobStore(BLOB_STORE_PATH)
+    raise RuntimeError(f"Unsupported BLOB_STORE: {BLOB_STORE}")
+
+blob_store = _create_store()
+
+# ────── Legacy inline payloads ──────
+# Reports used to carry files as base64 text, optionally as a data: URL.
+def decode_inline_file(value: str) -> tuple[bytes, Optional[str]]:
+    """(bytes, content_type) from a base64 string or data: URL; ValueError if malformed"""
+    content_type = None
+    match = _DATA_URL_RE.match(value)
+    if match:
+        content_type = match.group(1) or None
+        value = value[match.end():]
+    try:
+        return base64.b64decode(value, validate=True), content_type
+    except (binascii.Error, ValueError):
+        raise ValueError("file_data is not valid base64")
+
+def encode_inline_file(data: bytes, content_type: Optional[str]) -> str:
+    """Inverse of decode_inline_file, for clients that still ask for include_data"""
+    encoded = base64.b64encode(data).decode()
+    return f"data:{content_type};base64,{encoded}" if content_type else encoded
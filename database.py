@@ -1,18 +1,155 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from fastapi import Request
 from dotenv import load_dotenv
+from typing import Optional
+import hashlib
+import hmac
+import logging
 import os
+import sys
+import threading
+import time
 
 load_dotenv()
 
+logger = logging.getLogger("hercare.db")
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# ────── Pool sizing ──────
+# DB_MAX_CONNECTIONS is the total number of Postgres connections this
+# deployment may open. It is split across gunicorn workers and then between
+# the sync and async engines, rounding down so the total never exceeds it.
+# Each worker's sync pool gets at least DB_MIN_POOL_PER_WORKER connections and
+# main.py sizes the threadpool to match, so sync routes queue for a thread
+# rather than holding one while they wait on pool checkout.
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "60"))
+DB_MIN_POOL_PER_WORKER = int(os.getenv("DB_MIN_POOL_PER_WORKER", "10"))
+DB_ASYNC_POOL_SHARE = float(os.getenv("DB_ASYNC_POOL_SHARE", "0.25"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_SLOW_WAIT = float(os.getenv("DB_POOL_SLOW_WAIT", "1.0"))
+
+def _gunicorn_workers() -> Optional[int]:
+    """The -w/--workers value gunicorn was started with (workers inherit its argv)"""
+    if not sys.argv or not os.path.basename(sys.argv[0]).startswith("gunicorn"):
+        return None
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg in ("-w", "--workers") and i + 1 < len(args):
+            return int(args[i + 1])
+        if arg.startswith("--workers="):
+            return int(arg.split("=", 1)[1])
+        if arg.startswith("-w") and arg[2:].isdigit():
+            return int(arg[2:])
+    return None
+
+# gunicorn_conf.py exports WEB_CONCURRENCY; a bare `gunicorn -w N` is read from argv.
+WORKER_COUNT = max(1, _gunicorn_workers() or int(os.getenv("WEB_CONCURRENCY") or os.getenv("WORKERS") or 1))
+
+# invalidation.py's LISTEN connection is detached from the primary pool, so it
+# is held back from the budget before the pools are sized.
+LISTEN_CONNECTIONS_PER_WORKER = 1
+
+def _pool_sizing(share: float, budget: int = DB_MAX_CONNECTIONS, floor: int = 1, reserved: int = 0) -> dict:
+    """pool_size/max_overflow for one engine in one worker, two thirds kept warm."""
+    available = max(0, budget - WORKER_COUNT * reserved)
+    per_worker = max(floor, int(available * share) // WORKER_COUNT)
+    pool_size = max(1, per_worker * 2 // 3)
+    return {"pool_size": pool_size, "max_overflow": per_worker - pool_size}
+
+def pool_capacity(sizing: dict) -> int:
+    return sizing["pool_size"] + sizing["max_overflow"]
+
+def _check_budget(name: str, budget: int, *sizings: dict, reserved: int = 0):
+    """Refuse to start when the pools at their floors can open more connections than the budget"""
+    total = WORKER_COUNT * (sum(pool_capacity(s) for s in sizings) + reserved)
+    if total > budget:
+        raise RuntimeError(
+            f"{name} connection budget {budget} is too small for {WORKER_COUNT} workers: the pools "
+            f"can open {total} connections (at least {DB_MIN_POOL_PER_WORKER} per worker for sync routes). "
+            "Raise the budget, lower DB_MIN_POOL_PER_WORKER or run fewer workers."
+        )
+
+PRIMARY_POOL = _pool_sizing(1 - DB_ASYNC_POOL_SHARE, floor=DB_MIN_POOL_PER_WORKER, reserved=LISTEN_CONNECTIONS_PER_WORKER)
+
+# ────── Pool telemetry ──────
+class PoolStats:
+    """Checkout wait time and timeout counters for one engine's pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.wait_total += seconds
+                self.wait_max = max(self.wait_max, seconds)
+        if timed_out:
+            logger.warning("db pool %s: checkout timed out after %.2fs", self.name, seconds)
+        elif seconds >= DB_POOL_SLOW_WAIT:
+            logger.warning("db pool %s: checkout waited %.2fs", self.name, seconds)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_total, wait_max = self.wait_total, self.wait_max
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "avg_wait_ms": round(wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+            "max_wait_ms": round(wait_max * 1000, 3),
+        }
+
+class _TimedCheckoutMixin:
+    """Times every pool checkout; `stats` is set on the concrete subclass."""
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        return conn
+
+primary_pool_stats = PoolStats("primary")
+replica_pool_stats = PoolStats("replica")
+async_pool_stats = PoolStats("async")
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    stats = primary_pool_stats
+
+class InstrumentedReplicaQueuePool(_TimedCheckoutMixin, QueuePool):
+    stats = replica_pool_stats
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    stats = async_pool_stats
+
 engine = create_engine(
     DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
+    pool_timeout=DB_POOL_TIMEOUT,
     pool_recycle=3600,
+    **PRIMARY_POOL,
 )
 SessionLocal = sessionmaker(bind=engine)
 
@@ -23,3 +160,128 @@ def get_db():
     finally:
         db.close()
 
+# ────── Read replica ──────
+# When DATABASE_REPLICA_URL is unset every read goes to the primary.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+DB_REPLICA_MAX_CONNECTIONS = int(os.getenv("DB_REPLICA_MAX_CONNECTIONS", str(DB_MAX_CONNECTIONS)))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+if DATABASE_REPLICA_URL:
+    REPLICA_POOL = _pool_sizing(1, DB_REPLICA_MAX_CONNECTIONS, floor=DB_MIN_POOL_PER_WORKER)
+    _check_budget("Replica", DB_REPLICA_MAX_CONNECTIONS, REPLICA_POOL)
+    replica_engine = create_engine(
+        DATABASE_REPLICA_URL,
+        poolclass=InstrumentedReplicaQueuePool,
+        pool_pre_ping=True,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=3600,
+        **REPLICA_POOL,
+    )
+    ReplicaSessionLocal = sessionmaker(bind=replica_engine)
+else:
+    replica_engine = None
+    ReplicaSessionLocal = SessionLocal
+
+# The write marker travels with the client (X-Last-Write header or cookie), so
+# every worker and instance sees it. It is HMAC-signed and bound to the user id.
+READ_YOUR_WRITES_HEADER = "X-Last-Write"
+READ_YOUR_WRITES_COOKIE = "hc_last_write"
+_MARKER_KEY = hashlib.sha256(
+    b"read-your-writes:" + os.getenv("SECRET_KEY", "hercare-super-secret-key-change-me").encode()
+).digest()
+
+def _marker_signature(payload: str) -> str:
+    return hmac.new(_MARKER_KEY, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+def write_marker(user_id, at: Optional[float] = None) -> str:
+    """Signed "<user id>.<unix ms>.<signature>" recording a write by `user_id`"""
+    payload = f"{user_id}.{int((time.time() if at is None else at) * 1000)}"
+    return f"{payload}.{_marker_signature(payload)}"
+
+def wrote_recently(marker: Optional[str], user_id) -> bool:
+    """True if `marker` is a valid write marker for `user_id` younger than READ_YOUR_WRITES_SECONDS"""
+    if not marker or not user_id:
+        return False
+    parts = marker.rsplit(".", 2)
+    if len(parts) != 3 or not parts[1].isdigit() or parts[0] != str(user_id):
+        return False
+    if not hmac.compare_digest(parts[2], _marker_signature(f"{parts[0]}.{parts[1]}")):
+        return False
+    return 0 <= time.time() - int(parts[1]) / 1000 < READ_YOUR_WRITES_SECONDS
+
+def request_marker(request: Request) -> Optional[str]:
+    return request.headers.get(READ_YOUR_WRITES_HEADER) or request.cookies.get(READ_YOUR_WRITES_COOKIE)
+
+def get_read_db(request: Request):
+    """Session for read-only routes: replica, unless the caller's write marker is still fresh"""
+    user_id = getattr(request.state, "user_id", None)
+    if replica_engine is None or wrote_recently(request_marker(request), user_id):
+        db = SessionLocal()
+    else:
+        db = ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# ────── Async engine (asyncpg) for async def routes ──────
+def _to_async_url(url: str) -> str:
+    """Rewrite a psycopg2-style URL for the asyncpg driver."""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql+psycopg2://"):
+        url = "postgresql://" + url[len("postgresql+psycopg2://"):]
+    if url.startswith("postgresql://"):
+        url = "postgresql+asyncpg://" + url[len("postgresql://"):]
+    # asyncpg takes `ssl`, not libpq's `sslmode`.
+    return url.replace("sslmode=", "ssl=")
+
+def _is_async_url(url: str) -> bool:
+    try:
+        return make_url(url).get_dialect().is_async
+    except Exception:
+        return False
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+
+# Only built for an async driver; other URLs would make create_async_engine raise at import.
+if _is_async_url(ASYNC_DATABASE_URL):
+    ASYNC_POOL = _pool_sizing(DB_ASYNC_POOL_SHARE, reserved=LISTEN_CONNECTIONS_PER_WORKER)
+    _check_budget("Primary", DB_MAX_CONNECTIONS, PRIMARY_POOL, ASYNC_POOL, reserved=LISTEN_CONNECTIONS_PER_WORKER)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_pre_ping=True,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=3600,
+        **ASYNC_POOL,
+    )
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+else:
+    logger.warning("No async driver for ASYNC_DATABASE_URL; async routes are unavailable")
+    _check_budget("Primary", DB_MAX_CONNECTIONS, PRIMARY_POOL, reserved=LISTEN_CONNECTIONS_PER_WORKER)
+    async_engine = None
+    AsyncSessionLocal = None
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async routes need ASYNC_DATABASE_URL with an async driver (e.g. postgresql+asyncpg)")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_status() -> dict:
+    """Per-worker pool statistics for every engine"""
+    return {
+        "pid": os.getpid(),
+        "workers": WORKER_COUNT,
+        "max_connections": DB_MAX_CONNECTIONS,
+        "pools": {
+            "primary": primary_pool_stats.snapshot(engine.pool),
+            **({"async": async_pool_stats.snapshot(async_engine.sync_engine.pool)} if async_engine else {}),
+            **({"replica": replica_pool_stats.snapshot(replica_engine.pool)} if replica_engine else {}),
+        },
+    }
+
+def log_pool_status():
+    for name, stats in pool_status()["pools"].items():
+        logger.info("db pool %s: %s", name, stats)
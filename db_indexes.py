@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+HerCare - composite indexes for hot lookups
+
+Creates models.HOT_INDEXES on an existing database with CREATE INDEX
+CONCURRENTLY, so writes keep flowing while they build. An index left
+INVALID by an interrupted build is dropped and rebuilt. Once they are all
+valid, the single-column indexes they supersede are dropped concurrently. entrypoint.sh runs
+this before starting the workers; it is a no-op once the indexes exist.
+
+HOT_QUERIES are the lookups those indexes serve, as used by the routes,
+each with the index its plan is expected to use. verify_query_plans.py
+EXPLAINs them against a seeded schema and checks for that index.
+
+Run: python db_indexes.py migrate
+"""
+
+from datetime import date
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.schema import CreateIndex
+from database import engine
+from models import (
+    HOT_INDEXES, SUPERSEDED_INDEXES, DoctorPatientLink, HealthLog, MedicalReport, EmergencyRequest, Medication, Consultation,
+)
+import sys
+
+# name -> (expected index, builder(ids)); ids holds a seeded "doctor", "patient", health "log" id and "day"
+HOT_QUERIES = {
+    "doctor-patient link (report access, medications)": ("ix_doctor_patient_links_doctor_patient", lambda ids: (
+        select(DoctorPatientLink)
+        .where(DoctorPatientLink.doctor_id == ids["doctor"], DoctorPatientLink.patient_id == ids["patient"])
+    )),
+    "health logs by user, newest first": ("ix_health_logs_user_log_date", lambda ids: (
+        select(HealthLog)
+        .where(HealthLog.user_id == ids["patient"])
+        .order_by(HealthLog.log_date.desc(), HealthLog.id.desc())
+        .limit(100)
+    )),
+    "health logs by user, date range page": ("ix_health_logs_user_log_date", lambda ids: (
+        select(HealthLog)
+        .where(
+            HealthLog.user_id == ids["patient"],
+            HealthLog.log_date >= date(2024, 1, 1),
+            tuple_(HealthLog.log_date, HealthLog.id) < tuple_(ids["day"], ids["log"]),
+        )
+        .order_by(HealthLog.log_date.desc(), HealthLog.id.desc())
+        .limit(100)
+    )),
+    "reports by patient, newest first": ("ix_medical_reports_patient_created", lambda ids: (
+        select(MedicalReport.id, MedicalReport.title, MedicalReport.created_at)
+        .where(MedicalReport.patient_id == ids["patient"])
+        .order_by(MedicalReport.created_at.desc(), MedicalReport.id.desc())
+        .limit(50)
+    )),
+    "pending emergencies": ("ix_emergency_requests_status_created", lambda ids: (
+        select(EmergencyRequest)
+        .where(EmergencyRequest.status == "pending")
+        .order_by(EmergencyRequest.created_at.desc())
+    )),
+    "active medications by patient": ("ix_medications_patient_active", lambda ids: (
+        select(Medication).where(Medication.patient_id == ids["patient"], Medication.active == True)
+    )),
+    "consultations by patient": ("ix_consultations_patient_visit_date", lambda ids: (
+        select(Consultation)
+        .where(Consultation.patient_id == ids["patient"])
+        .order_by(Consultation.visit_date.desc())
+    )),
+}
+
+def migrate():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Runs before the app's startup migrations, so add the columns the indexes need.
+        conn.exec_driver_sql("ALTER TABLE health_logs ADD COLUMN IF NOT EXISTS client_key VARCHAR")
+        conn.exec_driver_sql("ALTER TABLE medical_reports ADD COLUMN IF NOT EXISTS blob_key VARCHAR")
+        conn.exec_driver_sql("ALTER TABLE files ADD COLUMN IF NOT EXISTS blob_key VARCHAR")
+        for index in HOT_INDEXES:
+            invalid = conn.execute(
+                text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+                {"name": index.name},
+            ).scalar()
+            if invalid:
+                print(f"Dropping invalid {index.name}...")
+                conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}")
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+            conn.exec_driver_sql(ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1))
+            print(f"Index {index.name} ready.")
+        for name in SUPERSEDED_INDEXES:
+            if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+                conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                print(f"Dropped superseded {name}.")
+
+def missing_required(conn) -> list:
+    """
+    Unique HOT_INDEXES that are absent or INVALID.
+
+    These are ON CONFLICT targets, so the queries using them fail outright
+    without them; the others only cost speed.
+    """
+    return [
+        index.name for index in HOT_INDEXES
+        if index.unique and not conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": index.name},
+        ).scalar()
+    ]
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "migrate":
+        migrate()
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,5 +1,10 @@
 #!/bin/bash
 set -e
 
+# Build any missing hot-lookup indexes (CONCURRENTLY, no-op once present).
+# A missing performance index is tolerated; the app refuses to start if a
+# unique index an ON CONFLICT relies on is still missing.
+python db_indexes.py migrate || echo "Index migration failed; continuing with existing indexes"
+
 # Start Gunicorn with Uvicorn workers
 exec gunicorn -c gunicorn_conf.py main:app
@@ -3,7 +3,9 @@ import multiprocessing
 
 # Gunicorn config variables
 loglevel = os.getenv("LOG_LEVEL", "info")
-workers = os.getenv("WORKERS", multiprocessing.cpu_count() * 2 + 1)
+workers = int(os.getenv("WEB_CONCURRENCY") or os.getenv("WORKERS") or multiprocessing.cpu_count() * 2 + 1)
+# database.py divides DB_MAX_CONNECTIONS across this many workers.
+os.environ["WEB_CONCURRENCY"] = os.environ["WORKERS"] = str(workers)
 bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
 worker_class = "uvicorn.workers.UvicornWorker"
 keepalive = 120
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+HerCare - incremental cycle and symptom analytics
+
+health_log_stats holds one row of running aggregates per user: log and
+pain totals, mood and bleeding distributions, the days with period logs,
+the cycle starts derived from them and average pain by cycle day. Write
+paths call record() with the logs they removed and added, inside their
+own transaction, so the dashboard reads a single row instead of the
+user's history.
+
+A period log more than PERIOD_GAP_DAYS after the previous one starts a
+new cycle. When a write moves a cycle start (a backdated or deleted period
+log), only the logs of the cycles that start touches are re-read to move
+their pain into the right cycle day. A user's first write builds the row
+from their existing logs once.
+
+Run: python health_analytics.py rebuild
+"""
+
+from bisect import bisect_right
+from datetime import date, datetime
+from statistics import mean
+from sqlalchemy.dialects import postgresql
+from database import SessionLocal
+from models import HealthLog, HealthLogStats, User
+from typing import Iterable, Optional
+import sys
+
+PERIOD_LOG_TYPES = {"period"}
+PERIOD_GAP_DAYS = 2
+MIN_CYCLE_DAYS, MAX_CYCLE_DAYS = 15, 60
+RECENT_CYCLES = 6
+
+SNAPSHOT_FIELDS = ("id", "log_type", "pain_level", "bleeding_level", "mood", "log_date")
+_SNAPSHOT_COLUMNS = [getattr(HealthLog, f) for f in SNAPSHOT_FIELDS]
+
+def snapshot(log) -> dict:
+    """The fields analytics depend on, from a HealthLog, a row or a dict of column values"""
+    if isinstance(log, dict):
+        return {f: log.get(f) for f in SNAPSHOT_FIELDS}
+    return {f: getattr(log, f) for f in SNAPSHOT_FIELDS}
+
+def _bump(counts: dict, key, delta: int):
+    if key is None:
+        return
+    value = counts.get(str(key), 0) + delta
+    if value > 0:
+        counts[str(key)] = value
+    else:
+        counts.pop(str(key), None)
+
+def _cycle_starts(period_days: dict) -> list:
+    starts, previous = [], None
+    for day in sorted(period_days):
+        current = date.fromisoformat(day)
+        if previous is None or (current - previous).days > PERIOD_GAP_DAYS:
+            starts.append(day)
+        previous = current
+    return starts
+
+def _cycle_day(starts: list, day: date) -> Optional[int]:
+    i = bisect_right(starts, day.isoformat())
+    if not i:
+        return None
+    n = (day - date.fromisoformat(starts[i - 1])).days + 1
+    return n if n <= MAX_CYCLE_DAYS else None
+
+def _bump_pain(buckets: dict, starts: list, log: dict, sign: int):
+    day = _cycle_day(starts, log["log_date"]) if log["pain_level"] is not None else None
+    if day is None:
+        return
+    total, count = buckets.get(str(day), (0, 0))
+    total, count = total + sign * log["pain_level"], count + sign
+    if count > 0:
+        buckets[str(day)] = [total, count]
+    else:
+        buckets.pop(str(day), None)
+
+def _apply(stats: HealthLogStats, removed: list, added: list, load_window):
+    """Fold removed/added snapshots into `stats`; load_window(lo, hi, exclude_ids) re-reads moved cycles"""
+    period_days = dict(stats.period_days or {})
+    moods, bleeding = dict(stats.mood_counts or {}), dict(stats.bleeding_counts or {})
+    pain = dict(stats.pain_by_cycle_day or {})
+    old_starts = list(stats.cycle_starts or [])
+
+    for sign, logs in ((-1, removed), (1, added)):
+        for log in logs:
+            stats.log_count = (stats.log_count or 0) + sign
+            if log["pain_level"] is not None:
+                stats.pain_sum = (stats.pain_sum or 0) + sign * log["pain_level"]
+                stats.pain_count = (stats.pain_count or 0) + sign
+            _bump(moods, log["mood"], sign)
+            _bump(bleeding, log["bleeding_level"], sign)
+            if log["log_type"] in PERIOD_LOG_TYPES:
+                _bump(period_days, log["log_date"].isoformat(), sign)
+    new_starts = _cycle_starts(period_days)
+
+    for log in removed:
+        _bump_pain(pain, old_starts, log, -1)
+    if new_starts != old_starts:
+        # Only logs between the first moved start and the next start both lists share change cycle day.
+        changed = sorted(set(old_starts) ^ set(new_starts))
+        shared = set(old_starts) & set(new_starts)
+        hi = next((s for s in new_starts if s in shared and s > changed[-1]), None)
+        exclude = [log["id"] for log in removed + added]
+        for log in load_window(date.fromisoformat(changed[0]), hi and date.fromisoformat(hi), exclude):
+            _bump_pain(pain, old_starts, log, -1)
+            _bump_pain(pain, new_starts, log, 1)
+    for log in added:
+        _bump_pain(pain, new_starts, log, 1)
+
+    lengths = [
+        (date.fromisoformat(b) - date.fromisoformat(a)).days for a, b in zip(new_starts, new_starts[1:])
+    ]
+    recent = [n for n in lengths if MIN_CYCLE_DAYS <= n <= MAX_CYCLE_DAYS][-RECENT_CYCLES:]
+    stats.avg_cycle_length = round(mean(recent), 1) if recent else None
+    stats.last_cycle_start = date.fromisoformat(new_starts[-1]) if new_starts else None
+    stats.period_days, stats.cycle_starts = period_days, new_starts
+    stats.mood_counts, stats.bleeding_counts, stats.pain_by_cycle_day = moods, bleeding, pain
+    stats.updated_at = datetime.utcnow()
+
+def user_snapshots(db, user_id) -> list:
+    """snapshot() of every log `user_id` has, e.g. before moving them to another user"""
+    return [snapshot(row) for row in db.query(*_SNAPSHOT_COLUMNS).filter(HealthLog.user_id == user_id)]
+
+def _rebuild(db, stats: HealthLogStats):
+    stats.log_count = stats.pain_sum = stats.pain_count = 0
+    stats.mood_counts, stats.bleeding_counts, stats.period_days, stats.pain_by_cycle_day = {}, {}, {}, {}
+    stats.cycle_starts = []
+    _apply(stats, [], user_snapshots(db, stats.user_id), lambda lo, hi, exclude: ())
+
+def _locked_stats(db, user_id):
+    table = HealthLogStats.__table__
+    created = db.execute(
+        postgresql.insert(table)
+        .values(user_id=user_id, log_count=0, pain_sum=0, pain_count=0, mood_counts={}, bleeding_counts={},
+                period_days={}, cycle_starts=[], pain_by_cycle_day={})
+        .on_conflict_do_nothing(index_elements=[table.c.user_id])
+    ).rowcount
+    stats = (
+        db.query(HealthLogStats).filter(HealthLogStats.user_id == user_id)
+        .populate_existing().with_for_update().one()
+    )
+    if created:
+        _rebuild(db, stats)
+    return stats, bool(created)
+
+def stats_for(db, user_id) -> HealthLogStats:
+    """The user's row, locked for this transaction; built from their logs if it did not exist"""
+    return _locked_stats(db, user_id)[0]
+
+def record(db, user_id, removed: Iterable = (), added: Iterable = ()):
+    """
+    Account for a write to `user_id`'s logs: the logs as they were before
+    (removed) and are now (added), as snapshot()s or HealthLogs. Call before
+    commit; the pending write is flushed first.
+    """
+    removed, added = [snapshot(log) for log in removed], [snapshot(log) for log in added]
+    db.flush()
+    stats, created = _locked_stats(db, user_id)
+    if created:
+        return  # freshly built from the flushed logs, which already include this write
+
+    def load_window(lo: date, hi: Optional[date], exclude: list):
+        query = db.query(*_SNAPSHOT_COLUMNS).filter(
+            HealthLog.user_id == user_id, HealthLog.log_date >= lo, HealthLog.pain_level.isnot(None),
+        )
+        if hi:
+            query = query.filter(HealthLog.log_date < hi)
+        if exclude:
+            query = query.filter(HealthLog.id.notin_(exclude))
+        return [snapshot(row) for row in query]
+
+    _apply(stats, removed, added, load_window)
+
+def dashboard(stats: HealthLogStats, today: Optional[date] = None) -> dict:
+    today = today or date.today()
+    last_start = stats.last_cycle_start
+    predicted = None
+    if last_start and stats.avg_cycle_length:
+        predicted = date.fromordinal(last_start.toordinal() + round(stats.avg_cycle_length))
+    pain_by_day = {
+        int(day): round(total / count, 1) for day, (total, count) in (stats.pain_by_cycle_day or {}).items() if count
+    }
+    return {
+        "cycle": {
+            "last_period_start": last_start.isoformat() if last_start else None,
+            "current_cycle_day": (today - last_start).days + 1 if last_start and last_start <= today else None,
+            "average_cycle_length": stats.avg_cycle_length,
+            "predicted_next_period": predicted.isoformat() if predicted else None,
+            "cycles_tracked": max(len(stats.cycle_starts or []) - 1, 0),
+        },
+        "symptoms": {
+            "average_pain": round(stats.pain_sum / stats.pain_count, 1) if stats.pain_count else None,
+            "average_pain_by_cycle_day": dict(sorted(pain_by_day.items())),
+            "mood_distribution": stats.mood_counts or {},
+            "bleeding_distribution": stats.bleeding_counts or {},
+        },
+        "statistics": {"health_records": stats.log_count or 0},
+        "updated_at": stats.updated_at.isoformat() if stats.updated_at else None,
+    }
+
+def rebuild_all() -> int:
+    """Recompute every user's row from health_logs, one transaction per user"""
+    with SessionLocal() as db:
+        user_ids = [uid for (uid,) in db.query(User.id).filter(User.health_logs.any())]
+    for user_id in user_ids:
+        with SessionLocal() as db:
+            stats, created = _locked_stats(db, user_id)
+            if not created:
+                _rebuild(db, stats)
+            db.commit()
+    return len(user_ids)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    if command == "rebuild":
+        print(f"Rebuilt analytics for {rebuild_all()} users.")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+HerCare - health metric time series
+
+health_metrics is an append-only table of raw readings (BRIN-indexed on
+recorded_at for time-range maintenance, plus a btree per user and metric
+for reads). Every reading is also folded into health_metric_hourly,
+health_metric_daily and the all-time health_metric_totals with one upsert
+each, in the same transaction.
+
+History reads pick the cheapest source that still gives a useful chart:
+raw points up to RAW_MAX_DAYS, hourly buckets up to HOURLY_MAX_DAYS and
+daily buckets beyond, so a year is at most 366 rows.
+
+Run: python health_metrics.py rebuild   (recompute rollups from raw rows;
+     needed once after upgrading, to fill health_metric_totals and abnormal_count)
+"""
+
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+from database import engine
+from models import HealthMetric, HealthMetricHourly, HealthMetricDaily, HealthMetricTotal
+from typing import Optional
+import sys
+
+RAW_MAX_DAYS = 2
+HOURLY_MAX_DAYS = 31
+ROLLUPS = ((HealthMetricHourly, "hour"), (HealthMetricDaily, "day"), (HealthMetricTotal, "all"))
+ALL_TIME = datetime(1970, 1, 1)  # bucket_start of every health_metric_totals row
+ROLLUP_MODELS = {unit: model for model, unit in ROLLUPS}
+RECENT_LIMIT = 500
+
+NORMAL_RANGES = {
+    "heart_rate": (50, 100),
+    "glucose": (70, 140),
+    "blood_pressure": (90, 140),
+    "temperature": (36.0, 37.8),
+    "oxygen_saturation": (95, 100),
+}
+DIASTOLIC_RANGE = (60, 90)
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, like every other timestamp column"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def is_abnormal(metric_type: str, value: float, secondary_value: Optional[float] = None) -> bool:
+    low, high = NORMAL_RANGES.get(metric_type, (None, None))
+    if low is not None and not low <= value <= high:
+        return True
+    if metric_type == "blood_pressure" and secondary_value is not None:
+        return not DIASTOLIC_RANGE[0] <= secondary_value <= DIASTOLIC_RANGE[1]
+    return False
+
+def bucket_start(moment: datetime, unit: str) -> datetime:
+    if unit == "all":
+        return ALL_TIME
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if unit == "day" else moment
+
+def rollup_upserts(metric: HealthMetric) -> list:
+    """One upsert per rollup table folding `metric` into its bucket"""
+    statements = []
+    for model, unit in ROLLUPS:
+        table = model.__table__
+        statement = postgresql.insert(table).values(
+            user_id=metric.user_id, metric_type=metric.metric_type,
+            bucket_start=bucket_start(metric.recorded_at, unit),
+            count=1, value_sum=metric.value, value_min=metric.value, value_max=metric.value,
+            secondary_sum=metric.secondary_value, secondary_count=int(metric.secondary_value is not None),
+            abnormal_count=int(bool(metric.is_abnormal)),
+        )
+        statements.append(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.metric_type, table.c.bucket_start],
+            set_={
+                "count": table.c.count + 1,
+                "value_sum": table.c.value_sum + statement.excluded.value_sum,
+                "value_min": func.least(table.c.value_min, statement.excluded.value_min),
+                "value_max": func.greatest(table.c.value_max, statement.excluded.value_max),
+                # NULL while no reading had one, like sum() in rebuild_rollups
+                "secondary_sum": func.coalesce(
+                    table.c.secondary_sum + statement.excluded.secondary_sum,
+                    table.c.secondary_sum, statement.excluded.secondary_sum,
+                ),
+                "secondary_count": table.c.secondary_count + statement.excluded.secondary_count,
+                "abnormal_count": table.c.abnormal_count + statement.excluded.abnormal_count,
+            },
+        ))
+    return statements
+
+def resolution(days: int) -> str:
+    if days <= RAW_MAX_DAYS:
+        return "raw"
+    return "hour" if days <= HOURLY_MAX_DAYS else "day"
+
+def history_query(user_id, metric_type: str, days: int, now: Optional[datetime] = None):
+    """(resolution, statement) for the last `days` of one metric, oldest first"""
+    since = (now or datetime.utcnow()) - timedelta(days=days)
+    unit = resolution(days)
+    if unit == "raw":
+        return unit, (
+            select(HealthMetric.recorded_at, HealthMetric.value, HealthMetric.secondary_value, HealthMetric.is_abnormal)
+            .where(HealthMetric.user_id == user_id, HealthMetric.metric_type == metric_type, HealthMetric.recorded_at >= since)
+            .order_by(HealthMetric.recorded_at)
+        )
+    model = ROLLUP_MODELS[unit]
+    return unit, (
+        select(*model.__table__.c)
+        .where(model.user_id == user_id, model.metric_type == metric_type, model.bucket_start >= bucket_start(since, unit))
+        .order_by(model.bucket_start)
+    )
+
+def recent_query(user_id, metric_type: Optional[str], days: int):
+    """Raw readings of the last `days`, newest first, at most RECENT_LIMIT"""
+    statement = select(HealthMetric).where(
+        HealthMetric.user_id == user_id, HealthMetric.recorded_at >= datetime.utcnow() - timedelta(days=days),
+    )
+    if metric_type:
+        statement = statement.where(HealthMetric.metric_type == metric_type)
+    return statement.order_by(HealthMetric.recorded_at.desc()).limit(RECENT_LIMIT)
+
+def totals_query(user_id):
+    """(metric_type, count) of every metric the user has recorded, from the running totals"""
+    return select(HealthMetricTotal.metric_type, HealthMetricTotal.count).where(HealthMetricTotal.user_id == user_id)
+
+def abnormal_share_query(user_id, days: int, now: Optional[datetime] = None):
+    """Readings and abnormal readings in the last `days` and the `days` before, from daily buckets"""
+    now = now or datetime.utcnow()
+    split = bucket_start(now - timedelta(days=days), "day")
+    recent = HealthMetricDaily.bucket_start >= split
+    return select(
+        func.coalesce(func.sum(HealthMetricDaily.count).filter(recent), 0),
+        func.coalesce(func.sum(HealthMetricDaily.abnormal_count).filter(recent), 0),
+        func.coalesce(func.sum(HealthMetricDaily.count).filter(~recent), 0),
+        func.coalesce(func.sum(HealthMetricDaily.abnormal_count).filter(~recent), 0),
+    ).where(
+        HealthMetricDaily.user_id == user_id,
+        HealthMetricDaily.bucket_start >= bucket_start(now - timedelta(days=2 * days), "day"),
+    )
+
+def latest_query(user_id, metric_type: str):
+    return (
+        select(HealthMetric)
+        .where(HealthMetric.user_id == user_id, HealthMetric.metric_type == metric_type)
+        .order_by(HealthMetric.recorded_at.desc())
+        .limit(1)
+    )
+
+def _point(unit: str, row) -> dict:
+    if unit == "raw":
+        point = {"recorded_at": row.recorded_at.isoformat(), "value": row.value, "is_abnormal": bool(row.is_abnormal)}
+        if row.secondary_value is not None:
+            point["secondary_value"] = row.secondary_value
+        return point
+    point = {
+        "bucket_start": row.bucket_start.isoformat(), "count": row.count,
+        "average": round(row.value_sum / row.count, 2), "min": row.value_min, "max": row.value_max,
+    }
+    if row.secondary_count:
+        point["secondary_average"] = round(row.secondary_sum / row.secondary_count, 2)
+    return point
+
+def statistics(unit: str, rows: list) -> dict:
+    if not rows:
+        return {"count": 0, "average": None, "minimum": None, "maximum": None, "trend": None}
+    if unit == "raw":
+        sums = [(row.value, 1) for row in rows]
+        low, high = min(row.value for row in rows), max(row.value for row in rows)
+    else:
+        sums = [(row.value_sum, row.count) for row in rows]
+        low, high = min(row.value_min for row in rows), max(row.value_max for row in rows)
+    def average(part):
+        count = sum(n for _, n in part)
+        return sum(total for total, _ in part) / count if count else None
+    first, last = average(sums[: len(sums) // 2]), average(sums[len(sums) // 2:])
+    trend = "stable"
+    if first and last and abs(last - first) > abs(first) * 0.02:
+        trend = "increasing" if last > first else "decreasing"
+    return {
+        "count": sum(n for _, n in sums), "average": round(average(sums), 2),
+        "minimum": low, "maximum": high, "trend": trend,
+    }
+
+def vital_sign(metric_type: str, latest: Optional[HealthMetric], trend: Optional[str]) -> dict:
+    """Dashboard summary of one metric: latest reading, unit, status and trend"""
+    if latest is None:
+        return {"latest": None, "unit": None, "status": None, "trend": None, "recorded_at": None}
+    value = latest.value
+    if metric_type == "blood_pressure" and latest.secondary_value is not None:
+        value = f"{latest.value:g}/{latest.secondary_value:g} {latest.unit}"
+    return {
+        "latest": value,
+        "unit": latest.unit,
+        "status": "Abnormal" if latest.is_abnormal else "Normal",
+        "trend": trend,
+        "recorded_at": latest.recorded_at.isoformat(),
+    }
+
+def history_response(metric_type: str, days: int, unit: str, rows: list, latest: Optional[HealthMetric]) -> dict:
+    return {
+        "metric_type": metric_type,
+        "period_days": days,
+        "resolution": unit,
+        "unit": latest.unit if latest else None,
+        "latest": metric_response(latest) if latest else None,
+        "records": [_point(unit, row) for row in rows],
+        "statistics": statistics(unit, rows),
+    }
+
+def metric_response(metric: HealthMetric) -> dict:
+    response = {
+        "metric_id": str(metric.id),
+        "metric_type": metric.metric_type,
+        "value": metric.value,
+        "unit": metric.unit,
+        "recorded_at": metric.recorded_at.isoformat(),
+        "is_abnormal": bool(metric.is_abnormal),
+    }
+    if metric.metric_type == "blood_pressure" and metric.secondary_value is not None:
+        response["systolic"], response["diastolic"] = metric.value, metric.secondary_value
+    elif metric.secondary_value is not None:
+        response["secondary_value"] = metric.secondary_value
+    return response
+
+def rebuild_rollups():
+    """Recompute every rollup table from health_metrics (Postgres)"""
+    with engine.begin() as conn:
+        for model, unit in ROLLUPS:
+            table = model.__tablename__
+            bucket = f"'{ALL_TIME.isoformat()}'::timestamp" if unit == "all" else f"date_trunc('{unit}', recorded_at)"
+            conn.execute(text(f"DELETE FROM {table}"))
+            conn.execute(text(
+                f"""
+                INSERT INTO {table} (user_id, metric_type, bucket_start, count, value_sum, value_min, value_max,
+                                     secondary_sum, secondary_count, abnormal_count)
+                SELECT user_id, metric_type, {bucket}, count(*), sum(value), min(value),
+                       max(value), sum(secondary_value), count(secondary_value), count(*) FILTER (WHERE is_abnormal)
+                FROM health_metrics
+                GROUP BY 1, 2, 3
+                """
+            ))
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    if command == "rebuild":
+        rebuild_rollups()
+        print("Rebuilt hourly, daily and all-time rollups.")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,277 @@
+# ════════════════════════════════════
+# Idempotency-Key support for POST requests
+# ════════════════════════════════════
+
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects import postgresql
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from uploads import parse_options_header
+from database import engine
+from models import IdempotencyKey
+from auth import decode_token
+from typing import Iterable, Optional
+import asyncio
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger("hercare.idempotency")
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_LOCK_SECONDS = 300  # a reservation older than this belongs to a dead worker
+MAX_HASHED_BODY = 1024 * 1024
+MAX_STORED_RESPONSE = 1024 * 1024
+POLL_INTERVAL = 0.1  # first wait for a pending key, doubling up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 1.0
+
+_table = IdempotencyKey.__table__
+
+def _caller(headers: Headers) -> Optional[str]:
+    """The token's subject, so a refreshed token still replays; None without a valid token"""
+    authorization = headers.get("authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        claims = decode_token(authorization[7:])
+    except Exception:
+        return None
+    subject = claims.get("sub") or claims.get("user_id")
+    return f"user:{subject}" if subject else None
+
+def _state(row, fingerprint: str):
+    if row.fingerprint != fingerprint:
+        return "mismatch", None
+    return ("pending", None) if row.status_code is None else ("done", row)
+
+def reserve(key: str, fingerprint: str):
+    """
+    Claim `key` for a first execution. Returns ("new", None), ("pending", None),
+    ("mismatch", None) or ("done", row) for a completed earlier request.
+    """
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(delete(_table).where(
+            _table.c.key == key,
+            or_(
+                _table.c.expires_at < now,
+                and_(_table.c.status_code.is_(None), _table.c.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)),
+            ),
+        ))
+        claimed = conn.execute(
+            postgresql.insert(_table)
+            .values(key=key, fingerprint=fingerprint, created_at=now,
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS))
+            .on_conflict_do_nothing(index_elements=[_table.c.key])
+        ).rowcount
+        if claimed:
+            return "new", None
+        row = conn.execute(select(_table).where(_table.c.key == key)).first()
+    if row is None:
+        return "pending", None
+    return _state(row, fingerprint)
+
+def poll(key: str, fingerprint: str):
+    """reserve()'s answer for a key seen pending: a plain SELECT, reserving only if the row is gone"""
+    with engine.connect() as conn:
+        row = conn.execute(select(_table).where(_table.c.key == key)).first()
+    if row is None:
+        return reserve(key, fingerprint)
+    return _state(row, fingerprint)
+
+def complete(key: str, status_code: int, headers: list, body: bytes, body_sha256: Optional[str] = None):
+    with engine.begin() as conn:
+        conn.execute(update(_table).where(_table.c.key == key).values(
+            status_code=status_code, headers=headers, body=body, body_sha256=body_sha256,
+        ))
+
+def release(key: str):
+    """Forget a reservation so the next retry runs the request again"""
+    with engine.begin() as conn:
+        conn.execute(delete(_table).where(_table.c.key == key, _table.c.status_code.is_(None)))
+
+def purge_expired() -> int:
+    with engine.begin() as conn:
+        return conn.execute(delete(_table).where(_table.c.expires_at < datetime.utcnow())).rowcount
+
+class IdempotencyMiddleware:
+    """
+    POSTs to `paths` carrying an Idempotency-Key run at most once per
+    authenticated user and key. Requests without a valid bearer token pass
+    through untouched, and so does every other route, so login and
+    register bodies and their tokens are never stored.
+
+    The first request reserves the key in idempotency_keys and its response
+    (below 500, up to MAX_STORED_RESPONSE) is stored. Retries replay it with
+    an Idempotent-Replayed header. A retry arriving while the first request
+    still runs waits for it, then gets 409 with Retry-After. Reusing a key
+    for a different request gets 422.
+
+    Multipart and large bodies are never buffered, so uploads keep
+    streaming: they are hashed as the app reads them and the digest is
+    stored with the response. A retry's body is read and hashed the same
+    way before the stored response is replayed.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        client_key = headers.get("idempotency-key")
+        caller = _caller(headers) if client_key else None
+        if not caller:
+            return await self.app(scope, receive, send)
+        if len(client_key) > 255:
+            return await JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)(scope, receive, send)
+
+        fingerprint = hashlib.sha256(f"{scope['method']} {scope['path']}?{scope['query_string'].decode()}".encode())
+        content_length = headers.get("content-length", "")
+        digest = None
+        if (
+            content_length.isdigit() and int(content_length) <= MAX_HASHED_BODY
+            and not headers.get("content-type", "").startswith("multipart/")
+        ):
+            body, more = b"", True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body += message.get("body", b"")
+                more = message.get("more_body", False)
+            fingerprint.update(b"\0" + body)
+            receive = _replay_body(body, receive)
+        else:
+            digest = _BodyDigest(headers.get("content-type", ""))
+
+        key = hashlib.sha256(f"{caller}\0{client_key}".encode()).hexdigest()
+        state, row = await asyncio.to_thread(reserve, key, fingerprint.hexdigest())
+        waited, interval = 0.0, POLL_INTERVAL
+        while state == "pending" and waited < IDEMPOTENCY_WAIT_SECONDS:
+            await asyncio.sleep(interval)
+            waited += interval
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+            state, row = await asyncio.to_thread(poll, key, fingerprint.hexdigest())
+
+        if state == "done" and row.body_sha256 and digest is not None:
+            if not await digest.drain(receive):
+                return
+            if digest.hexdigest() != row.body_sha256:
+                state = "mismatch"
+        if state == "done":
+            return await _replay(row, send)
+        if state == "mismatch":
+            return await JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"}, status_code=422,
+            )(scope, receive, send)
+        if state == "pending":
+            return await JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+                status_code=409, headers={"Retry-After": "1"},
+            )(scope, receive, send)
+
+        if digest is not None:
+            receive = digest.hashing(receive)
+        await self._run_once(key, scope, receive, send, digest)
+
+    async def _run_once(self, key, scope, receive, send, digest=None):
+        start, chunks, size = None, [], 0
+
+        async def capture(message):
+            nonlocal start, size
+            if message["type"] == "http.response.start":
+                # Copied: outer middleware (gzip) rewrites the headers in place.
+                start = {"status": message["status"], "headers": list(message.get("headers", []))}
+            elif message["type"] == "http.response.body" and size <= MAX_STORED_RESPONSE:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            await asyncio.to_thread(release, key)
+            raise
+        if start is None or start["status"] >= 500 or size > MAX_STORED_RESPONSE:
+            await asyncio.to_thread(release, key)
+            return
+        stored_headers = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in start["headers"]]
+        # Only a body the app read to the end can be compared against a retry's.
+        body_sha256 = digest.hexdigest() if digest is not None and digest.finished else None
+        try:
+            await asyncio.to_thread(complete, key, start["status"], stored_headers, b"".join(chunks), body_sha256)
+        except Exception as e:
+            logger.warning("could not store idempotent response: %s", e)
+            await asyncio.to_thread(release, key)
+
+class _BodyDigest:
+    """
+    SHA-256 of a streamed request body. The multipart boundary is left out:
+    clients pick a fresh random one per attempt, so it would make every
+    retry of the same upload look like a different request.
+    """
+
+    def __init__(self, content_type: str):
+        self.sha256 = hashlib.sha256()
+        _, options = parse_options_header(content_type)
+        self.boundary = options.get(b"boundary", b"")
+        self.tail = b""
+        self.finished = False
+
+    def update(self, chunk: bytes):
+        data = self.tail + chunk
+        if self.boundary:
+            data = data.replace(self.boundary, b"")
+            # Hold back what could be the start of a boundary split across chunks.
+            keep = len(self.boundary) - 1
+            cut = max(0, len(data) - keep)
+            data, self.tail = data[:cut], data[cut:]
+        self.sha256.update(data)
+
+    def hexdigest(self) -> str:
+        self.sha256.update(self.tail)
+        self.tail = b""
+        return self.sha256.hexdigest()
+
+    def _consume(self, message):
+        if message["type"] == "http.request":
+            self.update(message.get("body", b""))
+            if not message.get("more_body", False):
+                self.finished = True
+
+    def hashing(self, receive):
+        async def wrapped():
+            message = await receive()
+            self._consume(message)
+            return message
+        return wrapped
+
+    async def drain(self, receive) -> bool:
+        """Read and hash the rest of the body; False if the client went away"""
+        while not self.finished:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return False
+            self._consume(message)
+        return True
+
+def _replay_body(body: bytes, receive):
+    sent = False
+    async def replay():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+    return replay
+
+async def _replay(row, send):
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in row.headers or []]
+    headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": row.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": row.body or b""})
@@ -0,0 +1,107 @@
+# ════════════════════════════════════
+# Cross-worker cache invalidation (Postgres LISTEN/NOTIFY)
+# ════════════════════════════════════
+
+from sqlalchemy import text
+from database import engine
+from cache import CACHES
+from typing import Callable
+import json
+import logging
+import select
+import threading
+
+logger = logging.getLogger("hercare.invalidation")
+
+CHANNEL = "hercare_cache_invalidation"
+
+_handlers: dict[str, list[Callable[[str], None]]] = {}
+_listener: threading.Thread = None
+_stop = threading.Event()
+
+def subscribe(topic: str, handler: Callable[[str], None]):
+    """Call handler(key) whenever any worker publishes `key` on `topic`"""
+    _handlers.setdefault(topic, []).append(handler)
+
+def _dispatch(topic: str, key: str):
+    for handler in _handlers.get(topic, []):
+        try:
+            handler(key)
+        except Exception as e:
+            logger.warning("invalidation handler for %s failed: %s", topic, e)
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+def publish(topic: str, key: str):
+    """
+    Evict `key` locally, then NOTIFY every other worker and instance.
+
+    Call after the write has committed so listeners never reload stale rows.
+    """
+    key = str(key)
+    _dispatch(topic, key)
+    if not _is_postgres():
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": json.dumps({"topic": topic, "key": key})},
+            )
+    except Exception as e:
+        # The TTL on every cache bounds staleness if a notification is lost.
+        logger.warning("cache invalidation publish failed for %s:%s: %s", topic, key, e)
+
+def _listen_forever():
+    backoff = 1.0
+    reconnecting = False
+    while not _stop.is_set():
+        pooled = None
+        try:
+            # Dedicated connection, detached from the pool so it never counts as checked out.
+            pooled = engine.raw_connection()
+            conn = pooled.driver_connection  # detach() drops the record this is read from
+            pooled.detach()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            if reconnecting:
+                # Notifications sent while we were disconnected are gone.
+                for cache in CACHES.values():
+                    cache.clear()
+            backoff = 1.0
+            while not _stop.is_set():
+                if select.select([conn], [], [], 5.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(note.payload)
+                        _dispatch(payload["topic"], payload["key"])
+                    except (ValueError, KeyError):
+                        logger.warning("ignoring malformed invalidation payload: %r", note.payload)
+        except Exception as e:
+            logger.warning("cache invalidation listener error, reconnecting in %.0fs: %s", backoff, e)
+            reconnecting = True
+            _stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+        finally:
+            if pooled is not None:
+                try:
+                    pooled.close()
+                except Exception:
+                    pass
+
+def start_listener():
+    """Start this worker's LISTEN thread (no-op off Postgres or if already running)"""
+    global _listener
+    if not _is_postgres() or (_listener and _listener.is_alive()):
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen_forever, name="cache-invalidation", daemon=True)
+    _listener.start()
+
+def stop_listener():
+    _stop.set()
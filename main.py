@@ -1,26 +1,46 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Request, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from database import get_db, engine
-from models import User, HealthLog, PregnancyProfile, DoctorProfile, DoctorPatientLink, MedicalReport, Medication, DietPlan, EmergencyRequest, Consultation, MedicalHistory, UserRole, Role, Appointment
-from auth import create_token_with_roles, verify_password, hash_password, get_client_ip, get_current_user
-from audit import AuditService
+from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import text, func
+from sqlalchemy.dialects import postgresql
+from database import get_db, get_read_db, SessionLocal, engine, async_engine, log_pool_status, pool_capacity, PRIMARY_POOL, write_marker, READ_YOUR_WRITES_HEADER, READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS
+from models import User, HealthLog, PregnancyProfile, DoctorProfile, DoctorPatientLink, MedicalReport, Medication, DietPlan, EmergencyRequest, Consultation, MedicalHistory, UserRole, Role, Appointment, Blob, IdempotencyKey, HealthLogStats, HealthMetric, HealthMetricHourly, HealthMetricDaily, HealthMetricTotal
+from auth import create_token_with_roles, hash_password, hash_password_async, verify_password_async, password_needs_rehash, decode_token, get_client_ip, get_current_user
+from audit import AuditService, audit_writer
+from pagination import NEXT_CURSOR_HEADER, keyset_page, parse_fields
+from resolvers import DirectoryResolver
+from blobstore import blob_store, decode_inline_file, encode_inline_file
+from uploads import receive_upload
+from thumbnails import THUMBNAIL_KIND, source_kind, thumbnail_worker
+from rbac import resolve_user_roles
+from idempotency import IdempotencyMiddleware
+import invalidation
+import audit_partitions
+import blob_refs
+import db_indexes
+import idempotency
+import health_analytics
 from routes_admin import router as admin_router
 from routes_doctor_phase3 import router as doctor_router
 from routes_telemedicine_phase4 import router as tele_router
 from routes_analytics_phase5 import router as analytics_router
+from anyio import to_thread
 from jose import jwt, JWTError
 import bcrypt
-from pydantic import BaseModel
-from datetime import date, datetime, timedelta
+from pydantic import BaseModel, ValidationError
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
 from typing import Optional, List
-import uuid, os, random, string
+from email.utils import format_datetime, parsedate_to_datetime
+import uuid, os, random, string, asyncio, logging, hashlib, math
 
 load_dotenv()
 
+logger = logging.getLogger("hercare")
+
 app = FastAPI(title="HerCare API")
 
 # ────── Routers ──────
@@ -55,6 +75,14 @@ extra_allowed_origins = [
     if origin.strip()
 ]
 
+# Create endpoints that flaky mobile networks retry; auth routes are deliberately absent.
+IDEMPOTENT_POSTS = (
+    "/emergency", "/consultations", "/medications", "/reports", "/reports/upload",
+    "/health-logs", "/health-logs/bulk", "/api/v1/analytics/health-metrics",
+)
+
+# Innermost, so replayed responses still get CORS headers and compression.
+app.add_middleware(IdempotencyMiddleware, paths=IDEMPOTENT_POSTS)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=list(dict.fromkeys(default_allowed_origins + extra_allowed_origins)),
@@ -65,9 +93,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Idempotent-Replayed", READ_YOUR_WRITES_HEADER],
 )
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+@app.middleware("http")
+async def track_recent_writes(request: Request, call_next):
+    """Hand authenticated writers a signed write marker; get_read_db routes them to the primary while it is fresh."""
+    request.state.user_id = None
+    authorization = request.headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        try:
+            claims = decode_token(authorization[7:])
+            request.state.user_id = claims.get("sub") or claims.get("user_id")
+        except Exception:
+            pass
+    response = await call_next(request)
+    if request.method in WRITE_METHODS and response.status_code < 400 and request.state.user_id:
+        marker = write_marker(request.state.user_id)
+        response.headers[READ_YOUR_WRITES_HEADER] = marker
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE, marker, max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+            httponly=True, secure=True, samesite="none",
+        )
+    return response
+
 
 @app.on_event("startup")
 def run_startup_migrations():
@@ -124,6 +176,27 @@ def run_startup_migrations():
                 """
             )
         )
+        conn.execute(
+            text(
+                """
+                ALTER TABLE medical_reports
+                ADD COLUMN IF NOT EXISTS blob_key VARCHAR,
+                ADD COLUMN IF NOT EXISTS file_size INTEGER,
+                ADD COLUMN IF NOT EXISTS content_type VARCHAR
+                """
+            )
+        )
+        conn.execute(text("ALTER TABLE files ADD COLUMN IF NOT EXISTS blob_key VARCHAR"))
+        conn.execute(text("ALTER TABLE health_logs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP"))
+        conn.execute(text("ALTER TABLE health_logs ADD COLUMN IF NOT EXISTS client_key VARCHAR"))
+        Blob.__table__.create(bind=conn, checkfirst=True)
+        IdempotencyKey.__table__.create(bind=conn, checkfirst=True)
+        conn.execute(text("ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS body_sha256 VARCHAR"))
+        HealthLogStats.__table__.create(bind=conn, checkfirst=True)
+        for table in (HealthMetric.__table__, HealthMetricHourly.__table__, HealthMetricDaily.__table__, HealthMetricTotal.__table__):
+            table.create(bind=conn, checkfirst=True)
+        for table in ("health_metric_hourly", "health_metric_daily"):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS abnormal_count INTEGER NOT NULL DEFAULT 0"))
         # Expand allowed user roles for admin accounts.
         conn.execute(text("ALTER TABLE users DROP CONSTRAINT IF EXISTS users_role_check"))
         conn.execute(
@@ -146,14 +219,91 @@ def run_startup_migrations():
             )
         )
 
+DB_POOL_LOG_INTERVAL = int(os.getenv("DB_POOL_LOG_INTERVAL", "300"))
+
+@app.on_event("startup")
+def check_required_indexes():
+    """Refuse to serve when a unique index an ON CONFLICT relies on is missing"""
+    with engine.connect() as conn:
+        missing = db_indexes.missing_required(conn)
+    if missing:
+        raise RuntimeError(f"Missing unique indexes {', '.join(missing)}; run `python db_indexes.py migrate`")
+
+async def _pool_status_logger():
+    while True:
+        await asyncio.sleep(DB_POOL_LOG_INTERVAL)
+        log_pool_status()
+
+@app.on_event("startup")
+async def start_pool_status_logger():
+    if DB_POOL_LOG_INTERVAL > 0:
+        app.state.pool_logger = asyncio.create_task(_pool_status_logger())
+
+@app.on_event("startup")
+async def size_threadpool():
+    """One threadpool thread per primary pool connection, so sync routes never wait on checkout"""
+    to_thread.current_default_thread_limiter().total_tokens = pool_capacity(PRIMARY_POOL)
+
+@app.on_event("startup")
+def start_cache_invalidation_listener():
+    invalidation.start_listener()
+
+AUDIT_PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("AUDIT_PARTITION_MAINTENANCE_INTERVAL", "86400"))
+
+async def _audit_partition_maintenance():
+    while True:
+        try:
+            await asyncio.to_thread(audit_partitions.maintenance)
+        except Exception as e:
+            logger.warning("Audit partition maintenance failed: %s", e)
+        await asyncio.sleep(AUDIT_PARTITION_MAINTENANCE_INTERVAL)
+
+@app.on_event("startup")
+async def start_audit_partition_maintenance():
+    app.state.audit_partition_maintenance = asyncio.create_task(_audit_partition_maintenance())
+
+BLOB_GC_INTERVAL = int(os.getenv("BLOB_GC_INTERVAL", "3600"))
+
+async def _blob_garbage_collector():
+    while True:
+        await asyncio.sleep(BLOB_GC_INTERVAL)
+        try:
+            await asyncio.to_thread(blob_refs.collect_garbage)
+        except Exception as e:
+            logger.warning("Blob garbage collection failed: %s", e)
+
+@app.on_event("startup")
+async def start_blob_garbage_collector():
+    if BLOB_GC_INTERVAL > 0:
+        app.state.blob_gc = asyncio.create_task(_blob_garbage_collector())
+
+async def _idempotency_key_purger():
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            await asyncio.to_thread(idempotency.purge_expired)
+        except Exception as e:
+            logger.warning("Idempotency key purge failed: %s", e)
+
+@app.on_event("startup")
+async def start_idempotency_key_purger():
+    app.state.idempotency_purge = asyncio.create_task(_idempotency_key_purger())
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    invalidation.stop_listener()
+    await asyncio.to_thread(audit_writer.flush)
+    for task_name in ("pool_logger", "audit_partition_maintenance", "blob_gc", "idempotency_purge"):
+        task = getattr(app.state, task_name, None)
+        if task:
+            task.cancel()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 # ────── JWT Security ──────
 SECRET_KEY = os.getenv("SECRET_KEY", "hercare-fallback-secret")
 ALGORITHM = "HS256"
 
-def check_password_compat(password: str, hashed: str) -> bool:
-    """Compatibility function for existing code"""
-    return verify_password(password, hashed)
-
 def create_token_compat(user_id: str, name: str, role: str) -> str:
     """Compatibility function for existing code"""
     return create_token_with_roles(str(user_id), name, [role])
@@ -163,8 +313,7 @@ def verify_token(authorization: str) -> dict:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     try:
-        from auth import SECRET_KEY as AUTH_SECRET_KEY
-        payload = jwt.decode(authorization[7:], AUTH_SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(authorization[7:])
         # Keep both keys for backward compatibility across older/newer endpoints.
         if "sub" not in payload and "user_id" in payload:
             payload["sub"] = payload["user_id"]
@@ -183,6 +332,13 @@ class HealthLogCreate(BaseModel):
     mood: str = "neutral"
     notes: str = ""
 
+class HealthLogBulkItem(HealthLogCreate):
+    client_key: Optional[str] = None
+    log_date: Optional[date] = None
+
+class HealthLogBulk(BaseModel):
+    logs: List[dict]
+
 class HealthLogUpdate(BaseModel):
     log_type: str | None = None
     pain_level: int | None = None
@@ -223,15 +379,48 @@ def home():
     return {"message": "HerCare API Running"}
 
 # ────── Auth ──────
+# Login and register are async so bcrypt is awaited off the request threadpool;
+# their DB work runs in short sessions before and after it, so no pool
+# connection is held while a password is hashed.
+def _email_registered(email: str) -> bool:
+    with SessionLocal() as db:
+        return db.query(User.id).filter(User.email == email).first() is not None
+
+def _create_user(name: str, email: str, password_hash: str, age: int, role: str) -> dict:
+    with SessionLocal() as db:
+        user = User(id=uuid.uuid4(), name=name, email=email, password_hash=password_hash, age=age, role=role)
+        db.add(user); db.commit(); db.refresh(user)
+
+        # Assign default role
+        default_role = db.query(Role).filter(Role.name == role).first()
+        if default_role:
+            user_role = UserRole(
+                id=uuid.uuid4(),
+                user_id=user.id,
+                role_id=default_role.id
+            )
+            db.add(user_role)
+            db.commit()
+
+        token = create_token_compat(str(user.id), user.name or "User", user.role or "patient")
+        return {
+            "message": "User registered",
+            "id": str(user.id),
+            "name": user.name or "User",
+            "email": user.email,
+            "age": user.age,
+            "role": user.role or "patient",
+            "access_token": token
+        }
+
 @auth_router.post("/register", status_code=201)
-def register(
+async def register(
     user_data: Optional[UserRegister] = None,
     name: Optional[str] = None,
     email: Optional[str] = None,
     password: Optional[str] = None,
     age: Optional[int] = None,
     role: Optional[str] = None,
-    db: Session = Depends(get_db)
 ):
     # Handle both JSON body and query parameters
     if user_data:
@@ -251,46 +440,59 @@ def register(
     if not email or not password:
         raise HTTPException(status_code=400, detail="Email and password required")
     
-    if db.query(User).filter(User.email == email).first():
+    if await run_in_threadpool(_email_registered, email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    user = User(id=uuid.uuid4(), name=name, email=email, password_hash=hash_password(password), age=age, role=role)
-    db.add(user); db.commit(); db.refresh(user)
-    
-    # Assign default role
-    default_role = db.query(Role).filter(Role.name == role).first()
-    if default_role:
-        user_role = UserRole(
-            id=uuid.uuid4(),
-            user_id=user.id,
-            role_id=default_role.id
+    password_hash = await hash_password_async(password)
+    return await run_in_threadpool(_create_user, name, email, password_hash, age, role)
+
+def _login_credentials(email: str):
+    with SessionLocal() as db:
+        return db.query(User.id, User.password_hash).filter(User.email == email).first()
+
+def _complete_login(user_id, new_password_hash: Optional[str], ip: Optional[str]) -> dict:
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.id == user_id).first()
+        if new_password_hash:
+            user.password_hash = new_password_hash
+            db.commit()
+
+        # Get user roles
+        roles, _ = resolve_user_roles(user.id, db)
+        if user.role and user.role not in roles:
+            roles.append(user.role)
+
+        # Audit successful login
+        AuditService.log_login(
+            db=db,
+            user_id=str(user.id),
+            ip_address=ip,
+            status="success",
+            details=f"Logged in with roles: {', '.join(roles)}"
         )
-        db.add(user_role)
-        db.commit()
-    
-    token = create_token_compat(str(user.id), user.name or "User", user.role or "patient")
-    return {
-        "message": "User registered",
-        "id": str(user.id),
-        "name": user.name or "User",
-        "email": user.email,
-        "age": user.age,
-        "role": user.role or "patient",
-        "access_token": token
-    }
+
+        return {
+            "message": "Login successful",
+            "id": str(user.id),
+            "name": user.name,
+            "email": user.email,
+            "role": user.role,
+            "roles": roles,
+            "access_token": create_token_with_roles(str(user.id), user.name, roles)
+        }
 
 @auth_router.post("/login")
-def login(credentials: UserLogin, request: Request = None, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, request: Request = None):
+    """Login endpoint with role support and audit logging"""
     email = credentials.email
     password = credentials.password
-    """Login endpoint with role support and audit logging"""
-    user = db.query(User).filter(User.email == email).first()
+    ip = get_client_ip(request) if request else None
+    found = await run_in_threadpool(_login_credentials, email)
     
-    if not user or not user.password_hash or not check_password_compat(password, user.password_hash):
+    if not found or not found.password_hash or not await verify_password_async(password, found.password_hash):
         # Audit failed login
-        ip = get_client_ip(request) if request else None
         AuditService.log(
-            db=db,
+            db=None,
             user_id=None,
             action="login_attempt",
             resource_type="user",
@@ -300,31 +502,12 @@ def login(credentials: UserLogin, request: Request = None, db: Session = Depends
         )
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    # Get user roles
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user.id).all()
-    roles = [db.query(Role).filter(Role.id == ur.role_id).first().name for ur in user_roles]
-    if user.role and user.role not in roles:
-        roles.append(user.role)
-    
-    # Audit successful login
-    ip = get_client_ip(request) if request else None
-    AuditService.log_login(
-        db=db,
-        user_id=str(user.id),
-        ip_address=ip,
-        status="success",
-        details=f"Logged in with roles: {', '.join(roles)}"
-    )
-    
-    return {
-        "message": "Login successful",
-        "id": str(user.id),
-        "name": user.name,
-        "email": user.email,
-        "role": user.role,
-        "roles": roles,
-        "access_token": create_token_with_roles(str(user.id), user.name, roles)
-    }
+    # Transparently upgrade hashes made with an older BCRYPT_ROUNDS.
+    new_password_hash = None
+    if password_needs_rehash(found.password_hash):
+        new_password_hash = await hash_password_async(password)
+
+    return await run_in_threadpool(_complete_login, found.id, new_password_hash, ip)
 
 # ────── User ──────
 @user_router.get("/profile")
@@ -517,27 +700,50 @@ def get_my_doctor(patient_id: str, authorization: str = Header(...), db: Session
     link = db.query(DoctorPatientLink).filter(DoctorPatientLink.patient_id == uuid.UUID(patient_id)).first()
     if not link:
         return {"linked": False}
-    doctor = db.query(User).filter(User.id == link.doctor_id).first()
-    doc_profile = db.query(DoctorProfile).filter(DoctorProfile.user_id == link.doctor_id).first()
+    doctor, doc_profile = DirectoryResolver(db).doctors([link.doctor_id])[link.doctor_id]
     return {"linked": True, "doctor_id": str(link.doctor_id), "doctor_name": doctor.name if doctor else "Doctor",
             "specialization": doc_profile.specialization if doc_profile else None,
             "hospital": doc_profile.hospital if doc_profile else None}
 
+MY_PATIENTS_FIELDS = ("patient_id", "name", "age", "pregnancy_type", "gestational_weeks", "share_code")
+
 @app.get("/my-patients/{doctor_id}")
-def get_my_patients(doctor_id: str, authorization: str = Header(...), db: Session = Depends(get_db)):
+def get_my_patients(
+    doctor_id: str,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    authorization: str = Header(...),
+    db: Session = Depends(get_read_db),
+):
     verify_token(authorization)
-    links = db.query(DoctorPatientLink).filter(DoctorPatientLink.doctor_id == uuid.UUID(doctor_id)).all()
+    wanted = parse_fields(fields, MY_PATIENTS_FIELDS)
+    # One outer-joined query for the whole panel; pregnancy_profiles.user_id is unique so rows don't fan out.
+    query = (
+        db.query(
+            DoctorPatientLink.id, DoctorPatientLink.patient_id, DoctorPatientLink.share_code,
+            User.name, User.age, PregnancyProfile.pregnancy_type, PregnancyProfile.last_period_date,
+        )
+        .outerjoin(User, User.id == DoctorPatientLink.patient_id)
+        .outerjoin(PregnancyProfile, PregnancyProfile.user_id == DoctorPatientLink.patient_id)
+        .filter(DoctorPatientLink.doctor_id == _parse_uuid_or_400(doctor_id, "doctor_id"))
+    )
+    rows, next_cursor = keyset_page(query, [DoctorPatientLink.id], [uuid.UUID], cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    today = date.today()
     patients = []
-    for link in links:
-        patient = db.query(User).filter(User.id == link.patient_id).first()
-        pregnancy = db.query(PregnancyProfile).filter(PregnancyProfile.user_id == link.patient_id).first()
-        patients.append({
-            "patient_id": str(link.patient_id), "name": patient.name if patient else "Patient",
-            "age": patient.age if patient else None,
-            "pregnancy_type": pregnancy.pregnancy_type if pregnancy else None,
-            "gestational_weeks": ((date.today() - pregnancy.last_period_date).days // 7) if pregnancy else None,
-            "share_code": link.share_code
-        })
+    for row in rows:
+        patient = {
+            "patient_id": str(row.patient_id), "name": row.name or "Patient",
+            "age": row.age,
+            "pregnancy_type": row.pregnancy_type,
+            "gestational_weeks": ((today - row.last_period_date).days // 7) if row.last_period_date else None,
+            "share_code": row.share_code
+        }
+        patients.append({k: patient[k] for k in wanted})
     return patients
 
 # ════════════════════════════════════
@@ -567,11 +773,11 @@ def get_my_doctors_list(authorization: str = Header(...), db: Session = Depends(
     payload = verify_token(authorization)
     user_id = uuid.UUID(payload["sub"])
     links = db.query(DoctorPatientLink).filter(DoctorPatientLink.patient_id == user_id).all()
+    doctors = DirectoryResolver(db).doctors(link.doctor_id for link in links)
     
     result = []
     for link in links:
-        doc = db.query(User).filter(User.id == link.doctor_id).first()
-        profile = db.query(DoctorProfile).filter(DoctorProfile.user_id == link.doctor_id).first()
+        doc, profile = doctors[link.doctor_id]
         result.append({
             "doctor_id": str(link.doctor_id),
             "doctor_name": doc.name if doc else "Unknown",
@@ -669,23 +875,58 @@ def create_report(body: ReportCreate, authorization: str = Header(...), db: Sess
         require_report_permission=True,
     )
 
+    blob_key = file_size = content_type = None
+    if body.file_data:
+        try:
+            data, content_type = decode_inline_file(body.file_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        blob_key, file_size = hashlib.sha256(data).hexdigest(), len(data)
+
     # Ignore client-provided uploaded_by to prevent spoofing.
     report = MedicalReport(
         id=uuid.uuid4(), patient_id=patient_id, uploaded_by=requester.id,
         title=body.title, report_type=body.report_type, notes=body.notes,
-        file_data=body.file_data, file_name=body.file_name
+        file_name=body.file_name, blob_key=blob_key, file_size=file_size, content_type=content_type
     )
-    db.add(report); db.commit(); db.refresh(report)
+    db.add(report)
+    if blob_key:
+        # Written under the blob's lock (see blob_refs) so the collector cannot remove it before commit.
+        blob_refs.acquire(db, blob_key, file_size, content_type)
+        blob_store.put(data)
+    db.commit(); db.refresh(report)
+    if blob_key:
+        thumbnail_worker.submit(blob_key, content_type)
     return {"id": str(report.id), "title": report.title, "report_type": report.report_type,
             "notes": report.notes, "file_name": report.file_name, "created_at": str(report.created_at)}
 
+def _report_inline_data(report: MedicalReport) -> Optional[str]:
+    """Base64 payload for include_data callers, from the blob store or a not-yet-migrated row"""
+    if not report.blob_key:
+        return report.file_data
+    try:
+        return encode_inline_file(blob_store.read(report.blob_key), report.content_type)
+    except FileNotFoundError:
+        logger.warning("blob %s for report %s is missing", report.blob_key, report.id)
+        return None
+
+REPORT_LIST_COLUMNS = (
+    MedicalReport.id, MedicalReport.title, MedicalReport.report_type, MedicalReport.notes,
+    MedicalReport.file_name, MedicalReport.file_size, MedicalReport.content_type,
+    MedicalReport.blob_key, MedicalReport.uploaded_by, MedicalReport.created_at,
+)
+
 @app.get("/reports/{patient_id}")
 def get_reports(
     patient_id: str,
+    response: Response,
     include_data: bool = False,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     authorization: str = Header(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
+    """Report metadata, newest first; file bytes only with include_data (prefer /reports/{id}/file)"""
     requester, requester_roles = _get_requester_with_roles(authorization, db)
     pat_id = _parse_uuid_or_400(patient_id, "patient_id")
     _authorize_report_access(
@@ -696,13 +937,16 @@ def get_reports(
         require_report_permission=True,
     )
 
-    reports = (
-        db.query(MedicalReport)
-        .filter(MedicalReport.patient_id == pat_id)
-        .order_by(MedicalReport.created_at.desc())
-        .all()
+    # Never pull the legacy inline payload unless it is going to be returned.
+    columns = REPORT_LIST_COLUMNS + ((MedicalReport.file_data,) if include_data else ())
+    query = db.query(MedicalReport).options(load_only(*columns)).filter(MedicalReport.patient_id == pat_id)
+    reports, next_cursor = keyset_page(
+        query, [MedicalReport.created_at, MedicalReport.id], [datetime.fromisoformat, uuid.UUID],
+        cursor, limit, descending=True,
     )
-    response = []
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    rows = []
     for r in reports:
         row = {
             "id": str(r.id),
@@ -710,13 +954,147 @@ def get_reports(
             "report_type": r.report_type,
             "notes": r.notes,
             "file_name": r.file_name,
+            "file_size": r.file_size,
+            "content_type": r.content_type,
+            "thumbnail_url": f"/reports/{r.id}/thumbnail" if r.blob_key else None,
             "uploaded_by": str(r.uploaded_by),
             "created_at": str(r.created_at),
         }
         if include_data:
-            row["file_data"] = r.file_data
-        response.append(row)
-    return response
+            row["file_data"] = _report_inline_data(r)
+        rows.append(row)
+    return rows
+
+@app.post("/reports/upload")
+async def upload_report(request: Request, authorization: str = Header(...), db: Session = Depends(get_db)):
+    """
+    multipart/form-data upload: fields patient_id, title, report_type, notes
+    and one `file` part, streamed into the blob store as it arrives.
+    """
+    requester, requester_roles = await asyncio.to_thread(_get_requester_with_roles, authorization, db)
+    upload = await receive_upload(request, blob_store)
+    try:
+        fields = upload.fields
+        if not fields.get("title"):
+            raise HTTPException(status_code=400, detail="title is required")
+        patient_id = _parse_uuid_or_400(fields.get("patient_id", ""), "patient_id")
+        await asyncio.to_thread(
+            _authorize_report_access,
+            requester=requester,
+            requester_roles=requester_roles,
+            patient_id=patient_id,
+            db=db,
+            require_report_permission=True,
+        )
+        blob_key = upload.writer.sha256.hexdigest() if upload.writer else None
+    except BaseException:
+        upload.abort()
+        raise
+
+    report = MedicalReport(
+        id=uuid.uuid4(), patient_id=patient_id, uploaded_by=requester.id,
+        title=fields["title"], report_type=fields.get("report_type") or "other", notes=fields.get("notes"),
+        file_name=fields.get("file_name") or upload.filename, blob_key=blob_key,
+        file_size=upload.writer.size if upload.writer else None, content_type=upload.content_type,
+    )
+    def _save():
+        db.add(report)
+        if blob_key:
+            # Moved into place under the blob's lock (see blob_refs) so the collector cannot remove it before commit.
+            blob_refs.acquire(db, blob_key, report.file_size, report.content_type)
+            upload.writer.commit()
+        db.commit(); db.refresh(report)
+    try:
+        await asyncio.to_thread(_save)
+    except BaseException:
+        upload.abort()
+        raise
+    if blob_key:
+        thumbnail_worker.submit(blob_key, report.content_type)
+    return {"id": str(report.id), "title": report.title, "report_type": report.report_type,
+            "notes": report.notes, "file_name": report.file_name, "file_size": report.file_size,
+            "sha256": report.blob_key, "created_at": str(report.created_at)}
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag.removeprefix("W/") for t in tags)
+
+def _readable_report(report_id: str, authorization: str, db: Session) -> MedicalReport:
+    requester, requester_roles = _get_requester_with_roles(authorization, db)
+    rep_id = _parse_uuid_or_400(report_id, "report_id")
+    report = db.query(MedicalReport).filter(MedicalReport.id == rep_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    _authorize_report_access(
+        requester=requester,
+        requester_roles=requester_roles,
+        patient_id=report.patient_id,
+        db=db,
+        require_report_permission=True,
+    )
+    return report
+
+@app.get("/reports/{report_id}/file")
+def download_report_file(
+    report_id: str,
+    request: Request,
+    authorization: str = Header(...),
+    db: Session = Depends(get_read_db),
+):
+    """Report file with Range, ETag and If-None-Match support"""
+    report = _readable_report(report_id, authorization, db)
+
+    # Access can be revoked, so clients revalidate every time; a match costs a 304.
+    # Content-Encoding: identity keeps GZipMiddleware off byte ranges.
+    headers = {"Cache-Control": "private, no-cache", "Content-Encoding": "identity"}
+    media_type = report.content_type or "application/octet-stream"
+    if not report.blob_key:
+        if not report.file_data:
+            raise HTTPException(status_code=404, detail="Report has no file")
+        try:
+            data, content_type = decode_inline_file(report.file_data)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Report file is unreadable")
+        return Response(content=data, media_type=content_type or media_type, headers=headers)
+
+    etag = f'"{report.blob_key}"'
+    headers["ETag"] = etag
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    path = blob_store.local_path(report.blob_key)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Report file is missing")
+    return FileResponse(
+        path, media_type=media_type, headers=headers,
+        filename=report.file_name or f"report-{report.id}", content_disposition_type="inline",
+    )
+
+@app.get("/reports/{report_id}/thumbnail")
+def get_report_thumbnail(
+    report_id: str,
+    request: Request,
+    authorization: str = Header(...),
+    db: Session = Depends(get_read_db),
+):
+    """JPEG preview of an image or the first PDF page; 202 while it is being rendered"""
+    report = _readable_report(report_id, authorization, db)
+    if not report.blob_key or thumbnail_worker.has_failed(report.blob_key):
+        raise HTTPException(status_code=404, detail="No thumbnail for this report")
+
+    path = blob_store.derived_path(report.blob_key, THUMBNAIL_KIND)
+    if path is None:
+        if not source_kind(report.blob_key, report.content_type):
+            raise HTTPException(status_code=404, detail="No thumbnail for this report")
+        thumbnail_worker.submit(report.blob_key, report.content_type)
+        return Response(status_code=202, headers={"Retry-After": "2"})
+
+    etag = f'"{report.blob_key}-{THUMBNAIL_KIND}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
 
 @app.delete("/reports/{report_id}")
 def delete_report(report_id: str, authorization: str = Header(...), db: Session = Depends(get_db)):
@@ -741,6 +1119,9 @@ def delete_report(report_id: str, authorization: str = Header(...), db: Session
             require_report_permission=True,
         )
 
+    # Identical uploads share a blob; the collector removes it after the last release.
+    if report.blob_key:
+        blob_refs.release(db, report.blob_key)
     db.delete(report); db.commit()
     return {"message": "Report deleted"}
 
@@ -785,7 +1166,7 @@ def create_medication(body: MedicationCreate, authorization: str = Header(...),
             "notes": med.notes, "active": med.active}
 
 @app.get("/medications/{patient_id}")
-def get_medications(patient_id: str, authorization: str = Header(...), db: Session = Depends(get_db)):
+def get_medications(patient_id: str, authorization: str = Header(...), db: Session = Depends(get_read_db)):
     payload = verify_token(authorization)
     req_id = uuid.UUID(payload["sub"])
     pat_id = uuid.UUID(patient_id)
@@ -897,9 +1278,10 @@ def create_emergency(body: EmergencyCreate, authorization: str = Header(...), db
 def get_pending_emergencies(authorization: str = Header(...), db: Session = Depends(get_db)):
     verify_token(authorization)
     reqs = db.query(EmergencyRequest).filter(EmergencyRequest.status == "pending").order_by(EmergencyRequest.created_at.desc()).all()
+    patients = DirectoryResolver(db).users(r.patient_id for r in reqs)
     result = []
     for r in reqs:
-        patient = db.query(User).filter(User.id == r.patient_id).first()
+        patient = patients[r.patient_id]
         result.append({"id": str(r.id), "patient_id": str(r.patient_id),
                        "patient_name": patient.name if patient else "Patient",
                        "message": r.message, "created_at": str(r.created_at)})
@@ -940,12 +1322,121 @@ def resolve_emergency(emergency_id: str, authorization: str = Header(...), db: S
 def create_health_log(body: HealthLogCreate, db: Session = Depends(get_db)):
     log = HealthLog(id=uuid.uuid4(), user_id=uuid.UUID(body.user_id), log_type=body.log_type, title=body.log_type,
                     pain_level=body.pain_level, bleeding_level=body.bleeding_level, mood=body.mood, notes=body.notes, log_date=date.today())
-    db.add(log); db.commit(); db.refresh(log)
+    db.add(log)
+    health_analytics.record(db, log.user_id, added=[log])
+    db.commit(); db.refresh(log)
     return {"id": str(log.id), "user_id": str(log.user_id), "log_type": log.log_type, "pain_level": log.pain_level,
             "bleeding_level": log.bleeding_level, "mood": log.mood, "notes": log.notes, "log_date": str(log.log_date)}
 
+HEALTH_LOG_BULK_MAX = int(os.getenv("HEALTH_LOG_BULK_MAX", "500"))
+
+def _validation_message(e: ValueError) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+@app.post("/health-logs/bulk")
+def bulk_create_health_logs(body: HealthLogBulk, authorization: str = Header(...), db: Session = Depends(get_db)):
+    """
+    Offline sync: validate every item, insert the valid ones with a single
+    multi-row INSERT and return one status per item, in request order.
+    Items carrying a client_key already stored for the user come back as
+    "duplicate" with the existing id, so replaying a batch is safe.
+    """
+    requester_id = uuid.UUID(verify_token(authorization)["sub"])
+    if len(body.logs) > HEALTH_LOG_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {HEALTH_LOG_BULK_MAX} logs per request")
+
+    results, rows, first_with_key = [], [], {}
+    now, today = datetime.utcnow(), date.today()
+    for raw in body.logs:
+        try:
+            item = HealthLogBulkItem(**raw)
+            owner_id = uuid.UUID(item.user_id)
+        except (ValueError, TypeError) as e:
+            results.append({"status": "invalid", "error": _validation_message(e)})
+            continue
+        if owner_id != requester_id:
+            results.append({"status": "forbidden"})
+            continue
+        if item.client_key in first_with_key:
+            results.append({"status": "duplicate", "client_key": item.client_key})
+            continue
+        row = {
+            "id": uuid.uuid4(), "user_id": owner_id, "log_type": item.log_type, "title": item.log_type,
+            "pain_level": item.pain_level, "bleeding_level": item.bleeding_level, "mood": item.mood,
+            "notes": item.notes, "log_date": item.log_date or today, "created_at": now, "client_key": item.client_key,
+        }
+        if item.client_key:
+            first_with_key[item.client_key] = row
+        rows.append(row)
+        results.append({"status": "created", "row": row})
+
+    existing = {}
+    if rows:
+        table = HealthLog.__table__
+        inserted = set(db.execute(
+            postgresql.insert(table).values(rows)
+            .on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.client_key])
+            .returning(table.c.id)
+        ).scalars())
+        replayed = [row["client_key"] for row in rows if row["id"] not in inserted]
+        if replayed:
+            existing = dict(db.query(HealthLog.client_key, HealthLog.id).filter(
+                HealthLog.user_id == requester_id, HealthLog.client_key.in_(replayed)
+            ).all())
+        if inserted:
+            health_analytics.record(db, requester_id, added=[row for row in rows if row["id"] in inserted])
+        db.commit()
+
+    for result in results:
+        if result["status"] == "duplicate":
+            row = first_with_key[result.pop("client_key")]
+            result["id"] = str(existing.get(row["client_key"], row["id"]))
+        elif result["status"] == "created":
+            row = result.pop("row")
+            if row["client_key"] in existing:
+                result["status"] = "duplicate"
+            result["id"] = str(existing.get(row["client_key"], row["id"]))
+    counts = {status: sum(r["status"] == status for r in results) for status in ("created", "duplicate", "invalid", "forbidden")}
+    return {**counts, "results": results}
+
+HEALTH_LOG_COLUMNS = {
+    "id": HealthLog.id, "user_id": HealthLog.user_id, "log_type": HealthLog.log_type,
+    "pain_level": HealthLog.pain_level, "bleeding_level": HealthLog.bleeding_level,
+    "mood": HealthLog.mood, "notes": HealthLog.notes, "log_date": HealthLog.log_date,
+}
+HEALTH_LOG_FIELDS = tuple(HEALTH_LOG_COLUMNS)
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+def _not_modified_since(if_modified_since: Optional[str], last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
 @app.get("/health-logs")
-def get_health_logs(user_id: str, authorization: str = Header(...), db: Session = Depends(get_db)):
+def get_health_logs(
+    user_id: str,
+    request: Request,
+    response: Response,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    authorization: str = Header(...),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Logs newest first, optionally within [from, to] and one `limit` page at
+    a time (next page via X-Next-Cursor). Conditional requests get a 304
+    while nothing in the range has been added, edited or deleted; deletes
+    are only visible to If-None-Match, not If-Modified-Since.
+    """
     payload = verify_token(authorization)
     requesting_user_id = uuid.UUID(payload["sub"])
     target_user_id = uuid.UUID(user_id)
@@ -963,19 +1454,52 @@ def get_health_logs(user_id: str, authorization: str = Header(...), db: Session
         if not perms.get("health_logs", True):
             raise HTTPException(status_code=403, detail="Permission denied by patient")
 
-    logs = db.query(HealthLog).filter(HealthLog.user_id == target_user_id).order_by(HealthLog.log_date.desc()).all()
-    return [{"id": str(l.id), "user_id": str(l.user_id), "log_type": l.log_type, "pain_level": l.pain_level,
-             "bleeding_level": l.bleeding_level, "mood": l.mood, "notes": l.notes, "log_date": str(l.log_date)} for l in logs]
+    wanted = parse_fields(fields, HEALTH_LOG_FIELDS)
+    filters = [HealthLog.user_id == target_user_id]
+    if from_date:
+        filters.append(HealthLog.log_date >= from_date)
+    if to_date:
+        filters.append(HealthLog.log_date <= to_date)
+
+    count, last_modified = db.query(
+        func.count(HealthLog.id), func.max(func.coalesce(HealthLog.updated_at, HealthLog.created_at))
+    ).filter(*filters).one()
+    validator = f"{target_user_id}|{from_date}|{to_date}|{cursor}|{limit}|{','.join(wanted)}|{count}|{last_modified}"
+    etag = f'W/"{hashlib.sha256(validator.encode()).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+    if_none_match = request.headers.get("if-none-match")
+    if (
+        _etag_matches(if_none_match, etag)
+        or (not if_none_match and last_modified and _not_modified_since(request.headers.get("if-modified-since"), last_modified))
+    ):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    columns = [HEALTH_LOG_COLUMNS[f] for f in wanted if f not in ("id", "log_date")]
+    query = db.query(HealthLog.id, HealthLog.log_date, *columns).filter(*filters)
+    rows, next_cursor = keyset_page(
+        query, [HealthLog.log_date, HealthLog.id], [date.fromisoformat, uuid.UUID], cursor, limit, descending=True,
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [
+        {f: str(getattr(r, f)) if f in ("id", "user_id", "log_date") else getattr(r, f) for f in wanted}
+        for r in rows
+    ]
 
 @app.put("/health-logs/{log_id}")
 def update_health_log(log_id: str, body: HealthLogUpdate, db: Session = Depends(get_db)):
     log = db.query(HealthLog).filter(HealthLog.id == uuid.UUID(log_id)).first()
     if not log: raise HTTPException(status_code=404, detail="Log not found")
+    before = health_analytics.snapshot(log)
     if body.log_type is not None: log.log_type = body.log_type; log.title = body.log_type
     if body.pain_level is not None: log.pain_level = body.pain_level
     if body.bleeding_level is not None: log.bleeding_level = body.bleeding_level
     if body.mood is not None: log.mood = body.mood
     if body.notes is not None: log.notes = body.notes
+    health_analytics.record(db, log.user_id, removed=[before], added=[log])
     db.commit(); db.refresh(log)
     return {"id": str(log.id), "log_type": log.log_type, "pain_level": log.pain_level,
             "bleeding_level": log.bleeding_level, "mood": log.mood, "notes": log.notes, "log_date": str(log.log_date)}
@@ -984,7 +1508,9 @@ def update_health_log(log_id: str, body: HealthLogUpdate, db: Session = Depends(
 def delete_health_log(log_id: str, db: Session = Depends(get_db)):
     log = db.query(HealthLog).filter(HealthLog.id == uuid.UUID(log_id)).first()
     if not log: raise HTTPException(status_code=404, detail="Log not found")
-    db.delete(log); db.commit()
+    db.delete(log)
+    health_analytics.record(db, log.user_id, removed=[log])
+    db.commit()
     return {"message": "Health log deleted"}
 
 # ════════════════════════════════════
@@ -1054,8 +1580,11 @@ def link_records(share_code: str, authorization: str = Header(...), db: Session
     db.query(Consultation).filter(Consultation.patient_id == shadow_user_id).update({Consultation.patient_id: real_user_id})
     # 2. Medical History
     db.query(MedicalHistory).filter(MedicalHistory.patient_id == shadow_user_id).update({MedicalHistory.patient_id: real_user_id})
-    # 3. Health Logs
+    # 3. Health Logs, carried into the real user's analytics (the shadow's row goes with the shadow user)
+    moved_logs = health_analytics.user_snapshots(db, shadow_user_id)
     db.query(HealthLog).filter(HealthLog.user_id == shadow_user_id).update({HealthLog.user_id: real_user_id})
+    if moved_logs:
+        health_analytics.record(db, real_user_id, added=moved_logs)
     # 4. Medical Reports
     db.query(MedicalReport).filter(MedicalReport.patient_id == shadow_user_id).update({MedicalReport.patient_id: real_user_id})
 
@@ -1217,12 +1746,13 @@ def pay_consultation(cons_id: str, authorization: str = Header(...), db: Session
     return {"message": "Payment successful"}
 
 @app.get("/consultations/{patient_id}")
-def get_consultations(patient_id: str, authorization: str = Header(...), db: Session = Depends(get_db)):
+def get_consultations(patient_id: str, authorization: str = Header(...), db: Session = Depends(get_read_db)):
     verify_token(authorization)
     cons = db.query(Consultation).filter(Consultation.patient_id == uuid.UUID(patient_id)).order_by(Consultation.visit_date.desc()).all()
+    doctors = DirectoryResolver(db).users(c.doctor_id for c in cons)
     result = []
     for c in cons:
-        doc = db.query(User).filter(User.id == c.doctor_id).first()
+        doc = doctors[c.doctor_id]
         result.append({
             "id": str(c.id), "doctor_name": doc.name if doc else "Unknown",
             "visit_date": str(c.visit_date), "symptoms": c.symptoms,
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+HerCare - move inline report files into the blob store
+
+Walks medical_reports rows that still carry base64 file_data, writes each
+payload to the blob store (BLOB_STORE / BLOB_STORE_PATH, which must be the
+persistent volume the app servers mount), records blob_key,
+file_size and content_type, and clears file_data. Rows are processed in id
+order, one transaction per batch, so the run can be stopped and resumed.
+Rows whose payload is not valid base64 are left untouched and reported.
+Blob reference counts are rebuilt from the tables at the end.
+
+Run VACUUM (or let autovacuum) reclaim the space afterwards.
+Run: python migrate_report_blobs.py [batch_size]
+"""
+
+from sqlalchemy import text
+from database import engine
+from models import Blob
+from blobstore import blob_store, decode_inline_file
+from blob_refs import rebuild_refcounts
+import sys
+
+BATCH_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+def migrate(batch_size: int = BATCH_SIZE):
+    with engine.begin() as conn:
+        conn.execute(text(
+            """
+            ALTER TABLE medical_reports
+            ADD COLUMN IF NOT EXISTS blob_key VARCHAR,
+            ADD COLUMN IF NOT EXISTS file_size INTEGER,
+            ADD COLUMN IF NOT EXISTS content_type VARCHAR
+            """
+        ))
+        conn.execute(text("ALTER TABLE files ADD COLUMN IF NOT EXISTS blob_key VARCHAR"))
+        Blob.__table__.create(bind=conn, checkfirst=True)
+        remaining = conn.execute(text(
+            "SELECT count(*) FROM medical_reports WHERE file_data IS NOT NULL AND blob_key IS NULL"
+        )).scalar()
+    print(f"{remaining} reports to migrate.")
+
+    moved, skipped, last_id = 0, [], None
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    """
+                    SELECT id, file_data FROM medical_reports
+                    WHERE file_data IS NOT NULL AND blob_key IS NULL
+                      AND (CAST(:last_id AS uuid) IS NULL OR id > CAST(:last_id AS uuid))
+                    ORDER BY id
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                    """
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+            for report_id, file_data in rows:
+                try:
+                    data, content_type = decode_inline_file(file_data)
+                except ValueError:
+                    skipped.append(str(report_id))
+                    continue
+                conn.execute(
+                    text(
+                        """
+                        UPDATE medical_reports
+                        SET blob_key = :key, file_size = :size, content_type = :content_type, file_data = NULL
+                        WHERE id = :id
+                        """
+                    ),
+                    {"key": blob_store.put(data), "size": len(data), "content_type": content_type, "id": report_id},
+                )
+                moved += 1
+            last_id = str(rows[-1][0])
+        print(f"Moved {moved} so far...")
+
+    rebuild_refcounts()
+    print(f"Done. Moved {moved} reports.")
+    if skipped:
+        print(f"Skipped {len(skipped)} reports with invalid base64: {', '.join(skipped)}")
+
+if __name__ == "__main__":
+    migrate()
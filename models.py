@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, Date, DateTime, Float, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, Text, Date, DateTime, Float, Boolean, ForeignKey, JSON, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base, relationship
 import uuid
@@ -55,7 +55,7 @@ class DoctorPatientLink(Base):
     __tablename__ = "doctor_patient_links"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    doctor_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    doctor_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # leads a HOT_INDEXES composite
     patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
     permissions = Column(JSON, nullable=True, default={})
     share_code = Column(String, unique=True, nullable=True) # For linking shadow records
@@ -65,20 +65,23 @@ class MedicalReport(Base):
     __tablename__ = "medical_reports"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # leads a HOT_INDEXES composite
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
     report_type = Column(String, nullable=False)  # "blood_test", "ultrasound", "prescription", "other"
     notes = Column(Text, nullable=True)
-    file_data = Column(Text, nullable=True)  # base64 encoded file
+    file_data = Column(Text, nullable=True)  # legacy inline base64, moved out by migrate_report_blobs.py
     file_name = Column(String, nullable=True)
+    blob_key = Column(String, nullable=True)  # SHA-256 key in the blob store; indexed via HOT_INDEXES
+    file_size = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Medication(Base):
     __tablename__ = "medications"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # leads a HOT_INDEXES composite
     prescribed_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     name = Column(String, nullable=False)
     dosage = Column(String, nullable=True)
@@ -118,19 +121,38 @@ class HealthLog(Base):
     __tablename__ = "health_logs"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # leads a HOT_INDEXES composite
     log_type = Column(String, nullable=False)
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     log_date = Column(Date, nullable=False, default=date.today, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=True, onupdate=datetime.utcnow)
     pain_level = Column(Integer, nullable=True)
     bleeding_level = Column(String, nullable=True)
     mood = Column(String, nullable=True)
     notes = Column(Text, nullable=True)
+    client_key = Column(String, nullable=True)  # idempotency key from offline-synced clients
 
     user = relationship("User", back_populates="health_logs")
 
+class HealthLogStats(Base):
+    """Per-user aggregates over health_logs, kept current by health_analytics on every write"""
+    __tablename__ = "health_log_stats"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    log_count = Column(Integer, nullable=False, default=0)
+    pain_sum = Column(Integer, nullable=False, default=0)
+    pain_count = Column(Integer, nullable=False, default=0)
+    mood_counts = Column(JSON, nullable=False, default=dict)
+    bleeding_counts = Column(JSON, nullable=False, default=dict)
+    period_days = Column(JSON, nullable=False, default=dict)  # ISO date -> number of period logs that day
+    cycle_starts = Column(JSON, nullable=False, default=list)  # ISO dates, ascending
+    pain_by_cycle_day = Column(JSON, nullable=False, default=dict)  # cycle day -> [pain sum, log count]
+    avg_cycle_length = Column(Float, nullable=True)
+    last_cycle_start = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class MedicalHistory(Base):
     __tablename__ = "medical_histories"
 
@@ -148,7 +170,7 @@ class Consultation(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     doctor_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
-    patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    patient_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # leads a HOT_INDEXES composite
     visit_date = Column(Date, nullable=False, default=date.today)
     symptoms = Column(Text, nullable=True)
     diagnosis = Column(Text, nullable=True)
@@ -208,6 +230,9 @@ class Organization(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Monthly range partitions on created_at (see audit_partitions.py); the
+    # partition key has to be part of the primary key.
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True, index=True)
@@ -220,7 +245,7 @@ class AuditLog(Base):
     user_agent = Column(String, nullable=True)
     status = Column(String, default="success")  # "success", "failed"
     details = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, index=True)
 
 class Appointment(Base):
     __tablename__ = "appointments"
@@ -247,6 +272,7 @@ class File(Base):
     file_size = Column(Integer, nullable=False)
     s3_key = Column(String, nullable=True)  # Path in S3
     s3_url = Column(String, nullable=True)  # Public URL from S3
+    blob_key = Column(String, nullable=True)  # SHA-256 key in the blob store; indexed via HOT_INDEXES
     resource_type = Column(String, nullable=False)  # "medical_report", "prescription", "profile_photo"
     resource_id = Column(UUID(as_uuid=True), nullable=True)  # FK to related resource
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
@@ -255,6 +281,30 @@ class File(Base):
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     expires_at = Column(DateTime, nullable=True)
 
+class Blob(Base):
+    """One row per stored blob; ref_count is the number of reports/files pointing at it"""
+    __tablename__ = "blobs"
+
+    key = Column(String, primary_key=True)  # SHA-256 of the content
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime, nullable=True, index=True)  # when ref_count last reached 0
+
+class IdempotencyKey(Base):
+    """Stored outcome of a POST sent with an Idempotency-Key header (see idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # SHA-256 of caller + Idempotency-Key
+    fingerprint = Column(String, nullable=False)  # method, path, query and body of the first request
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is still running
+    headers = Column(JSON, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    body_sha256 = Column(String, nullable=True)  # streamed (multipart or large) request body, boundary excluded
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 class Notification(Base):
     __tablename__ = "notifications"
 
@@ -270,3 +320,83 @@ class Notification(Base):
     extra_metadata = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
+
+# ════════════════════════════════════
+#     HEALTH METRIC TIME SERIES
+# ════════════════════════════════════
+
+class HealthMetric(Base):
+    """Raw readings, append-only; see health_metrics.py"""
+    __tablename__ = "health_metrics"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    metric_type = Column(String, nullable=False)  # "weight", "blood_pressure", "glucose", "heart_rate", ...
+    value = Column(Float, nullable=False)
+    secondary_value = Column(Float, nullable=True)  # diastolic for blood_pressure
+    unit = Column(String, nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+    notes = Column(Text, nullable=True)
+    is_abnormal = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_health_metrics_user_type_recorded", "user_id", "metric_type", "recorded_at"),
+        Index("ix_health_metrics_recorded_brin", "recorded_at", postgresql_using="brin"),
+    )
+
+class HealthMetricRollupMixin:
+    """Per user, metric and time bucket aggregates, upserted on every reading"""
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    metric_type = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float, nullable=False, default=0)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+    secondary_sum = Column(Float, nullable=True)
+    secondary_count = Column(Integer, nullable=False, default=0)
+    abnormal_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+class HealthMetricHourly(HealthMetricRollupMixin, Base):
+    __tablename__ = "health_metric_hourly"
+
+class HealthMetricDaily(HealthMetricRollupMixin, Base):
+    __tablename__ = "health_metric_daily"
+
+class HealthMetricTotal(HealthMetricRollupMixin, Base):
+    """All-time running totals: one bucket per user and metric, at health_metrics.ALL_TIME"""
+    __tablename__ = "health_metric_totals"
+
+
+# ════════════════════════════════════
+#     COMPOSITE INDEXES (hot lookups)
+# ════════════════════════════════════
+# Built by create_all on new databases and by `python db_indexes.py migrate`
+# on existing ones; verify_query_plans.py checks the queries that need them.
+
+HOT_INDEXES = [
+    Index("ix_doctor_patient_links_doctor_patient", DoctorPatientLink.doctor_id, DoctorPatientLink.patient_id),
+    Index("ix_health_logs_user_log_date", HealthLog.user_id, HealthLog.log_date.desc(), HealthLog.id.desc()),
+    # ON CONFLICT target of POST /health-logs/bulk
+    Index("ux_health_logs_user_client_key", HealthLog.user_id, HealthLog.client_key, unique=True),
+    Index("ix_medical_reports_patient_created", MedicalReport.patient_id, MedicalReport.created_at.desc(), MedicalReport.id.desc()),
+    Index("ix_emergency_requests_status_created", EmergencyRequest.status, EmergencyRequest.created_at),
+    Index("ix_medications_patient_active", Medication.patient_id, Medication.active),
+    Index("ix_consultations_patient_visit_date", Consultation.patient_id, Consultation.visit_date),
+    # blob_refs reference counting and garbage collection
+    Index("ix_medical_reports_blob_key", MedicalReport.blob_key),
+    Index("ix_files_blob_key", File.blob_key),
+]
+
+# Single-column indexes on the leading column of a HOT_INDEXES entry. They
+# answer nothing the composite cannot, cost every write, and tempt the
+# planner into a scan plus sort; `db_indexes.py migrate` drops them once the
+# composites are valid.
+SUPERSEDED_INDEXES = [
+    "ix_doctor_patient_links_doctor_id",
+    "ix_health_logs_user_id",
+    "ix_medical_reports_patient_id",
+    "ix_medications_patient_id",
+    "ix_consultations_patient_id",
+]
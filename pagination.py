@@ -0,0 +1,106 @@
+# ════════════════════════════════════
+# Keyset (cursor) pagination helpers
+# ════════════════════════════════════
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from typing import Optional
+import base64
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*values) -> str:
+    """Opaque cursor from the sort-key values of the last row on a page"""
+    raw = json.dumps([None if v is None else str(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> list:
+    """Inverse of encode_cursor; `types` converts each value back (e.g. uuid.UUID)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor arity")
+        return [None if v is None else t(v) for t, v in zip(types, values)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str], allowed: tuple) -> tuple:
+    """Validate a comma-separated `fields=` projection; all fields when omitted"""
+    if not fields:
+        return allowed
+    wanted = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+def keyset_page(query, order_columns: list, types: list, cursor: Optional[str], limit: Optional[int], descending: bool = False, offset: int = 0):
+    """
+    Order `query` by `order_columns` and return one page after `cursor`.
+
+    Returns (rows, next_cursor). With limit=None every remaining row is
+    returned and next_cursor is None. The last column must be unique
+    (normally the primary key) so the ordering is total. `offset` is only
+    for legacy skip= callers and is ignored once a cursor is given.
+    """
+    if cursor:
+        values = decode_cursor(cursor, *types)
+        keys, bound = tuple_(*order_columns), tuple_(*values)
+        query = query.filter(keys < bound if descending else keys > bound)
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in order_columns])
+    if offset and not cursor:
+        query = query.offset(offset)
+    if limit is None:
+        return query.all(), None
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(*[getattr(last, c.key) for c in order_columns])
+
+# ────── Totals ──────
+class ExplainJSON(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) <select>, compiled with the select's own bind params"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(ExplainJSON, "postgresql")
+def _compile_explain_json(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def estimated_count(db, query, table_name: Optional[str] = None) -> Optional[int]:
+    """
+    Planner row estimate instead of count(*): pg_class.reltuples for a whole
+    table, the EXPLAIN estimate for a filtered query. None when no estimate
+    is available (not Postgres, or the table has never been analyzed).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    if table_name:
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": table_name},
+        ).scalar()
+        return estimate if estimate is not None and estimate >= 0 else None
+    plan = db.execute(ExplainJSON(query.order_by(None).statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def total_count(db, query, exact: bool = False, table_name: Optional[str] = None) -> tuple[int, bool]:
+    """(total, is_estimate); exact count(*) only when asked for or no estimate exists"""
+    if not exact:
+        estimate = estimated_count(db, query, table_name)
+        if estimate is not None:
+            return estimate, True
+    return query.order_by(None).count(), False
@@ -8,6 +8,8 @@ from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
 
+from models import HealthMetric  # mapped there, with hourly/daily rollups (see health_metrics.py)
+
 
 class InsightType(str, enum.Enum):
     medication_reminder = "medication_reminder"
@@ -18,24 +20,6 @@ class InsightType(str, enum.Enum):
     wellness_tip = "wellness_tip"
 
 
-class HealthMetric:
-    """Daily/periodic health metrics tracked by user"""
-    __tablename__ = "health_metrics"
-
-    id = Column(String(36), primary_key=True)
-    user_id = Column(String(36), ForeignKey("user.id"), nullable=False)
-    metric_type = Column(String(100), nullable=False)  # "blood_pressure", "weight", "glucose", etc.
-    value = Column(Float, nullable=False)
-    unit = Column(String(50), nullable=False)  # "mmHg", "kg", "mg/dL", etc.
-    recorded_at = Column(DateTime, nullable=False)
-    notes = Column(Text, nullable=True)
-    is_abnormal = Column(Boolean, default=False)
-    alert_generated = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    user = relationship("User", back_populates="health_metrics")
-
-
 class HealthInsight:
     """AI-generated health insights and recommendations"""
     __tablename__ = "health_insights"
@@ -4,26 +4,72 @@
 
 from functools import wraps
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from database import get_db
 from models import User, UserRole, Role
+from cache import TTLCache
+from invalidation import publish, subscribe
+import os
 import uuid
 
+# Resolved (role name, permissions) rows per user id. Role assignments change
+# rarely; admin write paths call invalidate_user_roles() and the TTL bounds
+# staleness for anything else (e.g. seed_roles.py editing Role.permissions).
+role_cache = TTLCache(
+    "roles",
+    maxsize=int(os.getenv("ROLE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ROLE_CACHE_TTL", "60")),
+)
+
+def _as_uuid(user_id):
+    return uuid.UUID(user_id) if isinstance(user_id, str) else user_id
+
+# ────── Shared role query: UserRole → Role in one round trip ──────
+def role_rows_statement(user_id):
+    """SELECT (role name, role permissions) for every role assigned to user_id"""
+    return (
+        select(Role.name, Role.permissions)
+        .join(UserRole, UserRole.role_id == Role.id)
+        .where(UserRole.user_id == _as_uuid(user_id))
+    )
+
+def cache_role_rows(user_id, rows) -> tuple:
+    """Freeze query rows and store them in role_cache"""
+    rows = tuple((name, role_permissions or {}) for name, role_permissions in rows)
+    role_cache.set(_as_uuid(user_id), rows)
+    return rows
+
+def role_rows(user_id, db: Session) -> tuple:
+    """(role name, permissions) rows for a user, served from role_cache when fresh"""
+    rows = role_cache.get(_as_uuid(user_id))
+    if rows is None:
+        rows = cache_role_rows(user_id, db.execute(role_rows_statement(user_id)).all())
+    return rows
+
+def invalidate_user_roles(user_id):
+    """Drop a user's cached roles in every worker"""
+    publish("roles", str(user_id))
+
+subscribe("roles", lambda key: role_cache.delete(uuid.UUID(key)))
+
+def merge_role_rows(rows) -> tuple[list, dict]:
+    """Role names and merged permissions from role_rows_statement() rows"""
+    roles = []
+    permissions = {}
+    for name, role_permissions in rows:
+        roles.append(name)
+        permissions.update(role_permissions or {})
+    return roles, permissions
+
+def resolve_user_roles(user_id, db: Session) -> tuple[list, dict]:
+    """Role names and merged permissions for a user with a single joined query"""
+    return merge_role_rows(role_rows(user_id, db))
+
 # ────── RBAC Dependency: Extract roles from JWT ──────
 def get_user_roles(user_id: str, db: Session = Depends(get_db)):
     """Get all roles assigned to a user"""
-    user_id_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
-    
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id_uuid).all()
-    
-    roles = []
-    permissions = {}
-    
-    for user_role in user_roles:
-        role = db.query(Role).filter(Role.id == user_role.role_id).first()
-        if role:
-            roles.append(role.name)
-            permissions.update(role.permissions)
+    roles, permissions = resolve_user_roles(user_id, db)
     
     return {
         "roles": roles,
@@ -44,8 +90,7 @@ def require_role(*required_roles):
                     detail="Not authenticated"
                 )
             
-            user_roles = db.query(UserRole).filter(UserRole.user_id == current_user.id).all()
-            user_role_names = [db.query(Role).filter(Role.id == ur.role_id).first().name for ur in user_roles]
+            user_role_names, _ = resolve_user_roles(current_user.id, db)
             
             if not any(role in user_role_names for role in required_roles):
                 raise HTTPException(
@@ -69,13 +114,7 @@ def require_permission(*required_permissions):
                     detail="Not authenticated"
                 )
             
-            user_roles = db.query(UserRole).filter(UserRole.user_id == current_user.id).all()
-            permissions = {}
-            
-            for user_role in user_roles:
-                role = db.query(Role).filter(Role.id == user_role.role_id).first()
-                if role:
-                    permissions.update(role.permissions)
+            _, permissions = resolve_user_roles(current_user.id, db)
             
             if not any(permissions.get(perm, False) for perm in required_permissions):
                 raise HTTPException(
@@ -90,53 +129,19 @@ def require_permission(*required_permissions):
 # ────── Helper: Check role ──────
 def has_role(user_id: str, required_role: str, db: Session):
     """Check if user has a specific role"""
-    user_id_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id_uuid).all()
-    
-    for user_role in user_roles:
-        role = db.query(Role).filter(Role.id == user_role.role_id).first()
-        if role and role.name == required_role:
-            return True
-    
-    return False
+    return any(name == required_role for name, _ in role_rows(user_id, db))
 
 # ────── Helper: Check permission ──────
 def has_permission(user_id: str, required_permission: str, db: Session):
     """Check if user has a specific permission"""
-    user_id_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id_uuid).all()
-    
-    for user_role in user_roles:
-        role = db.query(Role).filter(Role.id == user_role.role_id).first()
-        if role and role.permissions.get(required_permission, False):
-            return True
-    
-    return False
+    return any(role_permissions.get(required_permission, False) for _, role_permissions in role_rows(user_id, db))
 
 # ────── Helper: Get all user roles ──────
 def get_user_role_names(user_id: str, db: Session) -> list:
     """Get list of role names for a user"""
-    user_id_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id_uuid).all()
-    
-    roles = []
-    for user_role in user_roles:
-        role = db.query(Role).filter(Role.id == user_role.role_id).first()
-        if role:
-            roles.append(role.name)
-    
-    return roles
+    return resolve_user_roles(user_id, db)[0]
 
 # ────── Helper: Get all user permissions ──────
 def get_user_permissions(user_id: str, db: Session) -> dict:
     """Get all permissions for a user"""
-    user_id_uuid = uuid.UUID(user_id) if isinstance(user_id, str) else user_id
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id_uuid).all()
-    
-    permissions = {}
-    for user_role in user_roles:
-        role = db.query(Role).filter(Role.id == user_role.role_id).first()
-        if role:
-            permissions.update(role.permissions)
-    
-    return permissions
+    return resolve_user_roles(user_id, db)[1]
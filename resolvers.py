@@ -0,0 +1,49 @@
+# ════════════════════════════════════
+# Batched user / doctor profile lookups
+# ════════════════════════════════════
+
+from sqlalchemy.orm import Session
+from models import User, DoctorProfile
+from typing import Iterable, Optional
+import uuid
+
+class DirectoryResolver:
+    """
+    Per-request resolver for users and doctor profiles.
+
+    Callers collect the ids they need and resolve them in one `IN` query
+    instead of one query per row. Results are memoised, so asking again
+    for ids already resolved costs nothing.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._users: dict[uuid.UUID, Optional[User]] = {}
+        self._doctors: dict[uuid.UUID, tuple[Optional[User], Optional[DoctorProfile]]] = {}
+
+    def users(self, ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, Optional[User]]:
+        """Map each id to its User (None if missing)"""
+        wanted = {i for i in ids if i is not None}
+        missing = wanted - self._users.keys()
+        if missing:
+            found = {u.id: u for u in self.db.query(User).filter(User.id.in_(missing)).all()}
+            for user_id in missing:
+                self._users[user_id] = found.get(user_id)
+        return {i: self._users[i] for i in wanted}
+
+    def doctors(self, ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, tuple[Optional[User], Optional[DoctorProfile]]]:
+        """Map each doctor id to (User, DoctorProfile), both loaded in one outer-joined query"""
+        wanted = {i for i in ids if i is not None}
+        missing = wanted - self._doctors.keys()
+        if missing:
+            rows = (
+                self.db.query(User, DoctorProfile)
+                .outerjoin(DoctorProfile, DoctorProfile.user_id == User.id)
+                .filter(User.id.in_(missing))
+                .all()
+            )
+            found = {user.id: (user, profile) for user, profile in rows}
+            for user_id in missing:
+                self._doctors[user_id] = found.get(user_id, (None, None))
+                self._users.setdefault(user_id, self._doctors[user_id][0])
+        return {i: self._doctors[i] for i in wanted}
@@ -3,15 +3,25 @@
 # ════════════════════════════════════
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, pool_status, ReplicaSessionLocal
 from models import User, UserRole, Role, AuditLog, Organization
-from auth import get_current_user_with_roles, require_role_dep, hash_password, get_client_ip
-from audit import AuditService
+from auth import get_current_user_with_roles, require_role_dep, hash_password, get_client_ip, invalidate_user, token_decode_stats, bcrypt_stats
+from audit import AuditService, audit_writer
+from rbac import resolve_user_roles, invalidate_user_roles
+from cache import cache_stats
+from pagination import keyset_page, total_count
 from pydantic import BaseModel
 from typing import Optional, List
+import csv
+import io
+import json
+import os
 import uuid
-from datetime import datetime
+import zlib
+from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -68,6 +78,27 @@ def get_dashboard(
         "admin_id": str(current_user.id)
     }
 
+@router.get("/db-pool")
+def get_db_pool_status(
+    current_user: User = Depends(require_role_dep("super_admin"))
+):
+    """Connection pool and bcrypt executor statistics for the worker serving this request"""
+    return {**pool_status(), "bcrypt": bcrypt_stats()}
+
+@router.get("/cache-stats")
+def get_cache_stats(
+    current_user: User = Depends(require_role_dep("super_admin"))
+):
+    """Hit/miss counters for the in-process caches of the worker serving this request"""
+    return {"caches": cache_stats(), "jwt_decode": token_decode_stats(), "bcrypt": bcrypt_stats()}
+
+@router.get("/audit-pipeline")
+def get_audit_pipeline_status(
+    current_user: User = Depends(require_role_dep("super_admin"))
+):
+    """Queue depth and counters of this worker's background audit writer"""
+    return audit_writer.stats()
+
 # ────── User Management ──────
 @router.post("/users")
 def create_user(
@@ -131,21 +162,26 @@ def create_user(
 def list_users(
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    exact: bool = False,
     role_filter: Optional[str] = None,
     current_user: User = Depends(require_role_dep("super_admin", "hospital_admin")),
     db: Session = Depends(get_db)
 ):
-    """List all users (Admin only)"""
+    """List all users (Admin only); pass `next_cursor` back as `cursor` for the next page"""
     
     query = db.query(User)
     
     if role_filter:
         query = query.filter(User.role == role_filter)
     
-    users = query.offset(skip).limit(limit).all()
+    total, estimated = total_count(db, query, exact, table_name=None if role_filter else "users")
+    users, next_cursor = keyset_page(query, [User.id], [uuid.UUID], cursor, limit, offset=skip)
     
     return {
-        "total": db.query(User).count(),
+        "total": total,
+        "total_is_estimate": estimated,
+        "next_cursor": next_cursor,
         "users": [
             {
                 "id": str(u.id),
@@ -172,8 +208,7 @@ def get_user(
         raise HTTPException(status_code=404, detail="User not found")
     
     # Get user roles
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user.id).all()
-    roles = [db.query(Role).filter(Role.id == ur.role_id).first().name for ur in user_roles]
+    roles, _ = resolve_user_roles(user.id, db)
     
     return {
         "id": str(user.id),
@@ -219,6 +254,8 @@ def update_user(
         user.phone = body.phone
     
     db.commit()
+    invalidate_user_roles(user.id)
+    invalidate_user(user.id)
     
     # Audit log
     ip = get_client_ip(request) if request else None
@@ -263,6 +300,8 @@ def delete_user(
     # Delete user
     db.delete(user)
     db.commit()
+    invalidate_user_roles(user_id)
+    invalidate_user(user_id)
     
     # Audit log
     ip = get_client_ip(request) if request else None
@@ -314,6 +353,7 @@ def assign_role(
     
     db.add(user_role)
     db.commit()
+    invalidate_user_roles(user.id)
     
     # Audit log
     ip = get_client_ip(request) if request else None
@@ -343,34 +383,66 @@ def get_user_roles(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user.id).all()
+    rows = (
+        db.query(Role.name, Role.description, UserRole.assigned_at)
+        .join(UserRole, UserRole.role_id == Role.id)
+        .filter(UserRole.user_id == user.id)
+        .all()
+    )
     
-    roles = []
-    for ur in user_roles:
-        role = db.query(Role).filter(Role.id == ur.role_id).first()
-        if role:
-            roles.append({
-                "name": role.name,
-                "description": role.description,
-                "assigned_at": ur.assigned_at
-            })
+    roles = [
+        {
+            "name": row.name,
+            "description": row.description,
+            "assigned_at": row.assigned_at
+        }
+        for row in rows
+    ]
     
     return {"user_id": user_id, "roles": roles}
 
 # ────── Audit Logs ──────
+# audit_logs is partitioned by month on created_at. Passing `since`/`until`
+# or `days` bounds created_at so Postgres only touches the partitions in the
+# window. Without them every row is returned, as before partitioning, unless
+# AUDIT_DEFAULT_WINDOW_DAYS (default 0: off) sets a default window.
+AUDIT_DEFAULT_WINDOW_DAYS = int(os.getenv("AUDIT_DEFAULT_WINDOW_DAYS", "0"))
+
+def _audit_window(query, since: Optional[datetime], until: Optional[datetime], days: Optional[int]):
+    days = AUDIT_DEFAULT_WINDOW_DAYS if days is None else days
+    if not since and days > 0:
+        since = (until or datetime.utcnow()) - timedelta(days=days)
+    if since:
+        query = query.filter(AuditLog.created_at >= since)
+    if until:
+        query = query.filter(AuditLog.created_at < until)
+    return query
+
 @router.get("/audit-logs")
 def get_audit_logs(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    days: Optional[int] = None,
     current_user: User = Depends(require_role_dep("super_admin", "hospital_admin")),
     db: Session = Depends(get_db)
 ):
-    """Get audit logs (Admin only)"""
+    """Get audit logs (Admin only), newest first; optionally `since`/`until` or the last `days` days"""
     
-    logs = db.query(AuditLog).order_by(AuditLog.created_at.desc()).offset(skip).limit(limit).all()
+    query = _audit_window(db.query(AuditLog), since, until, days)
+    total, estimated = total_count(db, query, exact)
+    logs, next_cursor = keyset_page(
+        query, [AuditLog.created_at, AuditLog.id], [datetime.fromisoformat, uuid.UUID],
+        cursor, limit, descending=True, offset=skip,
+    )
     
     return {
-        "total": db.query(AuditLog).count(),
+        "total": total,
+        "total_is_estimate": estimated,
+        "next_cursor": next_cursor,
         "logs": [
             {
                 "id": str(log.id),
@@ -391,14 +463,16 @@ def get_user_audit_logs(
     user_id: str,
     skip: int = 0,
     limit: int = 50,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    days: Optional[int] = None,
     current_user: User = Depends(require_role_dep("super_admin", "hospital_admin")),
     db: Session = Depends(get_db)
 ):
     """Get audit logs for a specific user"""
     
-    logs = db.query(AuditLog).filter(
-        AuditLog.user_id == uuid.UUID(user_id)
-    ).order_by(AuditLog.created_at.desc()).offset(skip).limit(limit).all()
+    query = _audit_window(db.query(AuditLog).filter(AuditLog.user_id == uuid.UUID(user_id)), since, until, days)
+    logs = query.order_by(AuditLog.created_at.desc()).offset(skip).limit(limit).all()
     
     return {
         "user_id": user_id,
@@ -414,6 +488,105 @@ def get_user_audit_logs(
         ]
     }
 
+AUDIT_EXPORT_BATCH = int(os.getenv("AUDIT_EXPORT_BATCH", "2000"))
+AUDIT_EXPORT_COLUMNS = ("id", "user_id", "action", "resource_type", "resource_id", "ip_address",
+                        "user_agent", "status", "details", "old_value", "new_value", "created_at")
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+def _audit_export_chunks(statement, fmt: str, compress: bool):
+    """
+    Yield the export in chunks of AUDIT_EXPORT_BATCH rows.
+
+    Runs on its own session with a server-side cursor (yield_per), so memory
+    stays flat however many rows match. The request's session is already
+    closed by the time a streamed body is produced.
+    """
+    gzipper = zlib.compressobj(wbits=31) if compress else None
+    db = ReplicaSessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=AUDIT_EXPORT_BATCH))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            writer.writerow(AUDIT_EXPORT_COLUMNS)
+        for rows in result.mappings().partitions():
+            for row in rows:
+                values = [_export_value(row[c]) for c in AUDIT_EXPORT_COLUMNS]
+                if writer:
+                    writer.writerow([json.dumps(v) if isinstance(v, dict) else v for v in values])
+                else:
+                    buffer.write(json.dumps(dict(zip(AUDIT_EXPORT_COLUMNS, values)), default=str) + "\n")
+            chunk = buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            yield gzipper.compress(chunk) if gzipper else chunk
+        tail = buffer.getvalue().encode()
+        if gzipper:
+            tail = gzipper.compress(tail) + gzipper.flush()
+        if tail:
+            yield tail
+    finally:
+        db.close()
+
+@router.get("/audit-logs/export")
+def export_audit_logs(
+    request: Request,
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    resource_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    days: Optional[int] = None,
+    current_user: User = Depends(require_role_dep("super_admin", "hospital_admin")),
+):
+    """Stream every matching audit log as NDJSON or CSV, optionally gzipped"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    try:
+        filter_user = uuid.UUID(user_id) if user_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+
+    table = AuditLog.__table__
+    statement = _audit_window(
+        select(*[table.c[c] for c in AUDIT_EXPORT_COLUMNS]), since, until, days
+    )
+    if filter_user:
+        statement = statement.where(table.c.user_id == filter_user)
+    if action:
+        statement = statement.where(table.c.action == action)
+    if resource_type:
+        statement = statement.where(table.c.resource_type == resource_type)
+    statement = statement.order_by(table.c.created_at, table.c.id)
+
+    AuditService.log(
+        db=None,
+        user_id=str(current_user.id),
+        action="export",
+        resource_type="audit_log",
+        ip_address=get_client_ip(request),
+        details=f"format={format} user_id={user_id} action={action} resource_type={resource_type} "
+                f"since={since} until={until} days={days}",
+    )
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"audit-logs-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    headers = {}
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+        # Already compressed; keeps GZipMiddleware from compressing it again.
+        headers["Content-Encoding"] = "identity"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(_audit_export_chunks(statement, format, gzip), media_type=media_type, headers=headers)
+
 # ────── Doctor Approval ──────
 @router.get("/doctors/pending-approval")
 def get_pending_doctors(
@@ -472,15 +645,21 @@ def approve_doctor(
 def list_organizations(
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    exact: bool = False,
     current_user: User = Depends(require_role_dep("super_admin", "hospital_admin")),
     db: Session = Depends(get_db)
 ):
-    """List organizations"""
+    """List organizations; pass `next_cursor` back as `cursor` for the next page"""
     
-    orgs = db.query(Organization).offset(skip).limit(limit).all()
+    query = db.query(Organization)
+    total, estimated = total_count(db, query, exact, table_name="organizations")
+    orgs, next_cursor = keyset_page(query, [Organization.id], [uuid.UUID], cursor, limit, offset=skip)
     
     return {
-        "total": db.query(Organization).count(),
+        "total": total,
+        "total_is_estimate": estimated,
+        "next_cursor": next_cursor,
         "organizations": [
             {
                 "id": str(org.id),
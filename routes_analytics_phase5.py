@@ -3,16 +3,20 @@ Phase 5: Analytics & Health Insights API Routes
 Routes for health metrics, insights, reports, and analytics
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from auth import get_current_user, require_role
 from audit import AuditService
-from database import get_db
+from database import get_async_db
+from models import HealthLogStats, HealthMetric, Appointment, Medication
+import health_analytics
+import health_metrics
 
 router = APIRouter(prefix="/api/v1/analytics", tags=["analytics"])
 audit_service = AuditService()
@@ -23,6 +27,7 @@ audit_service = AuditService()
 class HealthMetricDTO(BaseModel):
     metric_type: str
     value: float
+    secondary_value: Optional[float] = None  # diastolic for blood_pressure
     unit: str
     notes: Optional[str] = None
     recorded_at: Optional[datetime] = None
@@ -55,87 +60,68 @@ class UserPreferenceDTO(BaseModel):
 async def record_health_metric(
     metric: HealthMetricDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Record a health metric (blood pressure, weight, glucose, etc.)"""
-    metric_id = str(uuid.uuid4())
-    
+    metric_type = metric.metric_type.strip().lower()
+    row = HealthMetric(
+        id=uuid.uuid4(),
+        user_id=current_user.id,
+        metric_type=metric_type,
+        value=metric.value,
+        secondary_value=metric.secondary_value,
+        unit=metric.unit,
+        recorded_at=health_metrics.as_utc(metric.recorded_at) or datetime.utcnow(),
+        notes=metric.notes,
+        is_abnormal=health_metrics.is_abnormal(metric_type, metric.value, metric.secondary_value),
+        created_at=datetime.utcnow(),
+    )
+    db.add(row)
+    await db.flush()
+    for statement in health_metrics.rollup_upserts(row):
+        await db.execute(statement)
+    await db.commit()
+
     await audit_service.log_action(
         user_id=current_user.id,
         action="health_metric_recorded",
-        resource=f"metric:{metric_id}",
+        resource=f"metric:{row.id}",
         status="success"
     )
-    
-    return {
-        "metric_id": metric_id,
-        "metric_type": metric.metric_type,
-        "value": metric.value,
-        "unit": metric.unit,
-        "recorded_at": (metric.recorded_at or datetime.utcnow()).isoformat(),
-        "is_abnormal": False,
-        "created_at": datetime.utcnow().isoformat()
-    }
+
+    return {**health_metrics.metric_response(row), "created_at": row.created_at.isoformat()}
 
 
 @router.get("/health-metrics")
 async def get_health_metrics(
     metric_type: Optional[str] = None,
-    days: int = 30,
+    days: int = Query(30, ge=1, le=3650),
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get health metrics for the user"""
-    return {
-        "total": 45,
-        "metrics": [
-            {
-                "metric_id": str(uuid.uuid4()),
-                "metric_type": "blood_pressure",
-                "value": 120,
-                "systolic": 120,
-                "diastolic": 80,
-                "unit": "mmHg",
-                "recorded_at": "2024-02-15T10:00:00Z",
-                "is_abnormal": False
-            }
-        ],
-        "statistics": {
-            "average": 120,
-            "minimum": 115,
-            "maximum": 135,
-            "trend": "stable"
-        }
-    }
+    """Recent readings, newest first; statistics come from the rollups when metric_type is given"""
+    metric_type = metric_type.strip().lower() if metric_type else None
+    rows = (await db.execute(health_metrics.recent_query(current_user.id, metric_type, days))).scalars().all()
+    response = {"total": len(rows), "metrics": [health_metrics.metric_response(row) for row in rows]}
+    if metric_type:
+        unit, statement = health_metrics.history_query(current_user.id, metric_type, days)
+        response["statistics"] = health_metrics.statistics(unit, (await db.execute(statement)).all())
+    return response
 
 
 @router.get("/health-metrics/{metric_type}")
 async def get_metric_history(
     metric_type: str,
-    days: int = 90,
+    days: int = Query(90, ge=1, le=3650),
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get history of specific health metric"""
-    return {
-        "metric_type": metric_type,
-        "period_days": days,
-        "total_records": 90,
-        "records": [
-            {
-                "date": "2024-02-15",
-                "value": 120,
-                "unit": "mmHg"
-            }
-        ],
-        "statistics": {
-            "average": 120,
-            "median": 119,
-            "std_dev": 5.2,
-            "trend": "decreasing",
-            "alerts_generated": 2
-        }
-    }
+    """Chart data: raw points for short ranges, hourly or daily rollups for long ones"""
+    metric_type = metric_type.strip().lower()
+    unit, statement = health_metrics.history_query(current_user.id, metric_type, days)
+    rows = (await db.execute(statement)).all()
+    latest = (await db.execute(health_metrics.latest_query(current_user.id, metric_type))).scalars().first()
+    return health_metrics.history_response(metric_type, days, unit, rows, latest)
 
 
 # ==================== Health Insights ====================
@@ -147,7 +133,7 @@ async def get_health_insights(
     skip: int = 0,
     limit: int = 20,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get health insights for the user"""
     return {
@@ -181,7 +167,7 @@ async def get_health_insights(
 async def mark_insight_as_read(
     insight_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark insight as read"""
     return {
@@ -196,7 +182,7 @@ async def take_insight_action(
     insight_id: str,
     action_type: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Record action taken on an insight (e.g., scheduled appointment)"""
     return {
@@ -213,7 +199,7 @@ async def take_insight_action(
 async def generate_health_report(
     report: HealthReportDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate a health report for the period"""
     report_id = str(uuid.uuid4())
@@ -251,7 +237,7 @@ async def get_health_reports(
     skip: int = 0,
     limit: int = 10,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all health reports for the user"""
     return {
@@ -274,7 +260,7 @@ async def get_health_reports(
 async def get_health_report(
     report_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get detailed health report"""
     return {
@@ -318,7 +304,7 @@ async def share_report_with_doctor(
     report_id: str,
     doctor_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Share health report with doctor"""
     await audit_service.log_action(
@@ -337,53 +323,109 @@ async def share_report_with_doctor(
 
 # ==================== Health Dashboard ====================
 
+DASHBOARD_VITALS = {"blood_pressure": "Blood pressure", "weight": "Weight", "heart_rate": "Heart rate"}
+DASHBOARD_TREND_DAYS = 90
+REFILL_WINDOW_DAYS = 7
+
+async def _vital_signs(db: AsyncSession, user_id, recorded: dict) -> dict:
+    vitals = {}
+    for metric_type in DASHBOARD_VITALS:
+        latest, trend = None, None
+        if recorded.get(metric_type):
+            latest = (await db.execute(health_metrics.latest_query(user_id, metric_type))).scalars().first()
+        if latest is not None:
+            unit, statement = health_metrics.history_query(user_id, metric_type, DASHBOARD_TREND_DAYS)
+            trend = health_metrics.statistics(unit, (await db.execute(statement)).all())["trend"]
+        vitals[metric_type] = health_metrics.vital_sign(metric_type, latest, trend)
+    return vitals
+
+async def _abnormal_trend(db: AsyncSession, user_id, now: datetime) -> Optional[str]:
+    """Share of abnormal readings in the last 30 days against the 30 before, from the daily rollup"""
+    row = (await db.execute(health_metrics.abnormal_share_query(user_id, 30, now))).one()
+    if not row[0] or not row[2]:
+        return None
+    change = row[1] / row[0] - row[3] / row[2]
+    if abs(change) < 0.05:
+        return "stable"
+    return "improving" if change < 0 else "worsening"
+
 @router.get("/dashboard")
 async def get_health_dashboard(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get comprehensive health dashboard"""
+    """
+    Overview, vital signs and upcoming care from the latest readings, their
+    rollups and appointments; cycle and symptoms from the user's
+    health_log_stats row. Every read is bounded by a fixed window or a
+    running total, whatever the length of the user's history.
+    """
+    user_id = current_user.id
+    stats = await db.get(HealthLogStats, user_id)
+    if stats is None:
+        stats = await db.run_sync(lambda session: health_analytics.stats_for(session, user_id))
+        await db.commit()
+    analytics = health_analytics.dashboard(stats)
+
+    now, today = datetime.utcnow(), date.today()
+    month_start = datetime(now.year, now.month, 1)
+    next_month = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+    when = Appointment.appointment_date
+    appointments = (await db.execute(
+        select(
+            func.max(when).filter(when < now), func.min(when).filter(when >= now),
+            func.count().filter(when >= now), func.count().filter(when >= month_start, when < next_month),
+        ).where(Appointment.patient_id == user_id, func.coalesce(Appointment.status, "scheduled") != "cancelled")
+    )).one()
+    refills = await db.scalar(
+        select(func.count()).select_from(Medication).where(
+            Medication.patient_id == user_id, Medication.active == True,
+            Medication.end_date.between(today, today + timedelta(days=REFILL_WINDOW_DAYS)),
+        )
+    )
+    recorded = dict((await db.execute(health_metrics.totals_query(user_id))).all())
+
+    vitals = await _vital_signs(db, user_id, recorded)
+    tracked = [v for v in vitals.values() if v["status"]]
+    abnormal = [metric_type for metric_type, v in vitals.items() if v["status"] == "Abnormal"]
+    insights = [
+        {
+            "insight_type": "health_alert",
+            "title": f"{DASHBOARD_VITALS[metric_type]} out of normal range",
+            "description": f"Latest reading: {vitals[metric_type]['latest']} {vitals[metric_type]['unit'] or ''}".rstrip(),
+        }
+        for metric_type in abnormal
+    ]
+    predicted = analytics["cycle"]["predicted_next_period"]
+    if predicted and 0 <= (date.fromisoformat(predicted) - today).days <= 3:
+        insights.append({
+            "insight_type": "cycle",
+            "title": "Period expected soon",
+            "description": f"Your next period is predicted to start on {predicted}",
+        })
+
     return {
         "overview": {
-            "overall_health_score": 82,
-            "trend": "improving",
-            "last_checkup": "2024-01-20",
-            "next_checkup": "2024-04-20"
+            "overall_health_score": round(100 * (len(tracked) - len(abnormal)) / len(tracked)) if tracked else None,
+            "trend": await _abnormal_trend(db, user_id, now),
+            "last_checkup": appointments[0].date().isoformat() if appointments[0] else None,
+            "next_checkup": appointments[1].date().isoformat() if appointments[1] else None,
         },
-        "vital_signs": {
-            "blood_pressure": {
-                "latest": "120/80 mmHg",
-                "status": "Normal",
-                "trend": "stable"
-            },
-            "weight": {
-                "latest": 70,
-                "unit": "kg",
-                "trend": "stable"
-            },
-            "heart_rate": {
-                "latest": 72,
-                "unit": "bpm",
-                "trend": "stable"
-            }
-        },
-        "recent_insights": [
-            {
-                "insight_type": "wellness_tip",
-                "title": "Stay hydrated",
-                "description": "Drink at least 8 glasses of water daily"
-            }
-        ],
+        "vital_signs": vitals,
+        "recent_insights": insights,
         "upcoming": {
-            "appointments": 1,
-            "prescriptions_to_refill": 0,
-            "health_alerts": 0
+            "appointments": appointments[2],
+            "prescriptions_to_refill": refills,
+            "health_alerts": len(abnormal),
         },
         "statistics": {
-            "metrics_tracked": 45,
-            "health_records": 12,
-            "appointments_this_month": 2
-        }
+            "metrics_tracked": sum(recorded.values()),
+            "appointments_this_month": appointments[3],
+            **analytics["statistics"],
+        },
+        "cycle": analytics["cycle"],
+        "symptoms": analytics["symptoms"],
+        "updated_at": analytics["updated_at"],
     }
 
 
@@ -392,7 +434,7 @@ async def get_health_dashboard(
 @router.get("/preferences")
 async def get_preferences(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user analytics and insight preferences"""
     return {
@@ -411,7 +453,7 @@ async def get_preferences(
 async def update_preferences(
     preferences: UserPreferenceDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user preferences"""
     await audit_service.log_action(
@@ -441,7 +483,7 @@ async def update_preferences(
 async def get_doctor_statistics(
     period_days: int = 30,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get doctor statistics for the period"""
     return {
@@ -472,7 +514,7 @@ async def get_doctor_statistics(
 async def get_platform_statistics(
     period_days: int = 30,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get overall platform statistics"""
     return {
@@ -7,12 +7,12 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from auth import get_current_user, require_role, require_permission
 from audit import AuditService
-from database import get_db
+from database import get_async_db
 
 router = APIRouter(tags=["doctor"])
 audit_service = AuditService()
@@ -72,7 +72,7 @@ class DoctorRatingDTO(BaseModel):
 @require_role("doctor")
 async def get_doctor_profile(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get doctor profile with specializations and ratings"""
     # Return doctor info with specializations and average rating
@@ -95,7 +95,7 @@ async def get_doctor_profile(
 async def add_specialization(
     specialty: SpecialtyDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Add doctor specialization and license"""
     await audit_service.log_action(
@@ -116,7 +116,7 @@ async def add_specialization(
 @require_role("doctor")
 async def get_specializations(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all doctor specializations"""
     return {
@@ -140,7 +140,7 @@ async def get_specializations(
 async def create_prescription(
     prescription: PrescriptionCreateDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Issue prescription to patient"""
     prescription_id = str(uuid.uuid4())
@@ -173,7 +173,7 @@ async def get_my_prescriptions(
     skip: int = 0,
     limit: int = 20,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all prescriptions issued by doctor"""
     return {
@@ -199,7 +199,7 @@ async def get_my_prescriptions(
 async def get_prescription(
     prescription_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get prescription details"""
     return {
@@ -228,7 +228,7 @@ async def update_prescription(
     prescription_id: str,
     prescription_update: PrescriptionUpdateDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update prescription status or notes"""
     await audit_service.log_action(
@@ -250,7 +250,7 @@ async def update_prescription(
 async def approve_refill(
     prescription_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Approve prescription refill"""
     await audit_service.log_action(
@@ -277,7 +277,7 @@ async def create_health_record(
     patient_id: str,
     record: HealthRecordDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create health record for patient"""
     record_id = str(uuid.uuid4())
@@ -303,7 +303,7 @@ async def create_health_record(
 async def get_patient_health_records(
     patient_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all health records for a patient"""
     return {
@@ -328,7 +328,7 @@ async def get_patient_health_records(
 async def set_availability(
     availability: DoctorAvailabilityDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Set doctor availability slots"""
     availability_id = str(uuid.uuid4())
@@ -353,7 +353,7 @@ async def set_availability(
 @require_role("doctor")
 async def get_availability(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get doctor availability schedule"""
     return {
@@ -381,7 +381,7 @@ async def get_availability(
 @require_role("doctor")
 async def get_doctor_dashboard(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get doctor dashboard with key metrics"""
     return {
@@ -420,7 +420,7 @@ async def get_doctor_dashboard(
 @require_role("doctor")
 async def get_ratings(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all ratings and reviews"""
     return {
@@ -448,7 +448,7 @@ async def get_ratings(
 @require_role("doctor")
 async def get_pending_appointments(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get pending appointment requests"""
     return {
@@ -472,7 +472,7 @@ async def get_pending_appointments(
 async def accept_appointment(
     appointment_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Accept pending appointment request"""
     await audit_service.log_action(
@@ -495,7 +495,7 @@ async def reject_appointment(
     appointment_id: str,
     reason: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Reject appointment request"""
     await audit_service.log_action(
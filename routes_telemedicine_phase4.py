@@ -7,12 +7,12 @@ from fastapi import APIRouter, Depends, HTTPException, status, WebSocket
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from auth import get_current_user, require_role
 from audit import AuditService
-from database import get_db
+from database import get_async_db
 
 router = APIRouter(prefix="/api/v1/telemedicine", tags=["telemedicine"])
 audit_service = AuditService()
@@ -79,7 +79,7 @@ class DirectMessageDTO(BaseModel):
 async def schedule_consultation(
     consultation: VideoConsultationCreateDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Schedule a new video consultation"""
     consultation_id = str(uuid.uuid4())
@@ -111,7 +111,7 @@ async def get_consultations(
     skip: int = 0,
     limit: int = 20,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get consultations for logged-in user"""
     return {
@@ -134,7 +134,7 @@ async def get_consultations(
 async def get_consultation(
     consultation_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get consultation details"""
     return {
@@ -159,7 +159,7 @@ async def update_consultation(
     consultation_id: str,
     consultation_update: VideoConsultationUpdateDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update consultation details"""
     await audit_service.log_action(
@@ -181,7 +181,7 @@ async def update_consultation(
 async def start_consultation(
     consultation_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark consultation as started"""
     await audit_service.log_action(
@@ -203,7 +203,7 @@ async def start_consultation(
 async def end_consultation(
     consultation_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """End consultation session"""
     await audit_service.log_action(
@@ -228,7 +228,7 @@ async def send_message(
     consultation_id: str,
     message: MessageDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Send message during consultation"""
     message_id = str(uuid.uuid4())
@@ -256,7 +256,7 @@ async def get_consultation_messages(
     skip: int = 0,
     limit: int = 50,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all messages in consultation"""
     return {
@@ -315,7 +315,7 @@ async def websocket_endpoint(
 async def send_direct_message(
     message: DirectMessageDTO,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Send direct message to another user"""
     message_id = str(uuid.uuid4())
@@ -341,7 +341,7 @@ async def get_conversations(
     skip: int = 0,
     limit: int = 20,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all conversations for current user"""
     return {
@@ -366,7 +366,7 @@ async def get_conversation_messages(
     skip: int = 0,
     limit: int = 50,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messages in conversation"""
     return {
@@ -388,7 +388,7 @@ async def get_conversation_messages(
 async def mark_conversation_as_read(
     conversation_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark all messages in conversation as read"""
     return {
@@ -401,7 +401,7 @@ async def mark_conversation_as_read(
 async def archive_conversation(
     conversation_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Archive conversation"""
     return {
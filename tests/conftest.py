@@ -0,0 +1,60 @@
+"""
+The tests run against a real, disposable PostgreSQL database named by
+TEST_DATABASE_URL (tables are created and rows written); without it they
+are skipped.
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/hercare_test python -m pytest
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql://localhost/hercare_test"
+os.environ.setdefault("BLOB_STORE_PATH", tempfile.mkdtemp(prefix="hercare-blobs-"))
+os.environ.setdefault("AUDIT_SPILL_DIR", tempfile.mkdtemp(prefix="hercare-audit-"))
+os.environ.setdefault("BLOB_GC_INTERVAL", "0")
+os.environ.setdefault("DB_POOL_LOG_INTERVAL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def schema():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import main
+    import audit_partitions
+    from database import engine
+    from models import Base
+    Base.metadata.create_all(bind=engine)
+    main.run_startup_migrations()
+    audit_partitions.maintenance()
+    return engine
+
+@pytest.fixture
+def db(schema):
+    from database import SessionLocal
+    with SessionLocal() as session:
+        yield session
+
+@pytest.fixture
+def user(db):
+    from models import User
+    user = User(id=uuid.uuid4(), name="Test", email=f"{uuid.uuid4().hex}@test.hercare", role="patient")
+    db.add(user)
+    db.commit()
+    return user
+
+@pytest.fixture(scope="session")
+def client(schema):
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture
+def auth_headers(user):
+    from auth import create_token_with_roles
+    return {"Authorization": f"Bearer {create_token_with_roles(str(user.id), user.name, ['patient'])}"}
@@ -0,0 +1,82 @@
+import json
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, select, text
+from audit import AuditWriter, _audit_row
+from models import AuditLog
+
+def _rows(user_id, marker: str, n: int) -> list:
+    return [_audit_row(user_id, "access", "test", None, details=marker) for _ in range(n)]
+
+def _count(db, marker: str) -> int:
+    return db.scalar(select(func.count()).select_from(AuditLog).where(AuditLog.details == marker))
+
+def test_bad_row_is_quarantined_and_the_rest_of_its_batch_written(db, user, tmp_path):
+    writer = AuditWriter()
+    writer._spill_dir = str(tmp_path)
+    marker = uuid.uuid4().hex
+    good = _rows(user.id, marker, 9)
+    bad = _audit_row(uuid.uuid4(), "access", "test", None, details=marker)  # no such user: FK violation
+
+    writer._write(good[:4] + [bad] + good[4:])
+
+    assert _count(db, marker) == 9
+    assert (writer.written, writer.quarantined, writer.spilled, writer.dropped) == (9, 1, 0, 0)
+    quarantined = [json.loads(line) for line in (tmp_path / "quarantine.jsonl").read_text().splitlines()]
+    assert [row["id"] for row in quarantined] == [str(bad["id"])]
+    assert not (tmp_path / "spill.jsonl").exists()
+
+def test_replay_writes_every_spill_file_including_other_workers(db, user, tmp_path):
+    writer = AuditWriter()
+    writer._spill_dir = str(tmp_path)
+    marker = uuid.uuid4().hex
+    rows = _rows(user.id, marker, 5)
+    writer._spill(rows[:3])
+    # Claimed by a worker that died before writing it back.
+    (tmp_path / "spill-4242-1.replay").write_text("".join(json.dumps(row, default=str) + "\n" for row in rows[3:]))
+
+    writer._replay_spill()
+
+    assert _count(db, marker) == 5
+    assert writer.replayed == 5
+    assert list(tmp_path.iterdir()) == []
+
+def test_spill_after_claim_goes_to_a_fresh_file(user, tmp_path):
+    writer = AuditWriter()
+    writer._spill_dir = str(tmp_path)
+    writer._spill(_rows(user.id, "a", 1))
+    (tmp_path / "spill.jsonl").rename(tmp_path / "spill-1-1.replay")
+    writer._spill(_rows(user.id, "b", 2))
+    assert len((tmp_path / "spill.jsonl").read_text().splitlines()) == 2
+    assert len((tmp_path / "spill-1-1.replay").read_text().splitlines()) == 1
+
+def _insert_at(db, user_id, marker: str, created_at: datetime):
+    db.execute(insert(AuditLog).values({**_audit_row(user_id, "access", "test", None, details=marker), "created_at": created_at}))
+    db.commit()
+
+def test_new_month_partition_takes_its_rows_from_the_default_partition(db, user):
+    from audit_partitions import _add_months, ensure_partitions, partition_name
+    from database import engine
+    month = _add_months(date.today().replace(day=1), 9)
+    marker = uuid.uuid4().hex
+    _insert_at(db, user.id, marker, datetime(month.year, month.month, 15))
+
+    with engine.begin() as conn:
+        ensure_partitions(conn, months_ahead=9)
+
+    where = db.execute(text("SELECT tableoid::regclass::text FROM audit_logs WHERE details = :m"), {"m": marker}).scalar()
+    assert where == partition_name(month)
+
+def test_audit_listing_is_unbounded_unless_a_window_is_asked_for(client, db, user):
+    from auth import create_token_with_roles
+    from models import User
+    admin = User(id=uuid.uuid4(), name="Admin", email=f"{uuid.uuid4().hex}@test.hercare", role="super_admin")
+    db.add(admin)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_token_with_roles(str(admin.id), admin.name, ['super_admin'])}"}
+    _insert_at(db, user.id, "old", datetime.utcnow() - timedelta(days=400))
+
+    everything = client.get(f"/admin/audit-logs/user/{user.id}", headers=headers)
+    assert everything.status_code == 200 and len(everything.json()["logs"]) == 1
+    recent = client.get(f"/admin/audit-logs/user/{user.id}", params={"days": 30}, headers=headers)
+    assert recent.json()["logs"] == []
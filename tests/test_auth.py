@@ -0,0 +1,32 @@
+import uuid
+import bcrypt
+
+def _credentials():
+    return {"email": f"{uuid.uuid4().hex}@test.hercare", "password": "correct horse", "name": "Auth"}
+
+def test_register_then_login(client):
+    credentials = _credentials()
+    registered = client.post("/api/v1/auth/register", json=credentials)
+    assert registered.status_code == 201 and registered.json()["access_token"]
+    assert client.post("/api/v1/auth/register", json=credentials).status_code == 400
+
+    login = client.post("/api/v1/auth/login", json={"email": credentials["email"], "password": "correct horse"})
+    assert login.status_code == 200
+    assert login.json()["id"] == registered.json()["id"] and "patient" in login.json()["roles"]
+
+    wrong = client.post("/api/v1/auth/login", json={"email": credentials["email"], "password": "wrong"})
+    assert wrong.status_code == 401
+    missing = client.post("/api/v1/auth/login", json={"email": "nobody@test.hercare", "password": "x"})
+    assert missing.status_code == 401
+
+def test_login_upgrades_an_old_cost_hash(client, db, user):
+    from auth import BCRYPT_ROUNDS
+    user.password_hash = bcrypt.hashpw(b"old password", bcrypt.gensalt(rounds=4)).decode()
+    db.commit()
+
+    login = client.post("/api/v1/auth/login", json={"email": user.email, "password": "old password"})
+    assert login.status_code == 200
+
+    db.refresh(user)
+    assert int(user.password_hash.split("$")[2]) == BCRYPT_ROUNDS
+    assert bcrypt.checkpw(b"old password", user.password_hash.encode())
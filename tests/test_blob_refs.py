@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select
+import blob_refs
+from blobstore import blob_store
+from database import SessionLocal
+from models import Blob, MedicalReport
+
+def _stale_blob() -> tuple[str, bytes]:
+    """A stored file old enough for the collector, with no row pointing at it"""
+    data = uuid.uuid4().bytes
+    key = blob_store.put(data)
+    os.utime(blob_store.local_path(key), (0, 0))
+    return key, data
+
+def _ref_count(key: str):
+    with SessionLocal() as db:
+        return db.scalar(select(Blob.ref_count).where(Blob.key == key))
+
+def test_collector_waits_for_an_upload_in_flight(schema):
+    key, data = _stale_blob()
+    result = []
+    with SessionLocal() as uploader:
+        blob_refs.acquire(uploader, key, len(data))
+        blob_store.put(data)
+        # A cutoff in the future makes the file's age no protection: only the lock is.
+        collector = threading.Thread(target=lambda: result.append(blob_refs._delete_if_unused(key, time.time() + 60)))
+        collector.start()
+        collector.join(0.5)
+        assert collector.is_alive()
+        uploader.commit()
+    collector.join(5)
+    assert result == [False]
+    assert blob_store.exists(key)
+    assert _ref_count(key) == 1
+
+def test_upload_waiting_on_a_deletion_writes_the_file_again(schema):
+    key, data = _stale_blob()
+    errors = []
+    def upload():
+        try:
+            with SessionLocal() as db:
+                blob_refs.acquire(db, key, len(data))
+                blob_store.put(data)
+                db.commit()
+        except Exception as e:
+            errors.append(e)
+    with SessionLocal() as collector:
+        blob_refs._lock(collector, key)
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        uploader.join(0.5)
+        assert uploader.is_alive()
+        blob_store.delete(key)
+        collector.commit()
+    uploader.join(5)
+    assert errors == []
+    assert blob_store.read(key) == data
+    assert _ref_count(key) == 1
+
+def test_collect_garbage_keeps_referenced_blobs(db, user):
+    released, _ = _stale_blob()
+    drifted, _ = _stale_blob()
+    long_ago = datetime.utcnow() - timedelta(seconds=blob_refs.BLOB_GC_GRACE_SECONDS + 60)
+    for key in (released, drifted):
+        db.add(Blob(key=key, size=16, ref_count=0, released_at=long_ago))
+    db.add(MedicalReport(id=uuid.uuid4(), patient_id=user.id, uploaded_by=user.id, title="t",
+                         report_type="other", blob_key=drifted))
+    db.commit()
+
+    blob_refs.collect_garbage()
+
+    assert not blob_store.exists(released)
+    assert _ref_count(released) is None
+    assert blob_store.exists(drifted)
+    assert _ref_count(drifted) == 1
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+from blobstore import LocalBlobStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _import_without_store_path(module: str) -> subprocess.CompletedProcess:
+    env = {k: v for k, v in os.environ.items() if k != "BLOB_STORE_PATH"}
+    return subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, env=env, capture_output=True, text=True)
+
+def test_refuses_to_start_without_blob_store_path():
+    result = _import_without_store_path("blobstore")
+    assert result.returncode != 0
+    assert "BLOB_STORE_PATH is not set" in result.stderr
+
+def test_migration_refuses_without_blob_store_path():
+    result = _import_without_store_path("migrate_report_blobs")
+    assert result.returncode != 0
+    assert "BLOB_STORE_PATH is not set" in result.stderr
+
+def test_local_store_dedupes_by_content(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    key = store.put(b"report")
+    assert store.put(b"report") == key
+    assert store.read(key) == b"report"
+    assert [k for k, _ in store.list_keys()] == [key]
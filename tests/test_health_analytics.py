@@ -0,0 +1,110 @@
+import random
+import uuid
+from datetime import date, datetime, timedelta
+import health_analytics
+from models import Appointment, DoctorPatientLink, HealthLog, HealthLogStats, Medication, User
+
+STAT_FIELDS = (
+    "log_count", "pain_sum", "pain_count", "mood_counts", "bleeding_counts", "period_days",
+    "cycle_starts", "pain_by_cycle_day", "avg_cycle_length", "last_cycle_start",
+)
+
+def test_incremental_stats_match_a_rebuild_from_scratch(client, db, user, auth_headers):
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=150)
+    ids = []
+    # Several requests, so later ones take the incremental path; dates arrive out of order
+    # so cycle starts move (backdated period logs).
+    for _ in range(6):
+        logs = [
+            {"user_id": str(user.id), "log_type": rng.choice(["period", "period", "symptom", "mood"]),
+             "pain_level": rng.randint(0, 10), "mood": rng.choice(["happy", "sad", "neutral"]),
+             "bleeding_level": rng.choice(["light", "heavy"]),
+             "log_date": (start + timedelta(days=rng.randint(0, 150))).isoformat()}
+            for _ in range(12)
+        ]
+        body = client.post("/health-logs/bulk", json={"logs": logs}, headers=auth_headers).json()
+        ids += [r["id"] for r in body["results"]]
+    for log_id in rng.sample(ids, 20):
+        change = {"log_type": rng.choice(["period", "symptom"]), "pain_level": rng.randint(0, 10), "mood": "calm"}
+        assert client.put(f"/health-logs/{log_id}", json=change).status_code == 200
+    for log_id in rng.sample(ids, 15):
+        assert client.delete(f"/health-logs/{log_id}").status_code == 200
+
+    incremental = db.get(HealthLogStats, user.id)
+    db.refresh(incremental)
+    rebuilt = HealthLogStats(user_id=user.id)
+    health_analytics._rebuild(db, rebuilt)
+
+    assert len(incremental.cycle_starts) > 2
+    for field in STAT_FIELDS:
+        assert getattr(incremental, field) == getattr(rebuilt, field), field
+
+def test_dashboard_keeps_its_sections_and_fills_them(client, db, user, auth_headers):
+    now = datetime.utcnow()
+    db.add_all([
+        Appointment(id=uuid.uuid4(), doctor_id=user.id, patient_id=user.id, appointment_date=now - timedelta(days=40)),
+        Appointment(id=uuid.uuid4(), doctor_id=user.id, patient_id=user.id, appointment_date=now + timedelta(days=5)),
+        Appointment(id=uuid.uuid4(), doctor_id=user.id, patient_id=user.id, appointment_date=now + timedelta(days=6),
+                    status="cancelled"),
+        Medication(id=uuid.uuid4(), patient_id=user.id, name="iron", active=True, end_date=date.today() + timedelta(days=3)),
+        Medication(id=uuid.uuid4(), patient_id=user.id, name="folate", active=True, end_date=date.today() + timedelta(days=60)),
+    ])
+    db.commit()
+    for metric in (
+        {"metric_type": "blood_pressure", "value": 150, "secondary_value": 95, "unit": "mmHg"},
+        {"metric_type": "heart_rate", "value": 72, "unit": "bpm"},
+        {"metric_type": "heart_rate", "value": 70, "unit": "bpm", "recorded_at": (now - timedelta(days=45)).isoformat()},
+    ):
+        assert client.post("/api/v1/analytics/health-metrics", json=metric, headers=auth_headers).status_code == 201
+    client.post("/health-logs", json={"user_id": str(user.id), "log_type": "period", "pain_level": 5})
+
+    response = client.get("/api/v1/analytics/dashboard", headers=auth_headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert {"overview", "vital_signs", "recent_insights", "upcoming", "statistics", "cycle", "symptoms"} <= set(body)
+    assert body["overview"]["overall_health_score"] == 50
+    assert body["overview"]["trend"] == "worsening"  # half abnormal this month, none the month before
+    assert body["overview"]["last_checkup"] == (now - timedelta(days=40)).date().isoformat()
+    assert body["overview"]["next_checkup"] == (now + timedelta(days=5)).date().isoformat()
+    assert body["vital_signs"]["blood_pressure"]["latest"] == "150/95 mmHg"
+    assert body["vital_signs"]["blood_pressure"]["status"] == "Abnormal"
+    assert body["vital_signs"]["heart_rate"]["latest"] == 72
+    assert body["vital_signs"]["weight"]["latest"] is None
+    assert [i["title"] for i in body["recent_insights"]] == ["Blood pressure out of normal range"]
+    assert body["upcoming"] == {"appointments": 1, "prescriptions_to_refill": 1, "health_alerts": 1}
+    assert body["statistics"]["metrics_tracked"] == 3
+    assert body["statistics"]["health_records"] == 1
+    assert body["symptoms"]["average_pain"] == 5
+
+def test_linking_a_shadow_user_carries_its_logs_into_the_stats(client, db, user, auth_headers):
+    today = date.today()
+    client.post("/health-logs", json={"user_id": str(user.id), "log_type": "period", "pain_level": 2,
+                                      "log_date": (today - timedelta(days=3)).isoformat()})
+    assert db.get(HealthLogStats, user.id) is not None
+
+    doctor = User(id=uuid.uuid4(), name="Doc", email=f"{uuid.uuid4().hex}@test.hercare", role="doctor")
+    shadow = User(id=uuid.uuid4(), name="Shadow", email=f"{uuid.uuid4().hex}@test.hercare", role="patient")
+    db.add_all([doctor, shadow])
+    db.flush()
+    code = uuid.uuid4().hex[:8]
+    db.add(DoctorPatientLink(id=uuid.uuid4(), doctor_id=doctor.id, patient_id=shadow.id, share_code=code))
+    for days_ago, pain in ((60, 7), (59, 6), (31, 5), (30, 4)):
+        db.add(HealthLog(id=uuid.uuid4(), user_id=shadow.id, log_type="period", title="Period",
+                         log_date=today - timedelta(days=days_ago), pain_level=pain))
+    db.flush()
+    health_analytics.stats_for(db, shadow.id)
+    shadow_id = shadow.id
+    db.commit()
+
+    assert client.post("/patients/link", params={"share_code": code}, headers=auth_headers).status_code == 200
+
+    db.expire_all()
+    linked = db.get(HealthLogStats, user.id)
+    rebuilt = HealthLogStats(user_id=user.id)
+    health_analytics._rebuild(db, rebuilt)
+    assert linked.log_count == 5 and len(linked.cycle_starts) == 3
+    for field in STAT_FIELDS:
+        assert getattr(linked, field) == getattr(rebuilt, field), field
+    assert db.get(HealthLogStats, shadow_id) is None
@@ -0,0 +1,65 @@
+import uuid
+from sqlalchemy import func, select
+from models import HealthLog
+
+def _log(user, **fields) -> dict:
+    return {"user_id": str(user.id), "log_type": "period", "pain_level": 3, **fields}
+
+def _count(db, user) -> int:
+    return db.scalar(select(func.count()).select_from(HealthLog).where(HealthLog.user_id == user.id))
+
+def test_bulk_reports_one_status_per_item_in_order(client, db, user, auth_headers):
+    logs = [
+        _log(user, client_key="a"),
+        _log(user, pain_level="severe"),
+        _log(user, user_id=str(uuid.uuid4())),
+        _log(user, client_key="a", notes="same key again"),
+        _log(user),
+    ]
+    response = client.post("/health-logs/bulk", json={"logs": logs}, headers=auth_headers)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["created", "invalid", "forbidden", "duplicate", "created"]
+    assert "pain_level" in body["results"][1]["error"]
+    assert body["results"][3]["id"] == body["results"][0]["id"]
+    assert (body["created"], body["duplicate"], body["invalid"], body["forbidden"]) == (2, 1, 1, 1)
+    assert _count(db, user) == 2
+
+def test_replayed_batch_returns_the_stored_ids(client, db, user, auth_headers):
+    logs = [_log(user, client_key=f"k{i}") for i in range(3)]
+    first = client.post("/health-logs/bulk", json={"logs": logs}, headers=auth_headers).json()
+    # One already stored, one new.
+    replay = client.post("/health-logs/bulk", json={"logs": logs[2:] + [_log(user, client_key="k3")]}, headers=auth_headers).json()
+
+    assert [r["status"] for r in replay["results"]] == ["duplicate", "created"]
+    assert replay["results"][0]["id"] == first["results"][2]["id"]
+    assert _count(db, user) == 4
+
+def test_bulk_rejects_oversized_batches(client, user, auth_headers, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "HEALTH_LOG_BULK_MAX", 2)
+    response = client.post("/health-logs/bulk", json={"logs": [_log(user)] * 3}, headers=auth_headers)
+    assert response.status_code == 413
+
+def test_unique_client_key_index_comes_from_hot_indexes():
+    from models import HOT_INDEXES
+    index = next(i for i in HOT_INDEXES if i.name == "ux_health_logs_user_client_key")
+    assert index.unique and [c.name for c in index.columns] == ["user_id", "client_key"]
+
+def test_missing_client_key_index_is_reported(schema):
+    import db_indexes
+    with schema.connect() as conn:
+        assert db_indexes.missing_required(conn) == []
+        conn.exec_driver_sql("ALTER INDEX ux_health_logs_user_client_key RENAME TO ux_health_logs_user_client_key_off")
+        assert db_indexes.missing_required(conn) == ["ux_health_logs_user_client_key"]
+        conn.rollback()
+
+def test_startup_refuses_to_run_without_a_required_index(schema, monkeypatch):
+    import pytest
+    import db_indexes
+    import main
+    main.check_required_indexes()
+    monkeypatch.setattr(db_indexes, "missing_required", lambda conn: ["ux_health_logs_user_client_key"])
+    with pytest.raises(RuntimeError, match="ux_health_logs_user_client_key"):
+        main.check_required_indexes()
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+import health_metrics
+from models import HealthMetricDaily, HealthMetricHourly, HealthMetricTotal
+
+def _rollups(db, model, user) -> list:
+    rows = db.execute(
+        select(model.metric_type, model.bucket_start, model.count, model.value_sum, model.value_min,
+               model.value_max, model.secondary_sum, model.secondary_count, model.abnormal_count)
+        .where(model.user_id == user.id)
+        .order_by(model.metric_type, model.bucket_start)
+    ).all()
+    return [tuple(row) for row in rows]
+
+def _record(client, headers, recorded_at: datetime, **metric):
+    body = {"unit": "mmHg", **metric, "recorded_at": recorded_at.isoformat()}
+    assert client.post("/api/v1/analytics/health-metrics", json=body, headers=headers).status_code == 201
+
+def test_readings_fold_into_hourly_and_daily_buckets(client, db, user, auth_headers):
+    day = (datetime.utcnow() - timedelta(days=3)).replace(hour=8, minute=0, second=0, microsecond=0)
+    for minutes, systolic, diastolic in ((5, 120, 80), (40, 150, 95), (70, 110, 70)):
+        _record(client, auth_headers, day + timedelta(minutes=minutes),
+                metric_type="blood_pressure", value=systolic, secondary_value=diastolic)
+
+    assert _rollups(db, HealthMetricHourly, user) == [
+        ("blood_pressure", day, 2, 270, 120, 150, 175, 2, 1),
+        ("blood_pressure", day + timedelta(hours=1), 1, 110, 110, 110, 70, 1, 0),
+    ]
+    assert _rollups(db, HealthMetricDaily, user) == [
+        ("blood_pressure", day.replace(hour=0), 3, 380, 110, 150, 245, 3, 1),
+    ]
+    assert _rollups(db, HealthMetricTotal, user) == [
+        ("blood_pressure", health_metrics.ALL_TIME, 3, 380, 110, 150, 245, 3, 1),
+    ]
+
+def test_incremental_rollups_match_a_rebuild(client, db, user, auth_headers):
+    start = datetime.utcnow() - timedelta(days=60)
+    for i in range(40):
+        _record(client, auth_headers, start + timedelta(hours=i * 37), metric_type="heart_rate",
+                value=60 + (i * 7) % 45, unit="bpm")
+    incremental = {model: _rollups(db, model, user) for model, _ in health_metrics.ROLLUPS}
+
+    health_metrics.rebuild_rollups()
+    db.expire_all()
+
+    for model, rows in incremental.items():
+        assert _rollups(db, model, user) == rows
+
+def test_history_reads_the_rollup_for_the_range(client, user, auth_headers):
+    now = datetime.utcnow()
+    for days_ago in (0.5, 10, 100):
+        _record(client, auth_headers, now - timedelta(days=days_ago), metric_type="weight", value=70 + days_ago / 100, unit="kg")
+
+    resolutions = {}
+    for days in (1, 30, 365):
+        body = client.get(f"/api/v1/analytics/health-metrics/weight?days={days}", headers=auth_headers).json()
+        resolutions[days] = (body["resolution"], body["statistics"]["count"])
+    assert resolutions == {1: ("raw", 1), 30: ("hour", 2), 365: ("day", 3)}
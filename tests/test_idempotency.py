@@ -0,0 +1,89 @@
+import uuid
+from sqlalchemy import func, select
+from models import HealthLog, IdempotencyKey
+
+def _post_log(client, user, headers, key, **fields):
+    body = {"user_id": str(user.id), "log_type": "period", **fields}
+    return client.post("/health-logs", json=body, headers={**headers, "Idempotency-Key": key})
+
+def _logs(db, user) -> int:
+    return db.scalar(select(func.count()).select_from(HealthLog).where(HealthLog.user_id == user.id))
+
+def test_retry_with_the_same_key_replays_the_first_response(client, db, user, auth_headers):
+    key = uuid.uuid4().hex
+    first = _post_log(client, user, auth_headers, key, pain_level=4)
+    retry = _post_log(client, user, auth_headers, key, pain_level=4)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers.get("idempotent-replayed") == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert retry.json() == first.json()
+    assert _logs(db, user) == 1
+
+def test_same_key_with_a_different_body_is_rejected(client, db, user, auth_headers):
+    key = uuid.uuid4().hex
+    assert _post_log(client, user, auth_headers, key, pain_level=4).status_code == 200
+    response = _post_log(client, user, auth_headers, key, pain_level=9)
+
+    assert response.status_code == 422
+    assert "different request" in response.json()["detail"]
+    assert _logs(db, user) == 1
+
+def test_requests_without_a_token_are_not_deduplicated(client, db, user):
+    key = uuid.uuid4().hex
+    first, second = _post_log(client, user, {}, key), _post_log(client, user, {}, key)
+    assert first.json()["id"] != second.json()["id"]
+    assert _logs(db, user) == 2
+
+def test_auth_routes_are_never_stored(client, db):
+    stored = db.scalar(select(func.count()).select_from(IdempotencyKey))
+    credentials = {"email": f"{uuid.uuid4().hex}@test.hercare", "password": "Secret123!"}
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    assert client.post("/api/v1/auth/register", json=credentials, headers=headers).status_code == 201
+    login = client.post("/api/v1/auth/login", json=credentials, headers=headers)
+
+    assert login.status_code == 200 and "idempotent-replayed" not in login.headers
+    assert db.scalar(select(func.count()).select_from(IdempotencyKey)) == stored
+
+def _upload(client, user, headers, key, content: bytes):
+    return client.post(
+        "/reports/upload",
+        data={"patient_id": str(user.id), "title": "Scan", "report_type": "other"},
+        files={"file": ("scan.pdf", content, "application/pdf")},
+        headers={**headers, "Idempotency-Key": key},
+    )
+
+def test_upload_retry_replays_but_a_different_file_is_rejected(client, user, auth_headers):
+    key = uuid.uuid4().hex
+    first = _upload(client, user, auth_headers, key, b"%PDF first report")
+    retry = _upload(client, user, auth_headers, key, b"%PDF first report")  # fresh multipart boundary
+    other = _upload(client, user, auth_headers, key, b"%PDF another report")
+
+    assert first.status_code == 200 and retry.headers.get("idempotent-replayed") == "true"
+    assert retry.json() == first.json()
+    assert other.status_code == 422
+
+def test_body_digest_ignores_the_boundary_wherever_chunks_split():
+    from idempotency import _BodyDigest
+
+    def digest(boundary: bytes, body: bytes, size: int) -> str:
+        d = _BodyDigest(f"multipart/form-data; boundary={boundary.decode()}")
+        for i in range(0, len(body), size):
+            d.update(body[i:i + size])
+        return d.hexdigest()
+
+    def body(boundary: bytes) -> bytes:
+        return b"--" + boundary + b"\r\nfile bytes\r\n--" + boundary + b"--\r\n"
+
+    expected = digest(b"aaaaaaaa", body(b"aaaaaaaa"), 1024)
+    assert all(digest(b"bbbbbbbb", body(b"bbbbbbbb"), size) == expected for size in (1, 3, 7, 64))
+
+def test_polling_a_pending_key_sees_it_complete(schema):
+    from idempotency import complete, poll, reserve
+    key = uuid.uuid4().hex
+    assert reserve(key, "f") == ("new", None)
+    assert poll(key, "f") == ("pending", None)
+    assert poll(key, "other")[0] == "mismatch"
+    complete(key, 201, [], b"{}")
+    state, row = poll(key, "f")
+    assert state == "done" and row.status_code == 201
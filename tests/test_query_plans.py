@@ -0,0 +1,6 @@
+import verify_query_plans
+
+def test_check_fails_exactly_the_queries_whose_index_is_dropped(schema):
+    # The other hot queries must still pass with seqscans enabled and production-sized tables.
+    failures = verify_query_plans.verify(drop=("ix_consultations_patient_visit_date", "ix_medical_reports_patient_created"))
+    assert failures == ["reports by patient, newest first", "consultations by patient"]
@@ -0,0 +1,159 @@
+# ════════════════════════════════════
+# Report thumbnails (background pipeline)
+# ════════════════════════════════════
+
+from blobstore import blob_store
+from typing import Optional
+import io
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails for images are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger("hercare.thumbnails")
+
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_QUEUE_SIZE = int(os.getenv("THUMBNAIL_QUEUE_SIZE", "1000"))
+THUMBNAIL_KIND = f"thumb-{THUMBNAIL_SIZE}.jpg"
+PDFTOPPM = shutil.which("pdftoppm")  # poppler-utils; PDFs are skipped without it
+
+_MAGIC = (
+    (b"%PDF-", "pdf"),
+    (b"\xff\xd8\xff", "image"),
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"GIF8", "image"),
+)
+
+def _sniff(key: str) -> Optional[str]:
+    try:
+        with blob_store.open(key) as f:
+            head = f.read(12)
+    except FileNotFoundError:
+        return None
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image"
+    return next((kind for magic, kind in _MAGIC if head.startswith(magic)), None)
+
+def source_kind(key: str, content_type: Optional[str]) -> Optional[str]:
+    """"image", "pdf" or None, from the stored content type or the file's magic bytes"""
+    if not content_type:
+        kind = _sniff(key)
+    elif content_type.startswith("image/"):
+        kind = "image"
+    elif content_type == "application/pdf":
+        kind = "pdf"
+    else:
+        kind = None
+    available = {"image": Image is not None, "pdf": PDFTOPPM is not None}
+    return kind if kind and available[kind] else None
+
+def _render_image(key: str) -> bytes:
+    with blob_store.open(key) as f:
+        image = Image.open(f)
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))  # JPEG: decode at reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        out = io.BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+def _render_pdf(key: str) -> bytes:
+    with tempfile.TemporaryDirectory() as tmp:
+        source = blob_store.local_path(key)
+        if source is None:
+            source = os.path.join(tmp, "source.pdf")
+            with blob_store.open(key) as src, open(source, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        prefix = os.path.join(tmp, "page")
+        subprocess.run(
+            [PDFTOPPM, "-jpeg", "-f", "1", "-l", "1", "-scale-to", str(THUMBNAIL_SIZE), "-singlefile", source, prefix],
+            check=True, capture_output=True, timeout=60,
+        )
+        with open(prefix + ".jpg", "rb") as f:
+            return f.read()
+
+def render_thumbnail(key: str, kind: str) -> bytes:
+    return _render_pdf(key) if kind == "pdf" else _render_image(key)
+
+class ThumbnailWorker:
+    """
+    Bounded queue of blob keys rendered by one background thread.
+
+    Thumbnails are derived from content, so a key is rendered once no matter
+    how many reports share it. A full queue drops the request; the
+    thumbnail endpoint re-queues on the next miss.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=THUMBNAIL_QUEUE_SIZE)
+        self._pending = set()
+        self._failed_keys = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.generated = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="thumbnails", daemon=True)
+            self._thread.start()
+
+    def has_failed(self, key: str) -> bool:
+        return key in self._failed_keys
+
+    def submit(self, key: str, content_type: Optional[str] = None) -> bool:
+        """Queue `key` for rendering unless it is already queued; never blocks"""
+        self._ensure_started()
+        with self._lock:
+            if key in self._pending or key in self._failed_keys:
+                return True
+            try:
+                self._queue.put_nowait((key, content_type))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._pending.add(key)
+        return True
+
+    def _run(self):
+        while True:
+            key, content_type = self._queue.get()
+            try:
+                if blob_store.derived_path(key, THUMBNAIL_KIND) is None:
+                    kind = source_kind(key, content_type)
+                    if kind:
+                        blob_store.put_derived(key, THUMBNAIL_KIND, render_thumbnail(key, kind))
+                        self.generated += 1
+            except Exception as e:
+                self.failed += 1
+                if len(self._failed_keys) > 10000:
+                    self._failed_keys.clear()
+                self._failed_keys.add(key)
+                logger.warning("thumbnail for blob %s failed: %s", key, e)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": THUMBNAIL_QUEUE_SIZE,
+            "generated": self.generated,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "images": Image is not None,
+            "pdfs": PDFTOPPM is not None,
+        }
+
+thumbnail_worker = ThumbnailWorker()
@@ -0,0 +1,121 @@
+# ════════════════════════════════════
+# Streaming multipart uploads into the blob store
+# ════════════════════════════════════
+
+from fastapi import HTTPException, Request
+from blobstore import BlobStore, BlobWriter
+from typing import Optional
+import asyncio
+import os
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+MAX_FIELD_BYTES = 64 * 1024
+
+class MultipartUpload:
+    """
+    Result of receive_upload(): the text form fields plus at most one file
+    part, already streamed into an uncommitted BlobWriter. The caller
+    commits the writer once the request is authorized, or aborts it.
+    """
+
+    def __init__(self, store: BlobStore, boundary: bytes, max_bytes: int):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.fields: dict[str, str] = {}
+        self.writer: Optional[BlobWriter] = None
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = None
+        self._value: Optional[bytearray] = None
+        self._in_file = False
+        self.parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._in_file = False
+        self._value = None
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode()
+        filename = options.get(b"filename")
+        if filename is None:
+            self._value = bytearray()
+            return
+        if self.writer is not None:
+            raise HTTPException(status_code=400, detail="Only one file per upload")
+        self.writer = self.store.writer()
+        self.filename = os.path.basename(filename.decode(errors="replace")) or None
+        self.content_type = self._headers.get(b"content-type", b"").decode() or None
+        self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            if self.writer.size + (end - start) > self.max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds {self.max_bytes} bytes")
+            self.writer.write(data[start:end])
+        else:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Form field {self._name} is too large")
+
+    def _on_part_end(self):
+        if not self._in_file:
+            self.fields[self._name] = self._value.decode(errors="replace")
+        self._in_file = False
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+
+async def receive_upload(request: Request, store: BlobStore, max_bytes: int = MAX_UPLOAD_BYTES) -> MultipartUpload:
+    """
+    Parse a multipart/form-data body chunk by chunk as it arrives. File bytes
+    go straight to the blob store (hashed and counted on the way), so the
+    worker never holds more than one network chunk of the file.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MAX_FIELD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+
+    upload = MultipartUpload(store, boundary, max_bytes)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await asyncio.to_thread(upload.parser.write, chunk)
+        upload.parser.finalize()
+    except BaseException:
+        upload.abort()
+        raise
+    return upload
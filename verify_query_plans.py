@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check for hot lookups
+
+Builds the full schema in a throwaway Postgres schema on DATABASE_URL,
+seeds it with production-sized row counts, runs ANALYZE and EXPLAINs every
+db_indexes.HOT_QUERIES entry with the planner's default settings. Exits 1
+if a plan does not use the index the query is listed with, e.g. because
+that index was dropped or a narrower one wins. Everything runs in a single
+transaction that is rolled back, so the scratch schema disappears and
+existing tables are never touched.
+
+Run: DATABASE_URL=postgresql://localhost/hercare_dev python verify_query_plans.py
+"""
+
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+from database import engine
+from models import (
+    Base, User, DoctorPatientLink, HealthLog, MedicalReport, EmergencyRequest, Medication, Consultation,
+)
+from db_indexes import HOT_QUERIES
+from pagination import ExplainJSON
+import os
+import random
+import sys
+import uuid
+
+SCHEMA = f"plan_check_{os.getpid()}"
+PATIENTS, DOCTORS, DAYS = 2000, 100, 120
+
+def seed(conn) -> dict:
+    """Roughly production-shaped data: many patients, a few hundred rows each"""
+    rng = random.Random(42)
+    today = date.today()
+    patients = [uuid.uuid4() for _ in range(PATIENTS)]
+    doctors = [uuid.uuid4() for _ in range(DOCTORS)]
+    conn.execute(User.__table__.insert(), [
+        {"id": uid, "name": f"user-{i}", "email": f"user-{i}@plan.check", "role": role}
+        for i, (uid, role) in enumerate([(p, "patient") for p in patients] + [(d, "doctor") for d in doctors])
+    ])
+    conn.execute(DoctorPatientLink.__table__.insert(), [
+        {"id": uuid.uuid4(), "doctor_id": rng.choice(doctors), "patient_id": p, "permissions": {}}
+        for p in patients for _ in range(2)
+    ])
+    logs = [
+        {"id": uuid.uuid4(), "user_id": p, "log_type": "period", "title": "log",
+         "log_date": today - timedelta(days=d), "created_at": datetime.utcnow(), "pain_level": rng.randint(0, 10)}
+        for p in patients for d in range(DAYS)
+    ]
+    conn.execute(HealthLog.__table__.insert(), logs)
+    conn.execute(MedicalReport.__table__.insert(), [
+        {"id": uuid.uuid4(), "patient_id": p, "uploaded_by": p, "title": "report", "report_type": "other",
+         "created_at": datetime.utcnow() - timedelta(days=rng.randint(0, 365))}
+        for p in patients for _ in range(30)
+    ])
+    conn.execute(Medication.__table__.insert(), [
+        {"id": uuid.uuid4(), "patient_id": p, "name": "med", "active": rng.random() < 0.3}
+        for p in patients for _ in range(5)
+    ])
+    conn.execute(EmergencyRequest.__table__.insert(), [
+        {"id": uuid.uuid4(), "patient_id": p, "message": "help",
+         "status": "pending" if rng.random() < 0.02 else "resolved",
+         "created_at": datetime.utcnow() - timedelta(hours=rng.randint(0, 5000))}
+        for p in patients for _ in range(5)
+    ])
+    conn.execute(Consultation.__table__.insert(), [
+        {"id": uuid.uuid4(), "doctor_id": rng.choice(doctors), "patient_id": p,
+         "visit_date": today - timedelta(days=rng.randint(0, 365))}
+        for p in patients for _ in range(24)
+    ])
+    sample = logs[len(logs) // 2]
+    return {"doctor": doctors[0], "patient": sample["user_id"], "log": sample["id"], "day": sample["log_date"]}
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+def verify(drop: tuple = ()) -> list:
+    """Names of the hot queries whose plan misses their index; `drop` removes indexes first"""
+    failures = []
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        try:
+            conn.execute(text(f"SET search_path TO {SCHEMA}"))
+            Base.metadata.create_all(conn)
+            for name in drop:
+                conn.execute(text(f"DROP INDEX {name}"))
+            print("🌱 Seeding...")
+            ids = seed(conn)
+            for table in ("users", "doctor_patient_links", "health_logs", "medical_reports",
+                          "medications", "emergency_requests", "consultations"):
+                conn.execute(text(f"ANALYZE {table}"))
+
+            for name, (expected, build) in HOT_QUERIES.items():
+                plan = conn.execute(ExplainJSON(build(ids))).scalar()
+                nodes = list(plan_nodes(plan[0]["Plan"]))
+                indexes = sorted({n["Index Name"] for n in nodes if "Index Name" in n})
+                seq_scans = [n.get("Relation Name") for n in nodes if n["Node Type"] == "Seq Scan"]
+                used = ", ".join(indexes + [f"Seq Scan on {t}" for t in seq_scans]) or "no scan"
+                if expected in indexes:
+                    print(f"  ✓ {name}: {used}")
+                else:
+                    failures.append(name)
+                    print(f"  ✗ {name}: expected {expected}, plan uses {used}")
+        finally:
+            conn.rollback()
+    return failures
+
+def main() -> int:
+    if engine.dialect.name != "postgresql":
+        print("DATABASE_URL must point at Postgres.")
+        return 2
+    failures = verify()
+    if failures:
+        print(f"\n❌ {len(failures)} hot queries do not use their index.")
+        return 1
+    print(f"\n✅ All {len(HOT_QUERIES)} hot queries use their index.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())